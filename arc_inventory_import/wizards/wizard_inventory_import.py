@@ -3,15 +3,24 @@ import logging
 import base64
 import pytz
 
-from io import BytesIO
 from datetime import datetime
-from openpyxl import load_workbook
 
 from odoo import models, fields, api, _
-from odoo.tools import ustr, DEFAULT_SERVER_DATE_FORMAT, DEFAULT_SERVER_DATETIME_FORMAT
+from odoo.tools import ustr
+
+from odoo.addons.arc_product_import.wizard.file_reader import Column, iter_typed_rows, read_rows
 
 _logger = logging.getLogger(__name__)
 
+INVENTORY_COLUMNS = [
+    Column('name', 'Nombre'),
+    Column('product_qty', 'Cantidad', int, default=1),
+    Column('lot_id', 'Serie'),
+    Column('default_code', 'Código'),
+    Column('minicode', 'Minicodigo', int),
+    Column('barcode', 'Código de barra'),
+]
+
 
 class WizardInventoryImport(models.TransientModel):
     _name = 'wizard.inventory.import'
@@ -52,7 +61,7 @@ class WizardInventoryImport(models.TransientModel):
         ('barcode', 'Código de barra'),
         ('code', 'Código de producto'),
         ('minicode', 'Minicodigo')], string='Importar productos por', default='code')
-    import_option = fields.Selection([('xls', 'Excel')], string='Tipo de archivo', default='xls')
+    import_option = fields.Selection([('xls', 'Excel'), ('csv', 'CSV/TSV')], string='Tipo de archivo', default='xls')
     serial_lot = fields.Boolean(string="Crear número de serie si no existe", default=True)
 
     def show_success_msg(self, counter, skipped_line_no):
@@ -75,52 +84,11 @@ class WizardInventoryImport(models.TransientModel):
             "context": context,
         }
     
-    def read_xls(self):
-        decoded_file = base64.decodebytes(self.file)
-        excel_file = BytesIO(decoded_file)
-        workbook = load_workbook(excel_file)
+    def read_file(self):
+        """Filas crudas del archivo: XLSX con openpyxl, o CSV/TSV leído en
+        streaming con detección de separador y codificación."""
+        return read_rows(base64.decodebytes(self.file))
 
-        sheet = workbook.active
-        values_sheet = []
-        
-        for rowx, row in enumerate(sheet.iter_rows(values_only=False), 1):
-            values = []
-            for colx, cell in enumerate(row, 1):
-                if cell.value is None:
-                    values.append("")
-                elif cell.data_type == 'n':  # Número
-                    is_float = cell.value % 1 != 0.0 if cell.value is not None else False
-                    values.append(
-                        str(cell.value)
-                        if is_float
-                        else str(int(cell.value))
-                    )
-                elif cell.is_date:  # Fechas
-                    dt = cell.value
-                    if isinstance(dt, datetime.datetime):
-                        is_datetime = dt.time() != datetime.time(0, 0, 0)
-                        values.append(
-                            dt.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
-                            if is_datetime
-                            else dt.strftime(DEFAULT_SERVER_DATE_FORMAT)
-                        )
-                    else:
-                        values.append(str(cell.value))
-                elif cell.data_type == 'b':  # Booleano
-                    values.append(u'True' if cell.value else u'False')
-                elif cell.data_type == 'e':  # Error en la celda
-                    raise ValueError(
-                        _("Valor de celda no válido en la fila %(row)s, columna %(col)s: %(cell_value)s") % {
-                            'row': rowx,
-                            'col': colx,
-                            'cell_value': cell.value
-                        }
-                    )
-                else:  # Texto u otro tipo de datos
-                    values.append(cell.value if cell.value is not None else "")
-            values_sheet.append(values)
-        return values_sheet
-       
     def import_stock_inventory_line(self, values, inventory):
         location_ids = inventory.location_ids.mapped("id")
         company = inventory.company_id
@@ -130,31 +98,31 @@ class WizardInventoryImport(models.TransientModel):
         product_product = self.env['product.product']
         field_search = ""
         if self.product_type == 'minicode':
-            product_id = product_product.search([('minicode', '=', values.get('minicode'))], limit=1)
+            product_id = product_product.search([('minicode', '=', values.minicode)], limit=1)
             field_search = "Minicodigo"
-            field_search_value = values.get('minicode')
+            field_search_value = values.minicode
         elif self.product_type == 'code':
-            product_id = product_product.search([('default_code', '=', values.get('default_code'))], limit=1)
+            product_id = product_product.search([('default_code', '=', values.default_code)], limit=1)
             field_search = "Código"
-            field_search_value = values.get('default_code')
+            field_search_value = values.default_code
         elif self.product_type == 'name':
-            product_id = product_product.search([('name', 'ilike', values.get('name'))], limit=1)
+            product_id = product_product.search([('name', 'ilike', values.name)], limit=1)
             field_search = "Nombre"
-            field_search_value = values.get('name')
+            field_search_value = values.name
         elif self.product_type == 'barcode':
-            product_id = product_product.search([('barcode', '=', values.get('barcode'))], limit=1)
+            product_id = product_product.search([('barcode', '=', values.barcode)], limit=1)
             field_search = "Código de barra"
-            field_search_value = values.get('barcode')
+            field_search_value = values.barcode
                 
         vals = {}
         message = ""
         
         if product_id:
             if self.serial_lot and product_id.tracking == 'serial':
-                serial_number = values.get('lot_id')
-                if serial_number not in (None, ""):
+                serial_number = values.lot_id
+                if serial_number:
                     lot_id = self.env['stock.lot'].search([
-                        ('name', '=', serial_number.strip()),
+                        ('name', '=', serial_number),
                         ('product_id', '=', product_id.id),
                         ('company_id', '=', company.id),
                         ('location_id', '=', location_ids[0])
@@ -176,9 +144,7 @@ class WizardInventoryImport(models.TransientModel):
                     else:
                         vals.update({'lot_id': lot_id.id})
 
-            quantity = 1
-            if values.get('product_qty') not in (None, ""):
-                quantity = int(values.get('product_qty').strip())
+            quantity = values.product_qty
             
             vals.update({
                 'product_id': product_id.id,
@@ -218,34 +184,16 @@ class WizardInventoryImport(models.TransientModel):
         _logger.info("========== action_import ==========")
         inventory_id = self.env[self.res_model].browse(self.res_id)
                 
-        counter = 1
+        row_count = 0
         message = ""
         skipped_line_no = {}
-        if self.import_option == 'xls':
-            rows = self.read_xls()
-            values = {}
-            skip_header = True
-            
-            for row in rows:
-                if skip_header:
-                    skip_header = False
-                    counter += 1
-                    continue
-                                
-                values.update({
-                    'name': row[0],
-                    'product_qty': row[1],
-                    'lot_id': row[2],
-                    'default_code': row[3],
-                    'minicode': row[4],
-                    'barcode': row[5],
-                })
-
-                result = self.import_stock_inventory_line(values, inventory_id)
-                if not result:
-                    skipped_line_no[counter] = result
-                counter = counter + 1
-            if counter > 1:
-                completed_records = (counter - len(skipped_line_no)) - 2
+        if self.import_option in ('xls', 'csv'):
+            for counter, values, error in iter_typed_rows(self.read_file(), INVENTORY_COLUMNS, 'InventoryRow'):
+                row_count += 1
+                result = error or self.import_stock_inventory_line(values, inventory_id)
+                if result is not True:
+                    skipped_line_no[str(counter)] = " - %s" % result
+            if row_count:
+                completed_records = row_count - len(skipped_line_no)
                 message = self.show_success_msg(completed_records, skipped_line_no)
         return message
@@ -1,20 +1,23 @@
 # -*- coding: utf-8 -*-
 
 import base64
-import csv
-import io
 import logging
 
-from io import BytesIO
-from datetime import datetime
-from openpyxl import load_workbook
-
-from odoo import models, fields, api, _
+from odoo import models, fields, _
 from odoo.exceptions import UserError, ValidationError
-from odoo.tools import ustr, DEFAULT_SERVER_DATE_FORMAT, DEFAULT_SERVER_DATETIME_FORMAT
+from odoo.tools import ustr
+
+from odoo.addons.arc_product_import.wizard.file_reader import Column, iter_typed_rows, read_rows
 
 _logger = logging.getLogger(__name__)
 
+INVENTORY_VARIANT_COLUMNS = [
+    Column('product_name', 'Descripción', required=True),
+    Column('attribute_name', 'Atributo', required=True, index=6),
+    Column('attribute_value', 'Valor', required=True, index=7),
+    Column('quantity', 'Cantidad', float, required=True, index=9),
+]
+
 
 class WizardInventoryVariantsImport(models.TransientModel):
     _name = 'wizard.inventory.variants.import'
@@ -23,7 +26,8 @@ class WizardInventoryVariantsImport(models.TransientModel):
     file_data = fields.Binary(
         string='Archivo',
         required=True,
-        help="Archivo CSV con los datos de inventario. Columnas esperadas: Descripcion, Atributos, Valor de atributos, Cantidad"
+        help="Archivo Excel o CSV/TSV (separador y codificación se detectan) con los datos de inventario. "
+             "Columnas esperadas: Descripcion, Atributos, Valor de atributos, Cantidad"
     )
     location_id = fields.Many2one(
         'stock.location',
@@ -53,51 +57,10 @@ class WizardInventoryVariantsImport(models.TransientModel):
             "context": context,
         }
     
-    def read_xls(self):
-        decoded_file = base64.decodebytes(self.file_data)
-        excel_file = BytesIO(decoded_file)
-        workbook = load_workbook(excel_file)
-
-        sheet = workbook.active
-        values_sheet = []
-
-        for rowx, row in enumerate(sheet.iter_rows(values_only=False), 1):
-            values = []
-            for colx, cell in enumerate(row, 1):
-                if cell.value is None:
-                    values.append("")
-                elif cell.data_type == 'n':  # Número
-                    is_float = cell.value % 1 != 0.0 if cell.value is not None else False
-                    values.append(
-                        str(cell.value)
-                        if is_float
-                        else str(int(cell.value))
-                    )
-                elif cell.is_date:  # Fechas
-                    dt = cell.value
-                    if isinstance(dt, datetime.datetime):
-                        is_datetime = dt.time() != datetime.time(0, 0, 0)
-                        values.append(
-                            dt.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
-                            if is_datetime
-                            else dt.strftime(DEFAULT_SERVER_DATE_FORMAT)
-                        )
-                    else:
-                        values.append(str(cell.value))
-                elif cell.data_type == 'b':  # Booleano
-                    values.append(u'True' if cell.value else u'False')
-                elif cell.data_type == 'e':  # Error en la celda
-                    raise ValueError(
-                        _("Valor de celda no válido en la fila %(row)s, columna %(col)s: %(cell_value)s") % {
-                            'row': rowx,
-                            'col': colx,
-                            'cell_value': cell.value
-                        }
-                    )
-                else:  # Texto u otro tipo de datos
-                    values.append(cell.value if cell.value is not None else "")
-            values_sheet.append(values)
-        return values_sheet
+    def read_file(self):
+        """Filas crudas del archivo: XLSX con openpyxl, o CSV/TSV leído en
+        streaming con detección de separador y codificación."""
+        return read_rows(base64.decodebytes(self.file_data))
 
     def _find_product_variant(self, product_name, attribute_name, attribute_value_name):
         """
@@ -145,51 +108,32 @@ class WizardInventoryVariantsImport(models.TransientModel):
             raise UserError(_("Por favor, suba un archivo para procesar."))
 
         try:
-            skip_header = True
-            counter = 1
-            skipped_line_no = {}
-            values = self.read_xls()
             errors = []
-            
-            for row in values:
-                if skip_header:
-                    skip_header = False
-                    counter = counter + 1
+
+            for counter, row, error in iter_typed_rows(self.read_file(), INVENTORY_VARIANT_COLUMNS, 'InventoryVariantRow'):
+                if error:
+                    errors.append(f"Fila {counter}: {error}")
+                    continue
+                product_name = row.product_name
+                attribute_name = row.attribute_name
+                attribute_value = row.attribute_value
+                quantity = row.quantity
+
+                # --- Lógica para encontrar la variante de producto ---
+                product_variant = self._find_product_variant(product_name, attribute_name, attribute_value)
+
+                if not product_variant:
+                    errors.append(f"Fila {counter}: No se encontró la variante para '{product_name}' con {attribute_name}='{attribute_value}'.")
                     continue
                 
-                if row[0] in (None, ""):
-                    skipped_line_no[str(counter)] = " - Descripción esta vacio. "
-                    counter = counter + 1
-                else:
-                    product_name = str(row[0]).strip()
-                    attribute_name = str(row[6]).strip()
-                    attribute_value = str(row[7]).strip()
-                    
-                    try:
-                        quantity = float(row[9].strip())
-                    except (ValueError, IndexError):
-                        errors.append(f"Fila {counter}: Cantidad '{row[9]}' no válida para '{product_name}'.")
-                        continue
-
-                    if not all([product_name, attribute_name, attribute_value]):
-                        errors.append(f"Fila {counter}: Faltan datos clave (Descripción, Atributo o Valor).")
-                        continue
-
-                    # --- Lógica para encontrar la variante de producto ---
-                    product_variant = self._find_product_variant(product_name, attribute_name, attribute_value)
-
-                    if not product_variant:
-                        errors.append(f"Fila {counter}: No se encontró la variante para '{product_name}' con {attribute_name}='{attribute_value}'.")
-                        continue
-                    
-                    # --- Actualizar inventario usando stock.quant ---
-                    # Este método actualiza la cantidad o crea un nuevo quant si no existe.
-                    self.env['stock.quant'].with_context(inventory_mode=True).create({
-                        'product_id': product_variant.id,
-                        'location_id': self.location_id.id,
-                        'quantity': quantity,
-                    })
-                    _logger.info(f"Inventario actualizado para {product_variant.display_name}: {quantity} en {self.location_id.display_name}")
+                # --- Actualizar inventario usando stock.quant ---
+                # Este método actualiza la cantidad o crea un nuevo quant si no existe.
+                self.env['stock.quant'].with_context(inventory_mode=True).create({
+                    'product_id': product_variant.id,
+                    'location_id': self.location_id.id,
+                    'quantity': quantity,
+                })
+                _logger.info(f"Inventario actualizado para {product_variant.display_name}: {quantity} en {self.location_id.display_name}")
 
             if errors:
                 error_message = "\n".join(errors)
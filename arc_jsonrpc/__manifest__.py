@@ -17,6 +17,8 @@
         'security/ir.model.access.csv',
         'wizard/sync_data_view.xml',
         'views/json_rpc_view.xml',
+        'views/json_rpc_plan_view.xml',
+        'data/ir_cron.xml',
     ],
     'license': 'LGPL-3',
     'sequence': 1,
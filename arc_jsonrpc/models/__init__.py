@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from . import json_rpc
+from . import json_rpc_plan
 from . import res_partner
 from . import product_product
 from . import account_move
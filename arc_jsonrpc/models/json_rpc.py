@@ -1,9 +1,24 @@
 # -*- coding: utf-8 -*-
+import gzip
+import hashlib
+import io
+import json
+import math
+import threading
+import time
+
+from datetime import datetime, timedelta
+import urllib.parse
+import urllib.request
 import odoorpc
+import psycopg2
+import pytz
+import requests
 
 from odoorpc.error import RPCError
 
 from odoo import models, fields
+from odoo.exceptions import ValidationError
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -14,6 +29,632 @@ VERSION_ODOO = [
     ('13.0', '13.0')
 ]
 
+TRANSPORT = [
+    ('urllib', 'Estándar'),
+    ('keepalive', 'Persistente comprimido'),
+]
+STREAM_CHUNK_SIZE = 64 * 1024
+# Líneas por miembro gzip del snapshot
+SNAPSHOT_CHUNK_SIZE = 500
+
+WEEKDAYS = [
+    ('0', 'Lunes'),
+    ('1', 'Martes'),
+    ('2', 'Miércoles'),
+    ('3', 'Jueves'),
+    ('4', 'Viernes'),
+    ('5', 'Sábado'),
+    ('6', 'Domingo'),
+]
+
+# Medición de la conexión: modelos representativos (modelo remoto, campos
+# candidatos, versiones; se leen solo los campos que existen en el servidor)
+BENCHMARK_MODELS = [
+    ('account.invoice', ['move_name', 'comprobante_xml', 'comprobante_cdr'], ['11.0', '12.0']),
+    ('account.move', ['name', 'comprobante_xml', 'comprobante_cdr'], ['13.0']),
+    ('product.template', ['name', 'list_price', 'image_1920', 'image'], ['11.0', '12.0', '13.0']),
+]
+BENCHMARK_BATCH_SIZES = [10, 50, 200]
+BENCHMARK_PINGS = 20
+# Un bloque recomendado debe leerse en este tiempo y sin superar estos bytes
+BENCHMARK_TARGET_SECONDS = 30
+BENCHMARK_MAX_BYTES = 64 * 1024 * 1024
+BENCHMARK_MIN_SIZE = 5
+BENCHMARK_MAX_SIZE = 1000
+
+
+def percentile(values, percent):
+    """Percentil por rango más cercano."""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[max(int(math.ceil(percent / 100.0 * len(values))) - 1, 0)]
+
+
+def recommend_batch_size(samples):
+    """Tamaño de bloque cuya lectura tome BENCHMARK_TARGET_SECONDS sin superar
+    BENCHMARK_MAX_BYTES. samples es [(registros, segundos, bytes)]: el costo
+    por registro es la pendiente entre la muestra menor y la mayor, y lo que
+    sobra de la menor es el costo fijo por llamada."""
+    samples = sorted(sample for sample in samples if sample[0])
+    if not samples:
+        return 0
+    small, large = samples[0], samples[-1]
+    per_record = large[1] / large[0]
+    if large[0] > small[0] and large[1] > small[1]:
+        per_record = (large[1] - small[1]) / (large[0] - small[0])
+    overhead = max(small[1] - per_record * small[0], 0)
+    size = BENCHMARK_MAX_SIZE
+    if per_record:
+        size = (BENCHMARK_TARGET_SECONDS - overhead) / per_record
+    bytes_per_record = large[2] / large[0]
+    if bytes_per_record:
+        size = min(size, BENCHMARK_MAX_BYTES / bytes_per_record)
+    size = min(max(int(size), BENCHMARK_MIN_SIZE), BENCHMARK_MAX_SIZE)
+    return size - size % BENCHMARK_MIN_SIZE
+
+
+def is_changed(record, field_name, value):
+    """Compara un valor de write() con el valor actual del registro según el
+    tipo de campo. many2one acepta id o recordset; x2many acepta recordset,
+    lista de ids o [(6, 0, ids)], cualquier otro comando cuenta como cambio."""
+    field = record._fields[field_name]
+    current = record[field_name]
+    if field.type == 'many2one':
+        if isinstance(value, models.BaseModel):
+            value = value.id
+        return current.id != (value or False)
+    if field.type in ('one2many', 'many2many'):
+        if isinstance(value, models.BaseModel):
+            ids = value.ids
+        elif all(isinstance(item, int) for item in value or []):
+            ids = value or []
+        elif len(value) == 1 and value[0][0] == 6:
+            ids = value[0][2]
+        else:
+            return True
+        return set(current.ids) != set(ids)
+    return field.convert_to_cache(current, record, validate=False) != \
+        field.convert_to_cache(value, record, validate=False)
+
+
+class TransferStats(object):
+    """Acumula, para una ejecución, los bytes recibidos en la red y los bytes
+    ya descomprimidos. Es compartido por las sesiones de todos los hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def add(self, wire_bytes, decoded_bytes):
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += wire_bytes
+            self.decoded_bytes += decoded_bytes
+
+
+class StreamedResponse(io.RawIOBase):
+    """Cuerpo de la respuesta que se descomprime a medida que odoorpc lo lee,
+    sin guardar antes la copia comprimida completa. Con limitador, cada
+    bloque leído de la red espera según los bytes comprimidos recibidos."""
+
+    def __init__(self, response, stats=None, limiter=None):
+        self._response = response
+        self._chunks = response.raw.stream(STREAM_CHUNK_SIZE, decode_content=True)
+        self._buffer = b''
+        self._decoded = 0
+        self._wire = 0
+        self._stats = stats
+        self._limiter = limiter
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            self._buffer = next(self._chunks, b'')
+            if self._limiter is not None:
+                wire = self._response.raw.tell()
+                self._limiter.throttle(wire - self._wire)
+                self._wire = wire
+            if not self._buffer:
+                self._finish()
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self._decoded += size
+        return size
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        if self._stats is not None:
+            self._stats.add(self._response.raw.tell(), self._decoded)
+        self._response.close()
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class CountedResponse(io.RawIOBase):
+    """Cuerpo de una respuesta sin comprimir (transporte estándar) que cuenta
+    los bytes a medida que odoorpc lo lee; en la red son los mismos bytes,
+    así que también son los que pasa al limitador."""
+
+    def __init__(self, response, stats=None, limiter=None):
+        self._response = response
+        self._stats = stats
+        self._limiter = limiter
+        self._size = 0
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self._response.readinto(buffer)
+        if not size:
+            self._finish()
+            return 0
+        self._size += size
+        if self._limiter is not None:
+            self._limiter.throttle(size)
+        return size
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        if self._stats is not None:
+            self._stats.add(self._size, self._size)
+        self._response.close()
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class CountingOpener(object):
+    """Opener urllib que registra en TransferStats los bytes de cada respuesta,
+    igual que KeepAliveOpener, para que el bloque adaptativo mida bytes con
+    cualquier transporte."""
+
+    def __init__(self, stats=None, limiter=None):
+        self.stats = stats
+        self.limiter = limiter
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor())
+
+    def open(self, request, timeout=None):
+        response = self._opener.open(request, timeout=timeout)
+        return io.BufferedReader(CountedResponse(response, self.stats, self.limiter), STREAM_CHUNK_SIZE)
+
+
+class KeepAliveOpener(object):
+    """Reemplazo del opener urllib de odoorpc: reutiliza las conexiones HTTP(S)
+    (requests.Session, con sus cookies de sesión) y pide respuestas gzip/deflate."""
+
+    def __init__(self, stats=None, limiter=None):
+        self.stats = stats
+        self.limiter = limiter
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+    def open(self, request, timeout=None):
+        response = self.session.request(
+            request.get_method(),
+            request.full_url,
+            data=request.data,
+            headers=dict(request.header_items()),
+            timeout=timeout,
+            stream=True,
+        )
+        response.raise_for_status()
+        return io.BufferedReader(StreamedResponse(response, self.stats, self.limiter), STREAM_CHUNK_SIZE)
+
+
+def snapshot_key(request):
+    """Clave de una petición JSON-RPC: ruta y parámetros, sin el id aleatorio
+    que agrega odoorpc. Se guarda como hash para no escribir en el snapshot
+    la contraseña enviada en el login."""
+    payload = json.loads(request.data)
+    path = urllib.parse.urlsplit(request.full_url).path
+    canonical = json.dumps([path, payload.get('params')], sort_keys=True)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class SnapshotMissError(LookupError):
+    pass
+
+
+class SnapshotRecorder(object):
+    """Guarda cada petición remota con su respuesta como una línea JSONL
+    comprimida, en miembros gzip de SNAPSHOT_CHUNK_SIZE líneas. La primera
+    línea es la cabecera con los parámetros de la exportación. Compartido
+    por las sesiones de todos los hilos."""
+
+    def __init__(self, fileobj, header):
+        self._fileobj = fileobj
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._gzip = None
+        self._lines = 0
+        self.entries = 0
+        self._write(header)
+
+    def wrap(self, opener):
+        return RecordingOpener(self, opener)
+
+    def _write(self, item):
+        if self._gzip is None:
+            self._gzip = gzip.GzipFile(fileobj=self._fileobj, mode='wb')
+        self._gzip.write(json.dumps(item, default=str).encode('utf-8') + b'\n')
+        self._lines += 1
+        if self._lines >= SNAPSHOT_CHUNK_SIZE:
+            # Cierra el miembro gzip, no el archivo
+            self._gzip.close()
+            self._gzip = None
+            self._lines = 0
+
+    def add(self, key, body):
+        with self._lock:
+            if key in self._keys:
+                return
+            self._keys.add(key)
+            self._write({'key': key, 'body': body})
+            self.entries += 1
+
+    def close(self):
+        with self._lock:
+            if self._gzip is not None:
+                self._gzip.close()
+                self._gzip = None
+
+
+class RecordingOpener(object):
+    """Opener que delega en el transporte real y graba la respuesta completa."""
+
+    def __init__(self, recorder, opener):
+        self._recorder = recorder
+        self._opener = opener
+
+    def open(self, request, timeout=None):
+        response = self._opener.open(request, timeout=timeout)
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        self._recorder.add(snapshot_key(request), body.decode('utf-8'))
+        return io.BytesIO(body)
+
+
+class SnapshotReplay(object):
+    """Responde las peticiones de odoorpc desde un snapshot exportado, sin
+    conectarse al servidor externo."""
+
+    def __init__(self, data):
+        self.header = {}
+        self._responses = {}
+        with gzip.GzipFile(fileobj=io.BytesIO(data)) as stream:
+            for line_no, line in enumerate(stream):
+                item = json.loads(line)
+                if line_no == 0:
+                    self.header = item
+                else:
+                    self._responses[item['key']] = item['body']
+
+    def wrap(self, opener):
+        return self
+
+    def open(self, request, timeout=None):
+        body = self._responses.get(snapshot_key(request))
+        if body is None:
+            raise SnapshotMissError(
+                'La petición %s no está en el snapshot; exporte uno nuevo con los mismos '
+                'parámetros y datos locales.' % urllib.parse.urlsplit(request.full_url).path)
+        return io.BytesIO(body.encode('utf-8'))
+
+
+class RateLimiter(object):
+    """Límites de una conexión compartidos por todas las sesiones de una
+    ejecución: peticiones por segundo, llamadas simultáneas, bytes por segundo
+    y ventanas horarias permitidas. Las peticiones esperan su turno en vez de
+    fallar; las ventanas se comprueban antes de cada bloque (check_window).
+    Los bytes por segundo los aplica el transporte mientras lee el cuerpo
+    (ver throttle), contando los bytes de la red."""
+
+    def __init__(self, max_rps=0, max_concurrent=0, max_bps=0, windows=None, tz=None):
+        self.max_rps = max_rps
+        self.max_bps = max_bps
+        # [(día de la semana o None, hora desde, hora hasta)], horas en decimal
+        self.windows = windows or []
+        self.tz = tz or pytz.utc
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self._next_request = 0.0
+        self._next_bytes = 0.0
+
+    def wrap(self, opener):
+        return RateLimitedOpener(self, opener)
+
+    def in_window(self, moment):
+        if not self.windows:
+            return True
+        hour = moment.hour + moment.minute / 60.0
+        for weekday, hour_from, hour_to in self.windows:
+            if weekday is not None and weekday != moment.weekday():
+                continue
+            if hour_from <= hour_to and hour_from <= hour < hour_to:
+                return True
+            # Ventana que cruza la medianoche, p. ej. 22:00 a 06:00
+            if hour_from > hour_to and (hour >= hour_from or hour < hour_to):
+                return True
+        return False
+
+    def next_opening(self, moment):
+        """Inicio de la próxima ventana después de moment, o None si ninguna
+        abre nunca."""
+        openings = []
+        for days in range(8):
+            day = moment.date() + timedelta(days=days)
+            for weekday, hour_from, hour_to in self.windows:
+                if (weekday is not None and weekday != day.weekday()) or hour_from == hour_to:
+                    continue
+                start = datetime.combine(day, datetime.min.time()) + timedelta(hours=hour_from)
+                if moment.tzinfo is not None:
+                    start = self.tz.localize(start)
+                if start > moment:
+                    openings.append(start)
+            if openings:
+                return min(openings)
+        return None
+
+    def check_window(self):
+        """Lanza OutsideWindowError fuera de las ventanas, sin esperar: el
+        proceso no debe quedar dormido dentro de una petición o un cron."""
+        now = datetime.now(self.tz)
+        if not self.in_window(now):
+            raise OutsideWindowError(self.next_opening(now))
+
+    def wait_turn(self):
+        """Reserva el siguiente turno según peticiones/s."""
+        if not self.max_rps:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request)
+            self._next_request = slot + 1.0 / self.max_rps
+        if slot > now:
+            time.sleep(slot - now)
+
+    def throttle(self, size):
+        """Espera lo que corresponde a size bytes recibidos de la red. Al leer
+        más despacio, TCP frena también al servidor."""
+        if not self.max_bps or not size:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._next_bytes = max(now, self._next_bytes) + size / float(self.max_bps)
+            delay = self._next_bytes - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def acquire(self):
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+
+    def release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+class LimitedResponse(io.RawIOBase):
+    """Cuerpo en streaming que ocupa una llamada simultánea del limitador
+    hasta terminar de leerse o cerrarse."""
+
+    def __init__(self, response, limiter):
+        self._response = response
+        self._limiter = limiter
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self._response.readinto(buffer)
+        if not size:
+            self._finish()
+        return size
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        try:
+            self._response.close()
+        finally:
+            self._limiter.release()
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class RateLimitedOpener(object):
+    """Opener que aplica las peticiones por segundo y las llamadas
+    simultáneas a cada petición. La llamada queda ocupada mientras
+    se lee el cuerpo, sin leerlo antes completo en memoria."""
+
+    def __init__(self, limiter, opener):
+        self._limiter = limiter
+        self._opener = opener
+
+    def open(self, request, timeout=None):
+        self._limiter.acquire()
+        try:
+            self._limiter.wait_turn()
+            response = self._opener.open(request, timeout=timeout)
+        except BaseException:
+            self._limiter.release()
+            raise
+        return io.BufferedReader(LimitedResponse(response, self._limiter), STREAM_CHUNK_SIZE)
+
+
+class OutsideWindowError(Exception):
+    """La conexión está fuera de sus ventanas horarias; next_opening es el
+    inicio de la próxima (en la zona horaria del limitador) o None."""
+
+    def __init__(self, next_opening):
+        self.next_opening = next_opening
+        if next_opening:
+            message = 'Fuera de la ventana horaria de la conexión. La próxima abre el %s %s.' % (
+                dict(WEEKDAYS)[str(next_opening.weekday())], next_opening.strftime('%d/%m/%Y %H:%M'))
+        else:
+            message = 'Fuera de la ventana horaria de la conexión y ninguna ventana abre.'
+        super().__init__(message)
+
+
+class RemoteFieldsError(ValueError):
+    pass
+
+
+def parse_object_call(request):
+    """(modelo, método, argumentos) de una llamada execute/execute_kw del
+    servicio object; None para cualquier otra petición."""
+    params = json.loads(request.data).get('params') or {}
+    if params.get('service') != 'object' or params.get('method') not in ('execute', 'execute_kw'):
+        return None
+    args = params.get('args') or []
+    if len(args) < 5:
+        return None
+    return args[3], args[4], params['method'], args[5:]
+
+
+class MetadataCache(object):
+    """fields_get de los modelos remotos de una conexión, por versión del
+    servidor. Se carga al iniciar la ejecución (json.rpc.metadata); las
+    sesiones de todos los hilos lo consultan en lugar de pedir fields_get y
+    validan contra él los campos de cada read antes de enviarlo."""
+
+    def __init__(self, entries=None):
+        self._lock = threading.Lock()
+        # {(versión, modelo, firma): resultado de fields_get}
+        self.entries = dict(entries or {})
+        self.new_entries = {}
+        self.server_version = None
+
+    def wrap(self, opener):
+        return MetadataOpener(self, opener)
+
+    def get(self, model, signature):
+        return self.entries.get((self.server_version, model, signature))
+
+    def add(self, model, signature, result):
+        with self._lock:
+            key = (self.server_version, model, signature)
+            self.entries[key] = result
+            self.new_entries[key] = result
+
+    def get_fields(self, model):
+        """Campos del modelo según el fields_get completo, si está en cache."""
+        return self.get(model, '[]')
+
+    def check_fields(self, model, fields_list):
+        fields_info = self.get_fields(model)
+        if not fields_info or not fields_list:
+            return
+        missing = [field_name for field_name in fields_list if field_name not in fields_info]
+        if missing:
+            raise RemoteFieldsError('El modelo %s de la versión %s no tiene los campos: %s' % (
+                model, self.server_version, ', '.join(missing)))
+
+
+class MetadataOpener(object):
+    """Responde fields_get desde el cache y valida los campos pedidos en cada
+    read; el resto de peticiones pasa sin tocar al transporte real."""
+
+    def __init__(self, cache, opener):
+        self._cache = cache
+        self._opener = opener
+
+    def open(self, request, timeout=None):
+        path = urllib.parse.urlsplit(request.full_url).path
+        if path in ('/web/webclient/version_info', '/web/session/authenticate'):
+            return self._open_version(request, timeout)
+        call = parse_object_call(request)
+        if call is None:
+            return self._opener.open(request, timeout=timeout)
+        model, method, call_method, rest = call
+        if method == 'fields_get':
+            return self._open_fields_get(request, timeout, model, call_method, rest)
+        if method in ('read', 'search_read'):
+            kwargs = rest[1] if call_method == 'execute_kw' and len(rest) > 1 else {}
+            args = rest[0] if call_method == 'execute_kw' and rest else rest
+            fields_list = args[1] if len(args) > 1 else kwargs.get('fields')
+            self._cache.check_fields(model, fields_list)
+        return self._opener.open(request, timeout=timeout)
+
+    def _read(self, request, timeout):
+        response = self._opener.open(request, timeout=timeout)
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def _open_version(self, request, timeout):
+        body = self._read(request, timeout)
+        result = json.loads(body).get('result') or {}
+        if result.get('server_version'):
+            self._cache.server_version = result['server_version']
+        return io.BytesIO(body)
+
+    def _open_fields_get(self, request, timeout, model, call_method, rest):
+        # Firma '[]': fields_get completo, como lo pide odoorpc al crear el modelo
+        if call_method == 'execute_kw':
+            args, kwargs = (rest + [[], {}])[:2]
+            signature = '[]' if not args and not kwargs.get('allfields') and not kwargs.get('attributes') \
+                else json.dumps([args, kwargs], sort_keys=True)
+        else:
+            signature = json.dumps(rest, sort_keys=True)
+        result = self._cache.get(model, signature) if self._cache.server_version else None
+        if result is not None:
+            return io.BytesIO(json.dumps({'jsonrpc': '2.0', 'id': None, 'result': result}).encode('utf-8'))
+        body = self._read(request, timeout)
+        data = json.loads(body)
+        if self._cache.server_version and 'result' in data:
+            self._cache.add(model, signature, data['result'])
+        return io.BytesIO(body)
+
+
+def build_opener(transport, stats=None, snapshot=None, metadata=None, limiter=None):
+    """Opener para odoorpc.ODOO según el transporte de la conexión; None usa
+    el opener urllib por defecto de odoorpc. Con un snapshot, las respuestas
+    se graban (exportación) o se leen del snapshot (reproducción); con el
+    cache de metadatos, fields_get se responde sin ir al servidor; con el
+    limitador, solo las peticiones que llegan al servidor esperan su turno y
+    el transporte frena la lectura según los bytes de la red."""
+    if transport == 'keepalive':
+        opener = KeepAliveOpener(stats, limiter)
+    elif stats is not None or limiter is not None:
+        opener = CountingOpener(stats, limiter)
+    else:
+        opener = None
+    if snapshot is None and metadata is None and limiter is None:
+        return opener
+    opener = opener or urllib.request.build_opener(urllib.request.HTTPCookieProcessor())
+    if limiter is not None:
+        opener = limiter.wrap(opener)
+    if metadata is not None:
+        opener = metadata.wrap(opener)
+    if snapshot is not None:
+        opener = snapshot.wrap(opener)
+    return opener
+
 
 class JsonRpc(models.Model):
     _name = 'json.rpc'
@@ -26,12 +667,195 @@ class JsonRpc(models.Model):
     rpc_user = fields.Char(string='Usuario')
     rpc_password = fields.Char(string='Contraseña')
     rpc_version = fields.Selection(VERSION_ODOO, string="Versión", default='11.0')
+    rpc_transport = fields.Selection(
+        TRANSPORT, string='Transporte', default='urllib', required=True,
+        help='Persistente comprimido reutiliza las conexiones HTTP(S) y pide respuestas gzip/deflate.')
+    rpc_max_workers = fields.Integer(
+        string='Lecturas concurrentes', default=4,
+        help='Máximo de lecturas en paralelo (sesiones simultáneas) contra el servidor externo. '
+             'Si se define Llamadas simultáneas y es menor, se usa ese valor.')
+    rpc_max_rps = fields.Float(
+        string='Peticiones por segundo',
+        help='Máximo de peticiones por segundo al servidor externo. 0 sin límite.')
+    rpc_max_concurrent = fields.Integer(
+        string='Llamadas simultáneas',
+        help='Máximo de llamadas en curso a la vez entre todas las sesiones de una ejecución, '
+             'incluida la sesión principal. Tiene prioridad sobre Lecturas concurrentes. 0 sin límite.')
+    rpc_max_kbps = fields.Integer(
+        string='KB por segundo',
+        help='Máximo de datos recibidos por segundo, según lo transferido en la red. 0 sin límite.')
+    window_ids = fields.One2many(
+        comodel_name="json.rpc.window",
+        inverse_name="rpc_id",
+        string="Ventanas horarias",
+        help="Horarios en que se permite sincronizar. Se comprueban antes de cada bloque: fuera "
+             "de ellos la sincronización confirma lo avanzado y se detiene; la programada vuelve "
+             "a la cola hasta la próxima ventana. Sin ventanas se permite a cualquier hora.",
+    )
     log_ids = fields.One2many(
         comodel_name="json.rpc.log",
         inverse_name="rpc_id",
         string="Logs",
         copy=False,
     )
+    map_ids = fields.One2many(
+        comodel_name="json.rpc.map",
+        inverse_name="rpc_id",
+        string="Mapeo de IDs",
+        copy=False,
+    )
+    metadata_ids = fields.One2many(
+        comodel_name="json.rpc.metadata",
+        inverse_name="rpc_id",
+        string="Metadatos remotos",
+        copy=False,
+    )
+    benchmark_ids = fields.One2many(
+        comodel_name="json.rpc.benchmark",
+        inverse_name="rpc_id",
+        string="Mediciones",
+        copy=False,
+    )
+    benchmark_date = fields.Datetime(string='Fecha de medición', readonly=True, copy=False)
+    benchmark_login_ms = fields.Float(string='Login (ms)', readonly=True, copy=False)
+    benchmark_latency_p50 = fields.Float(string='Latencia p50 (ms)', readonly=True, copy=False)
+    benchmark_latency_p90 = fields.Float(string='Latencia p90 (ms)', readonly=True, copy=False)
+    benchmark_latency_p99 = fields.Float(string='Latencia p99 (ms)', readonly=True, copy=False)
+    recommended_offset = fields.Integer(
+        string='Bloque de registros recomendado', readonly=True, copy=False,
+        help='Valor inicial de "Bloque de registros" en el asistente de sincronización.')
+    recommended_chunk_size = fields.Integer(
+        string='Tamaño del chunk recomendado', readonly=True, copy=False,
+        help='Valor inicial de "Tamaño del Chunk" en el asistente de sincronización.')
+
+    def _get_rate_limiter(self):
+        """Limitador de la conexión para una ejecución, o None si no tiene
+        límites ni ventanas. Las ventanas se evalúan en la zona horaria del
+        usuario."""
+        self.ensure_one()
+        if not (self.rpc_max_rps or self.rpc_max_concurrent or self.rpc_max_kbps or self.window_ids):
+            return None
+        return RateLimiter(
+            max_rps=self.rpc_max_rps,
+            max_concurrent=self.rpc_max_concurrent,
+            max_bps=self.rpc_max_kbps * 1024,
+            windows=[
+                (int(window.weekday) if window.weekday else None, window.hour_from, window.hour_to)
+                for window in self.window_ids
+            ],
+            tz=pytz.timezone(self.env.user.tz or 'America/Lima'),
+        )
+
+    def _get_metadata_cache(self):
+        """Cache de fields_get de la conexión para una ejecución."""
+        self.ensure_one()
+        return MetadataCache({
+            (item.server_version, item.remote_model, item.signature): json.loads(item.data)
+            for item in self.metadata_ids
+        })
+
+    def _save_metadata_cache(self, cache):
+        """Guarda los fields_get pedidos al servidor durante la ejecución. Otra
+        ejecución de la misma conexión puede haber guardado los mismos en
+        paralelo: se omiten los que ya existen y un duplicado nunca aborta la
+        sincronización."""
+        self.ensure_one()
+        if not cache.new_entries:
+            return
+        existing = {
+            (item['server_version'], item['remote_model'], item['signature'])
+            for item in self.env['json.rpc.metadata'].search_read(
+                [('rpc_id', '=', self.id)], ['server_version', 'remote_model', 'signature'])
+        }
+        vals_list = [{
+            'rpc_id': self.id,
+            'server_version': server_version,
+            'remote_model': remote_model,
+            'signature': signature,
+            'data': json.dumps(result),
+        } for (server_version, remote_model, signature), result in cache.new_entries.items()
+            if (server_version, remote_model, signature) not in existing]
+        cache.new_entries = {}
+        try:
+            with self.env.cr.savepoint():
+                self.env['json.rpc.metadata'].create(vals_list)
+        except psycopg2.IntegrityError:
+            _logger.info('===== Metadatos de %s ya guardados por otra ejecución' % self.name)
+
+    def action_refresh_metadata(self):
+        """Descarta los metadatos guardados; se vuelven a pedir en la próxima
+        sincronización."""
+        self.metadata_ids.unlink()
+
+    def action_benchmark_connection(self):
+        """Mide el login, la latencia de ida y vuelta y el rendimiento de lectura
+        de comprobantes con XML y productos con imágenes en varios tamaños de
+        bloque. Guarda las mediciones y recomienda los tamaños de bloque del
+        asistente de sincronización."""
+        self.ensure_one()
+        try:
+            start = time.perf_counter()
+            odoo = odoorpc.ODOO(self.rpc_host, port=self.rpc_port, opener=build_opener(self.rpc_transport))
+            odoo.config['timeout'] = 720
+            odoo.login(self.rpc_database, self.rpc_user, self.rpc_password)
+            login_ms = (time.perf_counter() - start) * 1000
+
+            latencies = []
+            for ping in range(BENCHMARK_PINGS):
+                start = time.perf_counter()
+                odoo.execute('res.users', 'read', [odoo.env.uid], ['id'])
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            lines = []
+            recommended = {}
+            for remote_model, candidates, versions in BENCHMARK_MODELS:
+                if self.rpc_version not in versions:
+                    continue
+                try:
+                    fields_list = list(odoo.execute(remote_model, 'fields_get', candidates, ['type']))
+                    ids = odoo.execute(remote_model, 'search', [], 0, max(BENCHMARK_BATCH_SIZES), 'id desc')
+                except RPCError as error:
+                    _logger.info('===== Benchmark %s omitido: %s' % (remote_model, error))
+                    continue
+                if not fields_list or not ids:
+                    continue
+
+                samples = []
+                for batch_size in BENCHMARK_BATCH_SIZES:
+                    batch_ids = ids[:batch_size]
+                    if samples and len(batch_ids) == samples[-1][0]:
+                        break
+                    start = time.perf_counter()
+                    records = odoo.execute(remote_model, 'read', batch_ids, fields_list)
+                    duration = time.perf_counter() - start
+                    payload = len(json.dumps(records))
+                    samples.append((len(batch_ids), duration, payload))
+                    lines.append({
+                        'remote_model': remote_model,
+                        'fields_list': ', '.join(fields_list),
+                        'batch_size': len(batch_ids),
+                        'duration_ms': duration * 1000,
+                        'records_per_second': duration and len(batch_ids) / duration,
+                        'bytes_per_record': payload // len(batch_ids),
+                    })
+                recommended[remote_model] = recommend_batch_size(samples)
+        except (RPCError, OSError) as error:
+            raise ValidationError("No se pudo completar la medición de la conexión:\n%s" % error)
+
+        invoice_size = recommended.get('account.invoice') or recommended.get('account.move') or 0
+        self.benchmark_ids.unlink()
+        self.write({
+            'benchmark_date': fields.Datetime.now(),
+            'benchmark_login_ms': login_ms,
+            'benchmark_latency_p50': percentile(latencies, 50),
+            'benchmark_latency_p90': percentile(latencies, 90),
+            'benchmark_latency_p99': percentile(latencies, 99),
+            'recommended_offset': min(recommended.values()) if recommended else 0,
+            'recommended_chunk_size': invoice_size,
+            'benchmark_ids': [(0, 0, vals) for vals in lines],
+        })
+        _logger.info('===== Benchmark %s: login %.0f ms, latencia p50 %.0f ms, bloque %s, chunk %s' % (
+            self.name, login_ms, self.benchmark_latency_p50, self.recommended_offset, invoice_size))
 
     def action_test_connection(self):
         result = {
@@ -44,7 +868,8 @@ class JsonRpc(models.Model):
         }
         try:
             # 1. Conectar al servidor
-            odoo = odoorpc.ODOO(self.rpc_host, port=self.rpc_port)
+            odoo = odoorpc.ODOO(
+                self.rpc_host, port=self.rpc_port, opener=build_opener(self.rpc_transport))
             result['conexion'] = True
 
             # 2. Verificar versión de Odoo (no requiere autenticación)
@@ -99,3 +924,111 @@ class JsonRpcLog(models.Model):
     name = fields.Char(string="Referencia")
     date_issue = fields.Date(string="Fecha emisión")
     json_data = fields.Text(string="JSON Respuesta")
+
+
+class JsonRpcMap(models.Model):
+    _name = "json.rpc.map"
+    _description = "Mapeo de IDs remotos a registros locales"
+    _order = "remote_model, remote_id"
+
+    rpc_id = fields.Many2one(
+        comodel_name="json.rpc", string="Conexión Externa", required=True, ondelete="cascade")
+    remote_model = fields.Char(string="Modelo remoto", required=True)
+    remote_id = fields.Integer(string="ID remoto", required=True)
+    res_model = fields.Char(string="Modelo local", required=True)
+    res_id = fields.Integer(string="ID local", required=True)
+
+    _sql_constraints = [
+        ('remote_uniq', 'unique(rpc_id, remote_model, remote_id)',
+         'El registro remoto ya está mapeado en esta conexión.'),
+    ]
+
+    def _get_map(self, rpc_id, remote_model):
+        """{id remoto: id local} de un modelo remoto de la conexión, con una
+        consulta. Los mapeos a registros locales eliminados se descartan."""
+        items = self.search_read([
+            ('rpc_id', '=', rpc_id),
+            ('remote_model', '=', remote_model)
+        ], ['remote_id', 'res_model', 'res_id'])
+        existing = set()
+        for res_model in {item['res_model'] for item in items}:
+            existing.update(
+                (res_model, res_id) for res_id in self.env[res_model].browse(
+                    [item['res_id'] for item in items if item['res_model'] == res_model]).exists().ids)
+        stale = [item['id'] for item in items if (item['res_model'], item['res_id']) not in existing]
+        if stale:
+            self.browse(stale).unlink()
+        return {
+            item['remote_id']: item['res_id']
+            for item in items if (item['res_model'], item['res_id']) in existing
+        }
+
+    def _register(self, rpc_id, remote_model, res_model, pairs, id_map):
+        """Guarda {id remoto: id local}; id_map es el mapa ya cargado de la
+        conexión, así solo se crean los pares nuevos o que cambiaron."""
+        pairs = {
+            remote_id: res_id for remote_id, res_id in pairs.items()
+            if remote_id and res_id and id_map.get(remote_id) != res_id
+        }
+        if not pairs:
+            return
+        changed = [remote_id for remote_id in pairs if remote_id in id_map]
+        if changed:
+            self.search([
+                ('rpc_id', '=', rpc_id),
+                ('remote_model', '=', remote_model),
+                ('remote_id', 'in', changed)
+            ]).unlink()
+        self.create([{
+            'rpc_id': rpc_id,
+            'remote_model': remote_model,
+            'remote_id': remote_id,
+            'res_model': res_model,
+            'res_id': res_id,
+        } for remote_id, res_id in pairs.items()])
+        id_map.update(pairs)
+
+
+class JsonRpcMetadata(models.Model):
+    _name = "json.rpc.metadata"
+    _description = "Metadatos de los modelos remotos"
+    _order = "server_version, remote_model"
+
+    rpc_id = fields.Many2one(
+        comodel_name="json.rpc", string="Conexión Externa", required=True, ondelete="cascade")
+    server_version = fields.Char(string="Versión del servidor", required=True)
+    remote_model = fields.Char(string="Modelo remoto", required=True)
+    signature = fields.Char(string="Argumentos", required=True)
+    data = fields.Text(string="fields_get")
+
+    _sql_constraints = [
+        ('metadata_uniq', 'unique(rpc_id, server_version, remote_model, signature)',
+         'Los metadatos del modelo ya están guardados para esta versión.'),
+    ]
+
+
+class JsonRpcBenchmark(models.Model):
+    _name = "json.rpc.benchmark"
+    _description = "Mediciones de rendimiento de la conexión"
+    _order = "remote_model, batch_size"
+
+    rpc_id = fields.Many2one(
+        comodel_name="json.rpc", string="Conexión Externa", required=True, ondelete="cascade")
+    remote_model = fields.Char(string="Modelo remoto", required=True)
+    fields_list = fields.Char(string="Campos")
+    batch_size = fields.Integer(string="Registros por lectura")
+    duration_ms = fields.Float(string="Duración (ms)")
+    records_per_second = fields.Float(string="Registros/s")
+    bytes_per_record = fields.Integer(string="Bytes por registro")
+
+
+class JsonRpcWindow(models.Model):
+    _name = "json.rpc.window"
+    _description = "Ventana horaria permitida para sincronizar"
+    _order = "weekday, hour_from"
+
+    rpc_id = fields.Many2one(
+        comodel_name="json.rpc", string="Conexión Externa", required=True, ondelete="cascade")
+    weekday = fields.Selection(WEEKDAYS, string="Día", help="Vacío aplica todos los días.")
+    hour_from = fields.Float(string="Desde", required=True)
+    hour_to = fields.Float(string="Hasta", required=True, help="Si es menor que Desde, la ventana cruza la medianoche.")
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+import pytz
+
+from odoo import api, fields, models
+
+from .json_rpc import OutsideWindowError
+from ..wizard.sync_data import RPC_MODEL
+
+import logging
+_logger = logging.getLogger(__name__)
+
+# Modelos locales que escribe cada sincronización: dos ejecuciones de la misma
+# empresa que comparten alguno no corren a la vez
+PLAN_LOCAL_MODELS = {
+    'account.invoice': ['account.move', 'res.partner', 'product.product'],
+    'account.notas': ['account.move', 'res.partner', 'product.product'],
+    'account.move': ['account.move', 'res.partner', 'product.product'],
+    'account.notas.13': ['account.move', 'res.partner', 'product.product'],
+    'sale.order': ['account.move', 'res.partner', 'product.product'],
+    'res.partner': ['res.partner'],
+    'product.product': ['product.product'],
+    'product.product.ecommerce': ['product.product'],
+    'stock.lot': ['stock.lot'],
+}
+# Claves de los advisory locks de PostgreSQL: (QUEUE_LOCK_KEY, 0) serializa la
+# toma de ejecuciones; (RUN_LOCK_KEY, id) lo mantiene el trabajador mientras la
+# ejecución corre y se libera solo si su conexión se cae
+QUEUE_LOCK_KEY = 704101
+RUN_LOCK_KEY = 704102
+
+
+class JsonRpcPlan(models.Model):
+    _name = "json.rpc.plan"
+    _description = "Plan de sincronización programada"
+    _order = "sequence, id"
+
+    name = fields.Char(string="Nombre", required=True)
+    active = fields.Boolean(default=True)
+    sequence = fields.Integer(default=10)
+    rpc_id = fields.Many2one(
+        comodel_name="json.rpc", string="Conexión Externa", required=True, ondelete="cascade")
+    rpc_model = fields.Selection(RPC_MODEL, string="Modelo", default="account.move", required=True)
+    current_company_id = fields.Many2one(
+        "res.company", "Empresa", required=True, default=lambda self: self.env.company)
+    company_id = fields.Integer(string="Id Empresa")
+    window_days = fields.Integer(
+        string="Ventana (días)", default=3,
+        help="Se sincronizan los documentos desde esta cantidad de días atrás hasta hoy.")
+    update_record = fields.Boolean(
+        string="Actualizar registros",
+        help="Además de crear los nuevos, escribe los campos que cambiaron en los ya importados.")
+    interval_hours = fields.Integer(string="Cada (horas)", default=24, required=True)
+    next_run = fields.Datetime(string="Próxima ejecución", default=fields.Datetime.now, required=True)
+    filter_name = fields.Char("Filtrar nombre", default="F")
+    tax_id = fields.Many2one("account.tax", string="Impuesto")
+    location_id = fields.Many2one("stock.location", string="Ubicación de Stock")
+    version_origin = fields.Integer(string="Versión origen", default=13)
+    current_version = fields.Integer(string="Versión actual", default=17)
+    offset = fields.Integer(
+        string="Bloque de registros",
+        help="Vacío usa el recomendado por la medición de la conexión.")
+    chunk_size = fields.Integer(
+        string="Tamaño del Chunk",
+        help="Vacío usa el recomendado por la medición de la conexión.")
+    limit = fields.Integer("Total de registros", default=100)
+    auto_picking = fields.Boolean("Crear entregas")
+    sync_binaries = fields.Boolean(string="Transferir archivos", default=True)
+    partner_match = fields.Selection([
+        ('vat', 'RUC/DNI'),
+        ('import_id', 'ID de importación'),
+        ('both', 'RUC/DNI o ID de importación'),
+    ], string="Buscar socios por", default='both', required=True)
+    run_ids = fields.One2many(
+        comodel_name="json.rpc.run",
+        inverse_name="plan_id",
+        string="Ejecuciones",
+        copy=False,
+    )
+
+    def _prepare_wizard_vals(self):
+        """Valores del asistente de sincronización para una ejecución del plan."""
+        self.ensure_one()
+        today = fields.Date.context_today(self)
+        return {
+            'res_model': 'json.rpc',
+            'res_id': self.rpc_id.id,
+            'rpc_model': self.rpc_model,
+            'current_company_id': self.current_company_id.id,
+            'company_id': self.company_id,
+            'start_date': today - timedelta(days=self.window_days),
+            'end_date': today,
+            'update_record': self.update_record,
+            'filter_name': self.filter_name,
+            'tax_id': self.tax_id.id,
+            'location_id': self.location_id.id,
+            'version_origin': self.version_origin,
+            'current_version': self.current_version,
+            'offset': self.offset or self.rpc_id.recommended_offset or 10,
+            'chunk_size': self.chunk_size or self.rpc_id.recommended_chunk_size or 30,
+            'limit': self.limit,
+            'auto_picking': self.auto_picking,
+            'sync_binaries': self.sync_binaries,
+            'partner_match': self.partner_match,
+        }
+
+    def action_enqueue(self):
+        """Encola el plan y despierta a los trabajadores de la cola."""
+        run_obj = self.env['json.rpc.run']
+        queued = run_obj.search([
+            ('plan_id', 'in', self.ids),
+            ('state', '=', 'queued')
+        ]).mapped('plan_id')
+        run_obj.create([{'plan_id': plan.id} for plan in self - queued])
+        run_obj._trigger_workers()
+
+    @api.model
+    def _cron_run_plans(self):
+        """Encola los planes vencidos; las ejecuciones las corren los
+        trabajadores de la cola, así este cron termina enseguida."""
+        now = fields.Datetime.now()
+        plans = self.search([('next_run', '<=', now)])
+        plans.action_enqueue()
+        for plan in plans:
+            plan.next_run = now + timedelta(hours=max(plan.interval_hours, 1))
+
+
+class JsonRpcRun(models.Model):
+    _name = "json.rpc.run"
+    _description = "Ejecución de un plan de sincronización"
+    _order = "id desc"
+
+    plan_id = fields.Many2one(
+        comodel_name="json.rpc.plan", string="Plan", required=True, ondelete="cascade")
+    rpc_id = fields.Many2one(related="plan_id.rpc_id", store=True)
+    rpc_model = fields.Selection(related="plan_id.rpc_model", store=True)
+    company_id = fields.Many2one(related="plan_id.current_company_id", store=True)
+    state = fields.Selection([
+        ('queued', 'En cola'),
+        ('running', 'En ejecución'),
+        ('done', 'Terminado'),
+        ('failed', 'Fallido'),
+    ], string="Estado", default='queued', required=True, index=True)
+    date_queued = fields.Datetime(string="Encolado", default=fields.Datetime.now, required=True)
+    not_before = fields.Datetime(
+        string="No antes de",
+        help="Una ejecución detenida fuera de la ventana horaria de la conexión vuelve a la cola "
+             "y se reanuda al abrir la próxima ventana.")
+    date_start = fields.Datetime(string="Inicio")
+    date_end = fields.Datetime(string="Fin")
+    duration = fields.Float(string="Duración (min)", compute="_compute_duration")
+    error = fields.Text(string="Error")
+
+    @api.depends('date_start', 'date_end')
+    def _compute_duration(self):
+        for run in self:
+            run.duration = run.date_start and run.date_end and \
+                (run.date_end - run.date_start).total_seconds() / 60
+
+    def _get_lock(self):
+        """(conexión, empresa, modelos locales) que la ejecución ocupa."""
+        return (self.rpc_id.id, self.company_id.id, set(PLAN_LOCAL_MODELS.get(self.rpc_model, [self.rpc_model])))
+
+    @api.model
+    def _get_worker_crons(self):
+        return self.env['ir.cron'].sudo().search([
+            ('model_id.model', '=', self._name),
+            ('code', '=', 'model._cron_process_queue()'),
+        ])
+
+    @api.model
+    def _trigger_workers(self, at=None):
+        for cron in self._get_worker_crons():
+            cron._trigger(at)
+
+    @api.model
+    def _get_ready_domain(self):
+        """Ejecuciones en cola que ya pueden correr."""
+        return [
+            ('state', '=', 'queued'),
+            '|', ('not_before', '=', False), ('not_before', '<=', fields.Datetime.now()),
+        ]
+
+    def _is_alive(self):
+        """La ejecución sigue en curso si su trabajador mantiene el lock."""
+        self.env.cr.execute('SELECT pg_try_advisory_lock(%s, %s)', (RUN_LOCK_KEY, self.id))
+        if not self.env.cr.fetchone()[0]:
+            return True
+        self.env.cr.execute('SELECT pg_advisory_unlock(%s, %s)', (RUN_LOCK_KEY, self.id))
+        return False
+
+    @api.model
+    def _fail_dead_runs(self):
+        """Marca como fallidas las ejecuciones en curso cuyo trabajador murió
+        (p. ej. limit_time_real_cron); las de otros trabajadores vivos siguen."""
+        for run in self.search([('state', '=', 'running')]):
+            if not run._is_alive():
+                run.write({'state': 'failed', 'date_end': fields.Datetime.now(), 'error': 'Ejecución interrumpida'})
+        self.env.cr.commit()
+
+    @api.model
+    def _claim_next(self):
+        """Toma la primera ejecución en cola que no choca con las que están en
+        curso: las de una misma conexión, o de la misma empresa que escriben
+        los mismos modelos locales, esperan a que termine la anterior. La
+        ejecución queda con el lock del trabajador antes de confirmarse."""
+        self.env.cr.execute('SELECT pg_advisory_xact_lock(%s, 0)', (QUEUE_LOCK_KEY,))
+        busy = [run._get_lock() for run in self.search([('state', '=', 'running')])]
+        for run in self.search(self._get_ready_domain(), order='date_queued, id'):
+            rpc_id, company_id, local_models = run._get_lock()
+            if any(rpc_id == other[0] or (company_id == other[1] and local_models & other[2])
+                   for other in busy):
+                continue
+            self.env.cr.execute('SELECT pg_advisory_lock(%s, %s)', (RUN_LOCK_KEY, run.id))
+            run.write({'state': 'running', 'date_start': fields.Datetime.now()})
+            self.env.cr.commit()
+            return run
+        self.env.cr.commit()
+        return self.browse()
+
+    @api.model
+    def _cron_process_queue(self):
+        """Trabajador de la cola: corre una ejecución y, si quedan más en cola,
+        se vuelve a programar. Cada cron trabajador activo es una ejecución
+        simultánea; para más, duplique el cron."""
+        self._fail_dead_runs()
+        run = self._claim_next()
+        if not run:
+            return
+        _logger.info('===== Plan %s iniciado' % run.plan_id.name)
+        try:
+            run._execute()
+        finally:
+            self.env.cr.execute('SELECT pg_advisory_unlock(%s, %s)', (RUN_LOCK_KEY, run.id))
+        if self.search_count(self._get_ready_domain(), limit=1):
+            self._trigger_workers()
+
+    def _execute(self):
+        """Corre la sincronización del plan con el asistente y registra el
+        resultado. Los bloques ya confirmados por el asistente se conservan si
+        la ejecución falla. Fuera de la ventana horaria de la conexión vuelve a
+        la cola hasta la próxima ventana, sin esperar en el trabajador."""
+        self.ensure_one()
+        try:
+            wizard = self.env['sync.data.wizard'].create(self.plan_id._prepare_wizard_vals())
+            wizard._sync()
+            self.write({'state': 'done', 'date_end': fields.Datetime.now(), 'not_before': False})
+        except OutsideWindowError as error:
+            self.env.cr.rollback()
+            if not error.next_opening:
+                self.write({'state': 'failed', 'date_end': fields.Datetime.now(), 'error': str(error)})
+            else:
+                not_before = error.next_opening.astimezone(pytz.utc).replace(tzinfo=None)
+                _logger.info('===== Plan %s en pausa hasta %s' % (self.plan_id.name, not_before))
+                self.write({'state': 'queued', 'not_before': not_before, 'error': str(error)})
+                self._trigger_workers(not_before)
+        except Exception as error:
+            self.env.cr.rollback()
+            _logger.exception('===== Plan %s fallido' % self.plan_id.name)
+            self.write({'state': 'failed', 'date_end': fields.Datetime.now(), 'error': str(error)})
+        self.env.cr.commit()
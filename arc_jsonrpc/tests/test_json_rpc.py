@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+from odoo.tests.common import BaseCase, TransactionCase, tagged
+
+from ..models.json_rpc import (
+    BENCHMARK_MAX_SIZE, BENCHMARK_MIN_SIZE, RateLimiter, is_changed, recommend_batch_size)
+
+
+@tagged('post_install', '-at_install')
+class TestIsChanged(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.country = cls.env.ref('base.pe')
+        cls.categories = cls.env['res.partner.category'].create([{'name': 'VIP'}, {'name': 'Mayorista'}])
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Cliente Prueba',
+            'country_id': cls.country.id,
+            'partner_latitude': 12.5,
+            'category_id': [(6, 0, cls.categories.ids)],
+        })
+
+    def test_many2one(self):
+        self.assertFalse(is_changed(self.partner, 'country_id', self.country.id))
+        self.assertFalse(is_changed(self.partner, 'country_id', self.country))
+        self.assertTrue(is_changed(self.partner, 'country_id', self.env.ref('base.us').id))
+        self.assertTrue(is_changed(self.partner, 'country_id', False))
+        self.assertTrue(is_changed(self.partner.copy({'country_id': False}), 'country_id', self.country))
+
+    def test_float(self):
+        self.assertFalse(is_changed(self.partner, 'partner_latitude', 12.5))
+        # Se compara redondeado a la precisión del campo
+        self.assertFalse(is_changed(self.partner, 'partner_latitude', 12.500000001))
+        self.assertTrue(is_changed(self.partner, 'partner_latitude', 12.6))
+        self.assertTrue(is_changed(self.partner, 'partner_latitude', False))
+
+    def test_x2many(self):
+        ids = self.categories.ids
+        self.assertFalse(is_changed(self.partner, 'category_id', [(6, 0, list(reversed(ids)))]))
+        self.assertFalse(is_changed(self.partner, 'category_id', ids))
+        self.assertFalse(is_changed(self.partner, 'category_id', self.categories))
+        self.assertTrue(is_changed(self.partner, 'category_id', [(6, 0, ids[:1])]))
+        self.assertTrue(is_changed(self.partner, 'category_id', []))
+        # Otros comandos siempre cuentan como cambio
+        self.assertTrue(is_changed(self.partner, 'category_id', [(4, ids[0])]))
+
+
+@tagged('post_install', '-at_install')
+class TestRecommendBatchSize(BaseCase):
+
+    def test_target_seconds(self):
+        # 0.05 s por registro y 0.5 s fijos: 590 registros en 30 s
+        samples = [(200, 10.5, 200000), (10, 1.0, 10000), (50, 3.0, 50000)]
+        self.assertEqual(recommend_batch_size(samples), 590)
+
+    def test_max_bytes(self):
+        # 400 KiB por registro: el límite de 64 MiB manda sobre el tiempo
+        samples = [(10, 0.2, 4 * 1024 * 1024), (200, 2.0, 80 * 1024 * 1024)]
+        self.assertEqual(recommend_batch_size(samples), 160)
+
+    def test_clamped(self):
+        self.assertEqual(recommend_batch_size([(10, 0.5, 1000), (50, 0.5, 5000)]), BENCHMARK_MAX_SIZE)
+
+    def test_fallback(self):
+        # Sin muestras no hay recomendación
+        self.assertEqual(recommend_batch_size([]), 0)
+        self.assertEqual(recommend_batch_size([(0, 0.1, 0)]), 0)
+        # Si todas exceden el tiempo objetivo se recomienda el bloque mínimo
+        self.assertEqual(recommend_batch_size([(10, 40.0, 1000), (50, 90.0, 5000)]), BENCHMARK_MIN_SIZE)
+
+
+@tagged('post_install', '-at_install')
+class TestRateLimiterWindow(BaseCase):
+
+    def test_no_windows(self):
+        self.assertTrue(RateLimiter().in_window(datetime(2024, 1, 1, 3, 0)))
+
+    def test_same_day(self):
+        limiter = RateLimiter(windows=[(None, 8.0, 18.5)])
+        self.assertFalse(limiter.in_window(datetime(2024, 1, 1, 7, 59)))
+        self.assertTrue(limiter.in_window(datetime(2024, 1, 1, 8, 0)))
+        self.assertTrue(limiter.in_window(datetime(2024, 1, 1, 18, 29)))
+        self.assertFalse(limiter.in_window(datetime(2024, 1, 1, 18, 30)))
+
+    def test_crosses_midnight(self):
+        limiter = RateLimiter(windows=[(None, 22.0, 6.0)])
+        self.assertTrue(limiter.in_window(datetime(2024, 1, 1, 23, 15)))
+        self.assertTrue(limiter.in_window(datetime(2024, 1, 2, 0, 0)))
+        self.assertTrue(limiter.in_window(datetime(2024, 1, 2, 5, 59)))
+        self.assertFalse(limiter.in_window(datetime(2024, 1, 2, 6, 0)))
+        self.assertFalse(limiter.in_window(datetime(2024, 1, 2, 21, 59)))
+
+    def test_weekday(self):
+        # 2024-01-01 es lunes (0)
+        limiter = RateLimiter(windows=[(0, 8.0, 12.0), (5, 0.0, 24.0)])
+        self.assertTrue(limiter.in_window(datetime(2024, 1, 1, 9, 0)))
+        self.assertFalse(limiter.in_window(datetime(2024, 1, 2, 9, 0)))
+        self.assertTrue(limiter.in_window(datetime(2024, 1, 6, 23, 59)))
+
+    def test_next_opening(self):
+        limiter = RateLimiter(windows=[(None, 22.0, 6.0)])
+        self.assertEqual(limiter.next_opening(datetime(2024, 1, 2, 10, 0)), datetime(2024, 1, 2, 22, 0))
+        # Solo los lunes: después de la del lunes abre el lunes siguiente
+        limiter = RateLimiter(windows=[(0, 8.0, 12.0)])
+        self.assertEqual(limiter.next_opening(datetime(2024, 1, 1, 13, 0)), datetime(2024, 1, 8, 8, 0))
+        self.assertIsNone(RateLimiter(windows=[(None, 8.0, 8.0)]).next_opening(datetime(2024, 1, 1, 9, 0)))
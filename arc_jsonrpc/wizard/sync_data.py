@@ -1,15 +1,29 @@
 # -*- coding: utf-8 -*-
 
 import odoorpc
+import base64
 import contextlib
 import calendar
 import pytz
+import socket
+import tempfile
+import threading
+import time
 import unicodedata
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
+from urllib.error import URLError
+
+import requests
+
+from urllib3.exceptions import ReadTimeoutError
 
 from odoo import fields, models, api
-from odoo.exceptions import ValidationError
+from odoo.exceptions import UserError, ValidationError
+
+from ..models.json_rpc import (
+    OutsideWindowError, SnapshotRecorder, SnapshotReplay, TransferStats, build_opener, is_changed)
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -26,6 +40,284 @@ RPC_MODEL = [
     ('stock.lot', 'Series de Productos'),
 ]
 
+# (campo binario remoto, nombre de archivo en la solicitud, ubicación en l10n_pe_edi.request)
+EDI_BINARY_FIELDS = [
+    ('comprobante_xml', 'l10n_pe_xml_filename', 'xml_location'),
+    ('comprobante_cdr', 'l10n_pe_cdr_filename', 'zip_location'),
+]
+BINARY_BATCH_SIZE = 10
+# Máximo de ids por lectura remota de líneas de factura
+LINE_READ_BATCH_SIZE = 1000
+# Bloque adaptativo: tamaño inicial, límites y bytes máximos por bloque
+ADAPTIVE_START_SIZE = 5
+ADAPTIVE_MAX_SIZE = 1000
+ADAPTIVE_MAX_BYTES = 64 * 1024 * 1024
+
+# Campo many2one del socio remoto: (modelo remoto, campos a leer)
+PARTNER_REMOTE_RELATIONS = {
+    'l10n_latam_identification_type_id': ('l10n_latam.identification.type', ['name', 'l10n_pe_vat_code']),
+    'country_id': ('res.country', ['name']),
+    'state_id': ('res.country.state', ['name']),
+    'city_id': ('res.city', ['name']),
+    'l10n_pe_district': ('l10n_pe.res.city.district', ['name']),
+}
+
+# Parámetros del asistente que definen las peticiones remotas; se guardan en
+# la cabecera del snapshot y se restauran al reproducirlo
+SNAPSHOT_FIELDS = [
+    'rpc_model', 'start_date', 'end_date', 'offset', 'limit', 'filter_name', 'company_id',
+    'start_record', 'end_record', 'update_record', 'version_origin', 'current_version',
+    'chunk_size', 'partner_match', 'sync_binaries', 'auto_picking',
+]
+
+PRODUCT_REMOTE_FIELDS = ['name', 'list_price', 'type', 'standard_price', 'default_code']
+
+
+def is_igv_tax(tax):
+    """IGV de venta según einv_type_tax (localización de la versión 11)."""
+    return tax['einv_type_tax'] == 'igv' and tax['type_tax_use'] == 'sale'
+
+
+def is_igv_tax_v13(tax):
+    """IGV incluido en el precio o exonerado (códigos 1000/9997) de la versión 13."""
+    return tax['type_tax_use'] == 'sale' and (
+        tax['l10n_pe_edi_tax_code'] == '1000' and tax['price_include']
+        or tax['l10n_pe_edi_tax_code'] == '9997')
+
+
+# Líneas remotas. values es campo local -> campo remoto; tax_rule decide si un
+# impuesto remoto se importa como el impuesto del asistente (None: todas las
+# líneas lo llevan, sin leer los impuestos remotos).
+INVOICE_LINE_V11 = {
+    'model': 'account.invoice.line',
+    'parent': 'invoice_id',
+    'uom': 'uom_id',
+    'taxes': 'invoice_line_tax_ids',
+    'tax_fields': ['einv_type_tax', 'type_tax_use'],
+    'tax_rule': is_igv_tax,
+    'values': {
+        'quantity': 'quantity',
+        'price_unit': 'price_unit',
+        'discount': 'discount',
+        'price_subtotal': 'price_subtotal',
+        'price_total': 'price_total',
+    },
+}
+MOVE_LINE_V13 = dict(
+    INVOICE_LINE_V11, model='account.move.line', parent='move_id', uom='product_uom_id', taxes='tax_ids')
+SALE_ORDER_LINE = dict(
+    INVOICE_LINE_V11, model='sale.order.line', parent='order_id', uom='product_uom', taxes='tax_id',
+    values={'quantity': 'product_uom_qty', 'price_unit': 'price_unit', 'price_total': 'price_total'})
+
+# Solicitud EDI: campo local -> campo remoto del comprobante
+EDI_REQUEST_FIELDS = {
+    'l10n_pe_xml_filename': 'xml_filename',
+    'l10n_pe_cdr_filename': 'cdr_filename',
+    'l10n_pe_anulada': 'anulada',
+    'l10n_pe_digest_value': 'digest_value',
+}
+
+# Orígenes de comprobantes para _sync_moves, por versión y tipo de documento:
+# - domain, date, name: filtro base, campo de fecha y de número remotos
+# - values: campos copiados tal cual (campo local -> campo remoto)
+# - references: (cadena de many2one remotos, campo final) resueltos en bloque;
+#   shop, reversal y origin se traducen con los mapas locales
+# - page_size/limit: campo del asistente para el bloque y si se aplica el total
+# - strict: omite los comprobantes sin moneda o tienda local en vez de usar
+#   los valores por defecto
+# - edi_request: crea la solicitud EDI al publicar
+# - update: campos que update_record reescribe en comprobantes ya importados
+#   (ya publicados, por eso solo campos que no afectan los asientos)
+MOVE_SOURCES = {
+    'account.invoice': {
+        'model': 'account.invoice',
+        'move_type': 'out_invoice',
+        'domain': [('type', '=', 'out_invoice'), ('state', 'in', ['open', 'paid', 'cancel'])],
+        'date': 'date_invoice',
+        'name': 'move_name',
+        'company': False,
+        'payment_term': 'payment_term_id',
+        'values': {
+            'invoice_date': 'date_invoice',
+            'invoice_date_due': 'date_due',
+            'date': 'date_invoice',
+            'l10n_pe_edi_datetime_invoice': 'datetime_invoice',
+        },
+        'references': {
+            'shop': (['journal_id', 'shop_id'], 'code'),
+        },
+        'cancel_states': ['cancel', 'anulada'],
+        'request': EDI_REQUEST_FIELDS,
+        'lines': INVOICE_LINE_V11,
+        'page_size': 'offset',
+        'limit': False,
+        'strict': False,
+        'edi_request': False,
+        'update': ['l10n_pe_edi_shop_id'],
+    },
+}
+MOVE_SOURCES['account.notas'] = dict(
+    MOVE_SOURCES['account.invoice'],
+    move_type='out_refund',
+    domain=[('type', '=', 'out_refund'), ('state', 'in', ['open', 'paid', 'cancel'])],
+    references={
+        'shop': (['journal_id', 'shop_id'], 'code'),
+        'reversal': (['tipo_ncredito_id'], 'code'),
+        'origin': (['invoice_ncredito_id'], 'move_name'),
+    },
+)
+MOVE_SOURCES['account.move'] = dict(
+    MOVE_SOURCES['account.invoice'],
+    model='account.move',
+    domain=[('type', '=', 'out_invoice'), ('state', 'in', ['posted', 'cancel'])],
+    date='invoice_date',
+    name='name',
+    company=True,
+    payment_term='invoice_payment_term_id',
+    values={
+        'invoice_date': 'invoice_date',
+        'invoice_date_due': 'invoice_date_due',
+        'date': 'invoice_date',
+        'l10n_pe_edi_datetime_invoice': 'datetime_invoice',
+    },
+    references={
+        'shop': (['journal_id', 'l10n_pe_edi_shop_id'], 'code'),
+    },
+    cancel_states=['cancel'],
+    lines=dict(MOVE_LINE_V13, tax_fields=['l10n_pe_edi_tax_code', 'type_tax_use', 'price_include'],
+               tax_rule=is_igv_tax_v13),
+)
+MOVE_SOURCES['account.move.13'] = dict(
+    MOVE_SOURCES['account.move'],
+    references={
+        'shop': (['l10n_pe_edi_shop_id'], 'code'),
+    },
+    request=dict(EDI_REQUEST_FIELDS, l10n_pe_enviado='enviado'),
+    lines=dict(MOVE_LINE_V13, tax_fields=None, tax_rule=None,
+               values={'quantity': 'quantity', 'price_unit': 'price_unit'}),
+    page_size='chunk_size',
+    limit=True,
+    strict=True,
+    edi_request=True,
+)
+MOVE_SOURCES['account.notas.13'] = dict(
+    MOVE_SOURCES['account.move'],
+    move_type='out_refund',
+    domain=[('type', '=', 'out_refund'), ('state', 'in', ['posted', 'cancel'])],
+    values=dict(MOVE_SOURCES['account.move']['values'], ref='l10n_pe_edi_cancel_reason'),
+    references={
+        'shop': (['journal_id', 'l10n_pe_edi_shop_id'], 'code'),
+        'reversal': (['l10n_pe_edi_reversal_type_id'], 'code'),
+        'origin': (['reversed_entry_id'], 'name'),
+    },
+    lines=MOVE_LINE_V13,
+    update=['l10n_pe_edi_shop_id', 'ref'],
+)
+
+
+def is_timeout(error):
+    """Timeout al conectar o al leer el cuerpo: con el transporte persistente
+    el cuerpo se lee en streaming y urllib3 lanza ReadTimeoutError sin
+    envolverlo en una excepción de requests."""
+    if isinstance(error, URLError):
+        error = error.reason
+    return isinstance(error, (socket.timeout, TimeoutError, requests.exceptions.Timeout, ReadTimeoutError))
+
+
+def split_on_timeout(read, ids):
+    """Ejecuta read(ids); si la llamada excede el timeout divide los ids en dos
+    mitades y reintenta cada una, en lugar de abortar la ejecución."""
+    try:
+        return read(ids)
+    except Exception as error:
+        if len(ids) < 2 or not is_timeout(error):
+            raise
+        _logger.info('===== Timeout con %s registros, se divide el bloque' % len(ids))
+        half = len(ids) // 2
+        return split_on_timeout(read, ids[:half]) + split_on_timeout(read, ids[half:])
+
+
+def connect_remote(params, stats=None, snapshot=None, metadata=None, limiter=None):
+    """Abre una sesión odoorpc propia. Se usa desde hilos, por lo que no debe
+    acceder al entorno de Odoo."""
+    host, port, database, user, password, transport = params
+    odoo = odoorpc.ODOO(host=host, port=port, opener=build_opener(transport, stats, snapshot, metadata, limiter))
+    odoo.config['timeout'] = 720
+    odoo.login(database, user, password)
+    return odoo
+
+
+class RemoteReadPool(object):
+    """Ejecuta llamadas remotas independientes en paralelo. Cada hilo abre y
+    reutiliza su propia sesión odoorpc; el número de hilos es el límite de
+    concurrencia configurado en la conexión (json.rpc). Los límites de
+    peticiones los aplica el limitador compartido."""
+
+    def __init__(self, params, max_workers, stats=None, snapshot=None, metadata=None, limiter=None):
+        self.params = params
+        self.stats = stats
+        self.snapshot = snapshot
+        self.metadata = metadata
+        self.limiter = limiter
+        self.max_workers = max(max_workers or 1, 1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get_session(self):
+        odoo = getattr(self._local, 'odoo', None)
+        if odoo is None:
+            odoo = connect_remote(self.params, self.stats, self.snapshot, self.metadata, self.limiter)
+            self._local.odoo = odoo
+            with self._lock:
+                self._sessions.append(odoo)
+        return odoo
+
+    def _execute(self, remote_model, method, args, kwargs):
+        odoo = self._get_session()
+        if 'context' in kwargs:
+            kwargs = dict(kwargs, context=dict(odoo.env.context, **kwargs['context']))
+        if method == 'read':
+            return split_on_timeout(
+                lambda ids: odoo.execute_kw(remote_model, method, [ids] + list(args[1:]), kwargs),
+                list(args[0]))
+        return odoo.execute_kw(remote_model, method, list(args), kwargs)
+
+    def submit(self, remote_model, method, *args, **kwargs):
+        """Encola la llamada y devuelve un Future con su resultado."""
+        return self._executor.submit(self._execute, remote_model, method, args, kwargs)
+
+    def read(self, remote_model, ids, fields_list, batch_size=0, **kwargs):
+        """Lee los ids en sub-bloques concurrentes y devuelve un Future por
+        sub-bloque; use results() para unirlos."""
+        ids = list(ids)
+        batch_size = batch_size or len(ids) or 1
+        return [
+            self.submit(remote_model, 'read', ids[i:i + batch_size], fields_list, **kwargs)
+            for i in range(0, len(ids), batch_size)
+        ]
+
+    @staticmethod
+    def results(futures):
+        result = []
+        for future in futures:
+            result.extend(future.result())
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for odoo in self._sessions:
+            with contextlib.suppress(Exception):
+                odoo.close()
+        self._sessions = []
+
 
 class SyncDataWizard(models.TransientModel):
     _name = "sync.data.wizard"
@@ -41,6 +333,13 @@ class SyncDataWizard(models.TransientModel):
                 'res_model': res_model,
                 'res_id': res_id
             })
+            # Tamaños de bloque recomendados por la última medición de la conexión
+            if res_model == 'json.rpc':
+                conn = self.env['json.rpc'].browse(res_id)
+                if conn.recommended_offset and 'offset' in fields_list:
+                    res['offset'] = conn.recommended_offset
+                if conn.recommended_chunk_size and 'chunk_size' in fields_list:
+                    res['chunk_size'] = conn.recommended_chunk_size
         return res
 
     def get_date_utc(self, date=False):
@@ -87,12 +386,43 @@ class SyncDataWizard(models.TransientModel):
     company_id = fields.Integer(string="Id Empresa")
     start_record = fields.Integer(string="ID inicio")
     end_record = fields.Integer(string="ID fin")
-    update_record = fields.Boolean(string="Actualizar registros")
+    update_record = fields.Boolean(
+        string="Actualizar registros",
+        help="Los registros ya importados se comparan con el origen y solo se escriben los "
+             "campos que cambiaron. En comprobantes y boletas se actualiza la tienda (y el motivo "
+             "en notas); sus importes y líneas no se reescriben por estar publicados, las "
+             "diferencias de importe se registran en el log. Las series no se actualizan: del "
+             "origen solo se leen el nombre y el producto, que las identifican.")
     version_origin = fields.Integer(string="Versión origen", default=13)
     current_version = fields.Integer(string="Versión actual", default=17)
     location_id = fields.Many2one(
         "stock.location", string="Ubicación de Stock")
     chunk_size = fields.Integer(string="Tamaño del Chunk", default=30)
+    adaptive_chunk = fields.Boolean(
+        string="Bloque adaptativo",
+        help="Empieza con bloques pequeños y ajusta el tamaño según el tiempo y los "
+             "bytes por registro medidos, hacia la duración objetivo.")
+    chunk_target_seconds = fields.Integer(string="Duración objetivo (s)", default=60)
+    partner_match = fields.Selection([
+        ('vat', 'RUC/DNI'),
+        ('import_id', 'ID de importación'),
+        ('both', 'RUC/DNI o ID de importación'),
+    ], string="Buscar socios por", default='both', required=True)
+    sync_binaries = fields.Boolean(
+        string="Transferir archivos",
+        default=True,
+        help="Descarga en una etapa aparte los XML/CDR de los comprobantes y las imágenes de los productos."
+    )
+    snapshot_mode = fields.Selection([
+        ('online', 'En línea'),
+        ('export', 'Exportar snapshot'),
+        ('replay', 'Reproducir snapshot'),
+    ], string="Modo", default='online', required=True,
+        help="Exportar snapshot graba las respuestas del servidor externo y descarta los cambios "
+             "locales; reproducir snapshot sincroniza desde esa grabación sin conectarse.")
+    snapshot_id = fields.Many2one(
+        "ir.attachment", string="Snapshot",
+        domain="[('res_model', '=', 'json.rpc'), ('res_id', '=', res_id), ('mimetype', '=', 'application/gzip')]")
 
     @api.onchange("start_date")
     def _onchange_start_date(self):
@@ -100,8 +430,13 @@ class SyncDataWizard(models.TransientModel):
             self.end_date = self._get_end_date(True)
 
     def connect_json_rpc(self, json_rpc_id):
+        self._check_window()
         conn = self.env["json.rpc"].browse(json_rpc_id)
-        odoo = odoorpc.ODOO(host=conn.rpc_host, port=conn.rpc_port)
+        odoo = odoorpc.ODOO(
+            host=conn.rpc_host, port=conn.rpc_port,
+            opener=build_opener(
+                conn.rpc_transport, self._get_transfer_stats(), self._get_snapshot(), self._get_metadata_cache(),
+                self._get_rate_limiter()))
         odoo.config['timeout'] = 720
 
         if any(conn.rpc_database in db for db in odoo.db.list()):
@@ -112,222 +447,545 @@ class SyncDataWizard(models.TransientModel):
                 'La base de datos no existe en el servidor {}.'.format(conn.rpc_database))
 
     def connection_params(self, json_rpc_id):
-        conn = self.env["json.rpc.config"].browse(json_rpc_id)
-        return conn.rpc_host, conn.rpc_port, conn.rpc_database, conn.rpc_user, conn.rpc_password
-
-    def get_journal_id(self, journal_code, all=False):
-        if all:
-            return self.env['account.journal'].search([])
-
-        return self.env['account.journal'].search([
-            ('code', '=', journal_code),
-            ('company_id', '=', self.current_company_id.id)
-        ], limit=1) or False
-
-    def get_account_payment_term_id(self, payment_term_name, all=False):
-        if all:
-            return self.env['account.payment.term'].search([])
-
-        payment_term_id = self.env['account.payment.term'].search([
-            ('name', 'ilike', payment_term_name)
-        ], limit=1)
-
-        if not payment_term_id:
-            payment_term_id = self.env['account.payment.term'].search([
-                ('name', 'ilike', 'Contado')
-            ], limit=1)
-        return payment_term_id and payment_term_id.id
-
-    def get_currency_id(self, currency_name, all=False):
-        if all:
-            return self.env['res.currency'].search([])
+        conn = self.env["json.rpc"].browse(json_rpc_id)
+        return (conn.rpc_host, conn.rpc_port, conn.rpc_database, conn.rpc_user, conn.rpc_password,
+                conn.rpc_transport)
+
+    def _get_transfer_stats(self):
+        """Contador de bytes de la ejecución en curso (ver action_sync)."""
+        return self.env.context.get('rpc_transfer_stats')
+
+    def _get_snapshot(self):
+        """Snapshot que graba o reproduce las peticiones de la ejecución."""
+        return self.env.context.get('rpc_snapshot')
+
+    def _get_metadata_cache(self):
+        """Cache de fields_get de la conexión para la ejecución en curso."""
+        return self.env.context.get('rpc_metadata')
+
+    def _get_rate_limiter(self):
+        """Limitador de la conexión compartido por todas las sesiones de la
+        ejecución en curso."""
+        return self.env.context.get('rpc_limiter')
+
+    def _check_window(self):
+        """Fuera de las ventanas horarias de la conexión lanza
+        OutsideWindowError; se llama antes de cada bloque, con lo anterior ya
+        confirmado."""
+        limiter = self._get_rate_limiter()
+        if limiter and not isinstance(self._get_snapshot(), SnapshotReplay):
+            limiter.check_window()
+
+    def _get_id_map(self, remote_model):
+        """{id remoto: id local} de la conexión para un modelo remoto. Se carga
+        una vez por ejecución (ver action_sync) y se resuelve en memoria."""
+        id_maps = self.env.context.get('rpc_id_maps')
+        if id_maps is None:
+            return self.env['json.rpc.map']._get_map(self.res_id, remote_model)
+        if remote_model not in id_maps:
+            id_maps[remote_model] = self.env['json.rpc.map']._get_map(self.res_id, remote_model)
+        return id_maps[remote_model]
+
+    def _map_remote_ids(self, remote_model, res_model, pairs):
+        """Registra {id remoto: id local} en el mapeo de la conexión."""
+        self.env['json.rpc.map']._register(
+            self.res_id, remote_model, res_model, pairs, self._get_id_map(remote_model))
+
+    def _map_records(self, remote_model, records):
+        """Registra los registros locales recién creados según su import_id."""
+        self._map_remote_ids(remote_model, records._name, {
+            record.import_id: record.id for record in records if record.import_id
+        })
+
+    def _is_snapshot_export(self):
+        return bool(self.env.context.get('rpc_snapshot_export'))
+
+    def _commit(self):
+        """Confirma el bloque procesado. Al exportar un snapshot los cambios
+        locales se descartan al final, así que no se confirma nada."""
+        if not self._is_snapshot_export():
+            self.env.cr.commit()
 
-        return self.env['res.currency'].search([
-            '|',
-            ('name', '=', currency_name),
-            ('name', '=', 'PEN')
-        ], limit=1).id or False
-
-    def get_shop_id(self, shop, all=False):
-        if all:
-            return self.env['l10n_pe_edi.shop'].search([])
-
-        return self.env['l10n_pe_edi.shop'].search([
-            ('code', '=', shop.code)
-        ], limit=1).id or 1
-
-    def get_partner_id(self, partner):
-        partner_obj = self.env['res.partner'].search(
-            [('vat', '=', partner.vat)], limit=1)
-        if partner_obj:
-            return partner_obj.id
-        else:
-            vals = {
-                'name': partner.name,
-                'vat': partner.vat,
-                'street': partner.street,
-                'zip': partner.zip or False,
-                'company_type': 'person' if len(partner.vat) <= 8 else 'company'
+    def _write_changed(self, model, vals_by_id):
+        """Modo actualización: compara en bloque {id local: vals} con los valores
+        locales y escribe solo los campos que cambiaron; los registros con los
+        mismos cambios se escriben con un solo write(). Devuelve la cantidad de
+        registros escritos."""
+        vals_by_id = {res_id: vals for res_id, vals in vals_by_id.items() if res_id and vals}
+        if not vals_by_id:
+            return 0
+        records = self.env[model].browse(list(vals_by_id)).exists()
+        records.fetch(list({field_name for vals in vals_by_id.values() for field_name in vals}))
+
+        groups = {}
+        for record in records:
+            changes = {
+                field_name: value for field_name, value in vals_by_id[record.id].items()
+                if is_changed(record, field_name, value)
             }
+            if changes:
+                key = tuple(sorted((field_name, repr(value)) for field_name, value in changes.items()))
+                groups.setdefault(key, (changes, []))[1].append(record.id)
+        for changes, res_ids in groups.values():
+            self.env[model].browse(res_ids).write(changes)
+
+        written = sum(len(res_ids) for changes, res_ids in groups.values())
+        _logger.info('===== Actualizados %s de %s %s en %s escrituras' % (
+            written, len(vals_by_id), model, len(groups)))
+        return written
+
+    def _check_amount_changes(self, amounts_by_id):
+        """Modo actualización: los importes y líneas de comprobantes publicados
+        no se reescriben. Registra los que cambiaron en el origen para que se
+        revisen a mano; devuelve esos comprobantes."""
+        moves = self.env['account.move'].browse(list(amounts_by_id)).exists()
+        changed = moves.filtered(
+            lambda move: move.currency_id.compare_amounts(move.amount_total, amounts_by_id[move.id] or 0.0))
+        for move in changed:
+            _logger.warning('===== %s: el importe cambió en el origen (%s -> %s), no se actualiza' % (
+                move.name, move.amount_total, amounts_by_id[move.id]))
+        return changed
+
+    def _iter_remote_ids(self, odoo, remote_model, domain, page_size, limit=0):
+        """Recorre los IDs remotos por páginas usando el último id como cursor
+        (id > last_id), sin traer ni ordenar todo el listado en una respuesta.
+        Con adaptive_chunk el tamaño de página se ajusta según lo que tardó el
+        bloque anterior en procesarse."""
+        page_size = page_size or 100
+        # Con snapshot las páginas deben ser las mismas al grabar y al reproducir
+        adaptive = self.adaptive_chunk and not self._get_snapshot()
+        if adaptive:
+            page_size = min(page_size, ADAPTIVE_START_SIZE)
+        stats = self._get_transfer_stats()
+        last_id = 0
+        total = 0
+        while True:
+            size = page_size
+            if limit:
+                size = min(page_size, limit - total)
+                if size <= 0:
+                    break
+            self._check_window()
+            ids = odoo.env[remote_model].search(
+                list(domain) + [('id', '>', last_id)], order='id', limit=size)
+            if not ids:
+                break
+            started = time.monotonic()
+            wire_bytes = stats.wire_bytes if stats else 0
+            yield ids
+            total += len(ids)
+            last_id = ids[-1]
+            if len(ids) < size:
+                break
+            if adaptive:
+                page_size = self._get_adaptive_size(
+                    page_size, len(ids), time.monotonic() - started,
+                    stats.wire_bytes - wire_bytes if stats else 0)
+
+    def _get_adaptive_size(self, size, count, duration, wire_bytes):
+        """Siguiente tamaño de bloque hacia la duración objetivo; como máximo
+        duplica o reduce a la mitad por paso y respeta el límite de bytes."""
+        target = self.chunk_target_seconds or 60
+        new_size = int(target * count / duration) if duration > 0 else size * 2
+        if wire_bytes:
+            new_size = min(new_size, int(ADAPTIVE_MAX_BYTES * count / wire_bytes))
+        new_size = max(1, size // 2, min(new_size, size * 2, ADAPTIVE_MAX_SIZE))
+        if new_size != size:
+            _logger.info('===== Bloque adaptativo %s -> %s (%.1f s, %s bytes, %s registros)' % (
+                size, new_size, duration, wire_bytes, count))
+        return new_size
+
+    def _get_many2one_ids(self, records, field_name):
+        return list({item[field_name][0] for item in records if item.get(field_name)})
+
+    def _read_remote_lookup(self, odoo, remote_model, ids, fields_list, lookup):
+        """Lee bajo demanda solo los IDs remotos que aún no están en el lookup."""
+        missing_ids = [i for i in set(ids) if i and i not in lookup]
+        if missing_ids:
+            for item in odoo.env[remote_model].read(missing_ids, fields_list):
+                lookup[item['id']] = item
+        return lookup
+
+    def _filter_existing_moves(self, odoo, remote_model, remote_ids, name_field, move_type):
+        """Descarta los comprobantes que ya existen localmente: primero los del
+        mapeo de IDs, sin consultar; el resto por import_id o por nombre con una
+        sola lectura remota y una sola búsqueda local."""
+        id_map = self._get_id_map(remote_model)
+        remote_ids = [remote_id for remote_id in remote_ids if remote_id not in id_map]
+        if not remote_ids:
+            return []
+        remote_data = odoo.env[remote_model].read(remote_ids, [name_field])
+        names = [item[name_field] for item in remote_data if item[name_field]]
+        existing = self.env['account.move'].search_read([
+            ('move_type', '=', move_type),
+            '|',
+            ('import_id', 'in', remote_ids),
+            ('name', 'in', names)
+        ], ['import_id', 'name'])
+        existing_import_ids = {item['import_id']: item['id'] for item in existing if item['import_id']}
+        existing_names = {item['name']: item['id'] for item in existing}
+        # Los existentes encontrados por import_id o nombre quedan mapeados
+        self._map_remote_ids(remote_model, 'account.move', {
+            item['id']: existing_import_ids.get(item['id']) or existing_names.get(item[name_field])
+            for item in remote_data
+        })
+        return [
+            item['id'] for item in remote_data
+            if item['id'] not in existing_import_ids and item[name_field] not in existing_names
+        ]
+
+    def _get_name_key(self, name):
+        return unicodedata.normalize("NFC", (name or '').strip().upper())
+
+    def _get_lookup_value(self, record, field_name, lookup, value_field='name'):
+        value = record.get(field_name)
+        if not value:
+            return False
+        return lookup.get(value[0], {}).get(value_field) or False
+
+    def _get_partner_maps(self):
+        """Mapas nombre -> id del tipo de identificación y la geografía local.
+        Se cargan una vez por ejecución y se pasan a _upsert_partners."""
+        partner_maps = {
+            'identification': {},
+            'country': {},
+            'state': {},
+            'city': {},
+            'district': {},
+        }
+        for item in self.env['l10n_latam.identification.type'].search_read(
+                [('l10n_pe_vat_code', '!=', False)], ['l10n_pe_vat_code']):
+            partner_maps['identification'].setdefault(item['l10n_pe_vat_code'], item['id'])
+
+        for item in self.env['res.country'].search_read([], ['name']):
+            partner_maps['country'].setdefault(self._get_name_key(item['name']), item['id'])
+
+        # Estado, ciudad y distrito se indexan por (padre, nombre) y por (False, nombre)
+        geo_models = [
+            ('state', 'res.country.state', 'country_id'),
+            ('city', 'res.city', 'state_id'),
+            ('district', 'l10n_pe.res.city.district', 'city_id'),
+        ]
+        for key, model_name, parent_field in geo_models:
+            for item in self.env[model_name].search_read([], ['name', parent_field]):
+                name_key = self._get_name_key(item['name'])
+                parent_id = item[parent_field] and item[parent_field][0]
+                partner_maps[key].setdefault((parent_id, name_key), item['id'])
+                partner_maps[key].setdefault((False, name_key), item['id'])
+        return partner_maps
+
+    def _prepare_partner_vals(self, partner, partner_maps):
+        vals = {
+            'name': partner['name'],
+            'vat': partner['vat'] or '00000000',
+            'street': partner['street'] or False,
+            'zip': partner['zip'] or False,
+            'company_type': 'person' if partner['vat'] and len(partner['vat']) <= 8 else 'company',
+            'import_id': partner['id'],
+        }
+        vals.update(partner.get('extra_vals') or {})
+
+        identification_id = partner_maps['identification'].get(partner.get('identification_code'))
+        if identification_id:
+            vals['l10n_latam_identification_type_id'] = identification_id
+
+        parent_id = partner_maps['country'].get(self._get_name_key(partner.get('country_name')))
+        if parent_id:
+            vals['country_id'] = parent_id
+
+        geo_fields = [
+            ('state', 'state_name', 'state_id'),
+            ('city', 'city_name', 'city_id'),
+            ('district', 'district_name', 'l10n_pe_district'),
+        ]
+        for key, name_field, field_name in geo_fields:
+            if not partner.get(name_field):
+                break
+            name_key = self._get_name_key(partner[name_field])
+            geo_id = partner_maps[key].get((parent_id, name_key)) or partner_maps[key].get((False, name_key))
+            if not geo_id:
+                break
+            vals[field_name] = geo_id
+            parent_id = geo_id
+        return vals
 
-            if partner.l10n_latam_identification_type_id:
-                catalog_06_id = self.env['l10n_latam.identification.type'].search([
-                    ('l10n_pe_vat_code', '=',
-                     partner.l10n_latam_identification_type_id.code)
-                ], limit=1)
-                if catalog_06_id:
-                    vals.update(
-                        {'l10n_latam_identification_type_id': catalog_06_id.id})
-
-            if partner.country_id:
-                country_id = self.env['res.country'].search([
-                    ('name', '=', partner.country_id.name)
-                ], limit=1)
-                if country_id:
-                    vals.update({'country_id': country_id.id})
+    def _upsert_partners(self, partners, partner_maps, log=False):
+        """Resuelve en bloque una lista de socios remotos normalizados: busca los
+        existentes en una sola consulta (por vat, import_id o ambos según
+        partner_match) y crea los faltantes con un solo create(). Con
+        update_record los existentes se actualizan solo en lo que cambió.
+        Devuelve {id remoto: id local}."""
+        result = {}
+        update_vals = {}
+        partner_map = self._get_id_map('res.partner')
+        for partner in partners:
+            if partner and partner['id'] in partner_map:
+                result[partner['id']] = partner_map[partner['id']]
+                if self.update_record:
+                    update_vals[result[partner['id']]] = self._prepare_partner_vals(partner, partner_maps)
+        partners = [partner for partner in partners if partner and partner['id'] not in result]
+        if not partners:
+            self._write_changed('res.partner', update_vals)
+            return result
+
+        match_import_id = self.partner_match in ('import_id', 'both')
+        match_vat = self.partner_match in ('vat', 'both')
+        domain = []
+        if match_import_id:
+            domain.append(('import_id', 'in', [partner['id'] for partner in partners]))
+        if match_vat:
+            domain.append(('vat', 'in', [partner['vat'] for partner in partners if partner['vat']]))
+        if len(domain) == 2:
+            domain.insert(0, '|')
+
+        existing = self.env['res.partner'].search_read(domain, ['import_id', 'vat'])
+        existing_import_ids = {item['import_id']: item['id'] for item in existing if item['import_id']}
+        existing_vats = {item['vat']: item['id'] for item in existing if item['vat']}
+
+        list_partners = []
+        pending = {}
+        for partner in partners:
+            partner_id = False
+            if match_import_id:
+                partner_id = existing_import_ids.get(partner['id'])
+            if not partner_id and match_vat and partner['vat']:
+                partner_id = existing_vats.get(partner['vat'])
+            if partner_id:
+                result[partner['id']] = partner_id
+                if self.update_record:
+                    update_vals[partner_id] = self._prepare_partner_vals(partner, partner_maps)
+                continue
 
-            if partner.state_id:
-                state_id = self.env['res.country.state'].search([
-                    ('name', '=', partner.state_id.name)
-                ], limit=1)
-                if state_id:
-                    vals.update({'state_id': state_id.id})
+            # Un mismo socio puede repetirse en el bloque (mismo id o mismo vat)
+            key = partner['vat'] if match_vat and partner['vat'] else partner['id']
+            if key not in pending:
+                pending[key] = []
+                list_partners.append(self._prepare_partner_vals(partner, partner_maps))
+            pending[key].append(partner['id'])
+
+        if list_partners:
+            partner_ids = self.env['res.partner'].create(list_partners)
+            for remote_ids, partner_id in zip(pending.values(), partner_ids.ids):
+                for remote_id in remote_ids:
+                    result[remote_id] = partner_id
+
+            if log:
+                self.env['json.rpc.log'].create([{
+                    'rpc_id': self.res_id,
+                    'res_id': vals['import_id'],
+                    'res_model': 'res.partner',
+                    'name': vals['name'],
+                    'date_issue': fields.Date.today(),
+                    'json_data': vals
+                } for vals in list_partners])
+
+            _logger.info('===== Socios creados %s' % len(list_partners))
+        self._write_changed('res.partner', update_vals)
+        self._map_remote_ids('res.partner', 'res.partner', result)
+        return result
+
+    def _read_remote_partners(self, odoo, partner_ids, remote_lookups):
+        """Lee en bloque los socios remotos y los normaliza para _upsert_partners.
+        Los nombres de geografía se leen bajo demanda y quedan en remote_lookups."""
+        partner_ids = list({partner_id for partner_id in partner_ids if partner_id})
+        if not partner_ids:
+            return []
+
+        partner_data = odoo.env['res.partner'].read(
+            partner_ids, ['name', 'vat', 'street', 'zip'] + list(PARTNER_REMOTE_RELATIONS))
+        for field_name, (remote_model, fields_list) in PARTNER_REMOTE_RELATIONS.items():
+            self._read_remote_lookup(
+                odoo, remote_model,
+                self._get_many2one_ids(partner_data, field_name),
+                fields_list, remote_lookups.setdefault(remote_model, {}))
+
+        def value(item, field_name, value_field='name'):
+            remote_model = PARTNER_REMOTE_RELATIONS[field_name][0]
+            return self._get_lookup_value(item, field_name, remote_lookups[remote_model], value_field)
+
+        return [{
+            'id': item['id'],
+            'name': item['name'],
+            'vat': (item['vat'] or '').strip() or False,
+            'street': item['street'] or False,
+            'zip': item['zip'] or False,
+            'identification_code': value(item, 'l10n_latam_identification_type_id', 'l10n_pe_vat_code'),
+            'country_name': value(item, 'country_id'),
+            'state_name': value(item, 'state_id'),
+            'city_name': value(item, 'city_id'),
+            'district_name': value(item, 'l10n_pe_district'),
+        } for item in partner_data]
+
+    def _read_remote_relations(self, odoo, remote_model, records, relations, remote_lookups):
+        """Lee bajo demanda los registros relacionados de records (many2one o
+        x2many) y devuelve {campo: lookup}. El modelo de cada relación se obtiene
+        con fields_get una sola vez por ejecución."""
+        relation_key = ('relations', remote_model)
+        field_relations = remote_lookups.setdefault(relation_key, {})
+        missing = [field_name for field_name in relations if field_name not in field_relations]
+        if missing:
+            for field_name, item in odoo.env[remote_model].fields_get(missing, ['relation', 'type']).items():
+                field_relations[field_name] = (item['relation'], item['type'])
+
+        result = {}
+        for field_name, fields_list in relations.items():
+            relation, field_type = field_relations[field_name]
+            if field_type == 'many2one':
+                ids = self._get_many2one_ids(records, field_name)
+            else:
+                ids = [i for record in records for i in record[field_name]]
+            result[field_name] = self._read_remote_lookup(
+                odoo, relation, ids, fields_list,
+                remote_lookups.setdefault((relation, tuple(fields_list)), {}))
+        return result
+
+    def _get_move_maps(self):
+        """Diarios, plazos de pago, monedas, tiendas, tipos de nota, unidades y
+        productos locales indexados para armar comprobantes sin una búsqueda por
+        registro. Se cargan una vez por ejecución."""
+        payment_terms = self.env['account.payment.term'].search([])
+        default_payment_term = payment_terms.filtered(lambda term: 'CONTADO' in term.name.upper())[:1]
+        products = self.env['product.product'].search([])
+        picking_type = self.env['stock.picking.type']
+        if self.auto_picking:
+            picking_type = picking_type.search([('code', '=', 'outgoing')], limit=1)
+        return {
+            'journal': {
+                journal.code: journal
+                for journal in self.env['account.journal'].search([
+                    ('company_id', '=', self.current_company_id.id)
+                ])
+            },
+            'payment_term': [(self._get_term_key(term.name), term.id) for term in payment_terms],
+            'payment_term_cache': {},
+            'default_payment_term': default_payment_term.id,
+            'currency': {currency.name: currency.id for currency in self.env['res.currency'].search([])},
+            'shop': {shop.code: shop.id for shop in self.env['l10n_pe_edi.shop'].search([])},
+            'reversal_type': {
+                catalog.code: catalog.id for catalog in self.env['l10n_pe_edi.catalog.09'].search([])
+            },
+            'uom': [(self._get_name_key(uom.name), uom.id) for uom in self.env['uom.uom'].search([])],
+            'uom_cache': {},
+            'product': {product.name: product for product in products},
+            'product_code': {product.default_code: product for product in products if product.default_code},
+            'picking_type_id': picking_type.id or 2,
+        }
 
-            if partner.city_id:
-                city_id = self.env['res.city'].search([
-                    ('name', '=', partner.city_id.name)
-                ], limit=1)
-                if city_id:
-                    vals.update({'city_id': city_id.id})
+    def _get_map_uom_id(self, uom_name, move_maps):
+        """Unidad local cuyo nombre contiene los 6 primeros caracteres del
+        nombre remoto, resuelta sobre el mapa precargado."""
+        key = self._get_name_key(uom_name)[:6]
+        if key not in move_maps['uom_cache']:
+            move_maps['uom_cache'][key] = next(
+                (uom_id for name, uom_id in move_maps['uom'] if key in name), 1)
+        return move_maps['uom_cache'][key]
+
+    def _get_term_key(self, name):
+        return ' '.join(self._get_name_key(name).split())
+
+    def _get_map_payment_term_id(self, payment_term_name, move_maps):
+        """Plazo de pago local por nombre sin distinguir mayúsculas ni espacios:
+        primero el nombre igual y si no el primero que lo contiene, como el
+        ilike de la búsqueda original. Los nombres sin equivalente se registran
+        una vez por ejecución y usan el plazo de contado."""
+        key = self._get_term_key(payment_term_name)
+        if not key:
+            return move_maps['default_payment_term']
+        if key not in move_maps['payment_term_cache']:
+            terms = move_maps['payment_term']
+            term_id = next((term_id for name, term_id in terms if name == key), False) or \
+                next((term_id for name, term_id in terms if key in name), False)
+            if not term_id:
+                _logger.warning('===== Plazo de pago sin equivalente local: %s' % payment_term_name)
+            move_maps['payment_term_cache'][key] = term_id or move_maps['default_payment_term']
+        return move_maps['payment_term_cache'][key]
+
+    def _get_origin_move_ids(self, names):
+        """Resuelve en una sola consulta los comprobantes de origen por nombre."""
+        names = list({name for name in names if name})
+        if not names:
+            return {}
+        return {
+            item['name']: item['id']
+            for item in self.env['account.move'].search_read([('name', 'in', names)], ['name'])
+        }
 
-            if partner.l10n_pe_district:
-                district_id = self.env['l10n_pe.res.city.district'].search([
-                    ('name', '=', partner.l10n_pe_district.name)
-                ], limit=1)
-                if district_id:
-                    vals.update({'l10n_pe_district': district_id.id})
-
-            partner_id = self.env['res.partner'].create(vals)
-            return partner_id.id
-
-    def get_partner_id_v13(
-        self,
-        partner,
-        identification_type_lookup=False,
-        res_country_lookup=False,
-        res_state_lookup=False,
-        res_city_lookup=False,
-        res_district_lookup=False
-    ):
-        partner_obj = self.env['res.partner'].search([
-            ('import_id', '=', partner['id'])
-        ], limit=1)
-        if partner_obj:
-            return partner_obj.id
+    def _prepare_move_line(self, line, line_spec, relations, move_maps):
+        """Valores de una línea de comprobante a partir de la línea remota leída
+        con read(), según el mapa de campos line_spec (INVOICE_LINE_V11, ...) y
+        los mapas precargados."""
+        product = line['product_id'] and relations['product_id'].get(line['product_id'][0])
+        product_id = product and (
+            self._get_id_map('product.product').get(product['id'])
+            or move_maps['product'].get(product['name'], self.env['product.product']).id)
+        uom = line[line_spec['uom']]
+        vals = {field: line[remote_field] for field, remote_field in line_spec['values'].items()}
+        vals.update({
+            'product_id': product_id,
+            'product_uom_id': self._get_map_uom_id(uom and uom[1], move_maps),
+        })
+        if line_spec['tax_rule']:
+            taxes = [relations[line_spec['taxes']].get(tax_id) for tax_id in line[line_spec['taxes']]]
+            vals['tax_ids'] = [self.tax_id.id for tax in taxes if tax and line_spec['tax_rule'](tax)]
         else:
-            vals = {
-                'name': partner['name'],
-                'vat': partner['vat'] or '00000000',
-                'street': partner['street'],
-                'zip': partner['zip'] or False,
-                'company_type': 'person' if partner['vat'] and len(partner['vat'] or '') <= 8 else 'company',
-                'import_id': partner['id']
-            }
-
-            if partner['l10n_latam_identification_type_id']:
-                identification_id = partner['l10n_latam_identification_type_id'][0]
-                identification = identification_type_lookup[identification_id]
-                l10n_latam_identification_type_id = self.env['l10n_latam.identification.type'].search([
-                    ('l10n_pe_vat_code', '=',
-                     identification['l10n_pe_vat_code'])
-                ], limit=1)
-                if l10n_latam_identification_type_id:
-                    vals.update(
-                        {'l10n_latam_identification_type_id': l10n_latam_identification_type_id.id})
-
-            if partner['country_id']:
-                country_id = partner['country_id'][0]
-                country = res_country_lookup[country_id]
-                country_id = self.env['res.country'].search([
-                    ('name', '=', country['name'])
-                ], limit=1)
-                if country_id:
-                    vals.update({'country_id': country_id.id})
-
-            if partner['state_id']:
-                state_id = partner['state_id'][0]
-                state = res_state_lookup[state_id]
-                state_id = self.env['res.country.state'].search([
-                    ('name', '=', state['name'])
-                ], limit=1)
-                if state_id:
-                    vals.update({'state_id': state_id.id})
-
-            if partner['city_id']:
-                city_id = partner['city_id'][0]
-                city = res_city_lookup[city_id]
-                city_id = self.env['res.city'].search([
-                    ('name', '=', city['name'])
-                ], limit=1)
-                if city_id:
-                    vals.update({'city_id': city_id.id})
-
-            if partner['l10n_pe_district']:
-                l10n_pe_district_id = partner['l10n_pe_district'][0]
-                l10n_pe_district = res_district_lookup[l10n_pe_district_id]
-                l10n_pe_district_id = self.env['l10n_pe.res.city.district'].search([
-                    ('name', '=', l10n_pe_district['name'])
-                ], limit=1)
-                if l10n_pe_district_id:
-                    vals.update(
-                        {'l10n_pe_district': l10n_pe_district_id.id})
-
-            partner_id = self.env['res.partner'].create(vals)
-            return partner_id.id
-
-    def get_uom_id(self, uom, all=False):
-        if all:
-            return self.env['uom.uom'].search([])
-
-        uom_id = self.env['uom.uom'].search([
-            ('name', 'ilike', uom.name[:6])
-        ], limit=1)
-
-        if uom_id:
-            return uom_id.id
-        return 1
-
-    def get_public_categ_id(self, cate_ids):
-        list_categ_ids = []
-        for record in cate_ids:
-            vals = {}
-            if record.parent_id:
-                parent_id = self.env['product.public.category'].search([
-                    ('name', '=', record.parent_id.name)
-                ], limit=1)
-                if not parent_id:
-                    vals_parent = {
-                        'name': record.parent_id.name
-                    }
-                    parent_id = self.env['product.public.category'].create(
-                        vals_parent)
-
-                vals.update({
-                    'parent_id': parent_id.id
-                })
+            vals['tax_ids'] = [self.tax_id.id]
+        return vals
 
-            categ_id = self.env['product.public.category'].search([
-                ('name', '=', record.name)
-            ], limit=1)
-            if categ_id:
-                list_categ_ids.append(categ_id.id)
-            else:
-                vals.update({
-                    'name': record.name
-                })
-                categ_id = self.env['product.public.category'].create(vals)
-                list_categ_ids.append(categ_id.id)
-        return list_categ_ids
+    def _get_line_read_fields(self, line_spec):
+        fields_list = [line_spec['parent'], 'product_id', line_spec['uom'], line_spec['taxes']]
+        return fields_list + [field for field in line_spec['values'].values() if field not in fields_list]
+
+    def _get_line_relations(self, line_spec):
+        """Relaciones de las líneas a leer con _read_remote_relations."""
+        relations = {'product_id': PRODUCT_REMOTE_FIELDS}
+        if line_spec['tax_rule']:
+            relations[line_spec['taxes']] = line_spec['tax_fields']
+        return relations
+
+    def _get_public_categ_ids_bulk(self, categ_lookup, categ_ids):
+        """Resuelve por nombre las categorías web remotas (y sus padres) con una
+        búsqueda y crea las faltantes. Devuelve {id remoto: id local}."""
+        categories = [categ_lookup[categ_id] for categ_id in set(categ_ids) if categ_id in categ_lookup]
+        if not categories:
+            return {}
+        parent_names = {item['parent_id'][1].split(' / ')[-1] for item in categories if item['parent_id']}
+        names = parent_names | {item['name'] for item in categories}
+        category_obj = self.env['product.public.category']
+        local_ids = {}
+        for item in category_obj.search_read([('name', 'in', list(names))], ['name']):
+            local_ids.setdefault(item['name'], item['id'])
+
+        missing_parents = [name for name in parent_names if name not in local_ids]
+        for category in category_obj.create([{'name': name} for name in missing_parents]):
+            local_ids[category.name] = category.id
+
+        list_categories = []
+        for item in categories:
+            if item['name'] in local_ids or any(vals['name'] == item['name'] for vals in list_categories):
+                continue
+            vals = {'name': item['name']}
+            if item['parent_id']:
+                vals['parent_id'] = local_ids[item['parent_id'][1].split(' / ')[-1]]
+            list_categories.append(vals)
+        for category in category_obj.create(list_categories):
+            local_ids[category.name] = category.id
+        return {item['id']: local_ids[item['name']] for item in categories}
+
+    def _get_attribute_value_ids(self, attribute, names):
+        """Valores del atributo por nombre: una búsqueda y un create para los
+        faltantes. Devuelve {nombre: id}."""
+        names = list(dict.fromkeys(name for name in names if name))
+        value_obj = self.env['product.attribute.value']
+        value_ids = {}
+        for item in value_obj.search_read([
+            ('name', 'in', names),
+            ('attribute_id', '=', attribute.id)
+        ], ['name']):
+            value_ids.setdefault(item['name'], item['id'])
+        missing = [name for name in names if name not in value_ids]
+        for value in value_obj.create([{'name': name, 'attribute_id': attribute.id} for name in missing]):
+            value_ids[value.name] = value.id
+        return value_ids
 
     def get_categ_id(self, categ_id):
         if categ_id:
@@ -358,93 +1016,48 @@ class SyncDataWizard(models.TransientModel):
             categ_id = category_id.id
         return categ_id
 
-    def get_tax_ids(self, tax_ids):
-        list_taxes = []
-        for tax in tax_ids:
-            if tax.einv_type_tax == 'igv' and tax.type_tax_use == 'sale':
-                list_taxes.append(self.tax_id.id)
-        return list_taxes
-
-    def get_tax_ids_v13(self, tax_ids):
-        list_taxes = []
-        for tax in tax_ids:
-            if tax.l10n_pe_edi_tax_code == '1000' and tax.type_tax_use == 'sale' and tax.price_include:
-                list_taxes.append(self.tax_id.id)
-            elif tax.l10n_pe_edi_tax_code == '9997' and tax.type_tax_use == 'sale':
-                list_taxes.append(self.tax_id.id)
-        return list_taxes
-
-    def get_product_id(self, product):
-        if product:
-            product_obj = self.env['product.product'].search([
-                ('name', '=', product['name'])
-            ], limit=1)
-            if product_obj:
-                return product_obj.id
-            else:
-                vals = {
+    def _create_missing_products(self, products, product_cache, code_cache):
+        """Crea con un solo create() los productos remotos que no están en el
+        mapeo de IDs ni en el cache local por nombre o código, sin repetirlos
+        dentro del bloque. Los productos encontrados o creados se agregan al
+        cache y quedan mapeados por su id remoto."""
+        id_map = self._get_id_map('product.product')
+        found = {}
+        pending = {}
+        list_products = []
+        for product in products:
+            if not product or product['id'] in id_map:
+                continue
+            product_id = product_cache.get(product['name']) or (
+                product['default_code'] and code_cache.get(product['default_code']))
+            if product_id:
+                product_cache.setdefault(product['name'], product_id)
+                found[product['id']] = product_id.id
+                continue
+            # Un mismo nombre se crea una sola vez en el bloque
+            if product['name'] not in pending:
+                pending[product['name']] = []
+                list_products.append({
                     'name': product['name'],
                     'list_price': product['list_price'],
                     'detailed_type': product['type'],
                     'standard_price': product['standard_price'],
                     'default_code': product['default_code']
-                }
-                product_id = self.env['product.product'].create(vals)
-                return product_id.id
-        return product
-
-    def create_product_product(self, product):
-        if product:
-            vals = {
-                'name': product['name'],
-                'list_price': product['list_price'],
-                'detailed_type': product['type'],
-                'standard_price': product['standard_price'],
-                'default_code': product['default_code']
-            }
-            product_id = self.env['product.product'].create(vals)
-            return product_id.id
-        return product
-
-    def get_product_id_v17(self, product, all=False):
-        if all:
-            return self.env['product.product'].search([])
-
-        product_obj = self.env['product.product'].search([
-            ('name', '=', product.name)
-        ], limit=1)
-
-        if product_obj:
-            return product_obj.id
-        else:
-            vals = {
-                'name': product.name,
-                'list_price': product.list_price,
-                'detailed_type': product.type,
-                'standard_price': product.standard_price,
-                'default_code': product.default_code
-            }
-            product_id = self.env['product.product'].create(vals)
-            return product_id.id
-
-    def get_reversal_type_id(self, tipo_ncredito_id):
-        if tipo_ncredito_id:
-            return self.env['l10n_pe_edi.catalog.09'].search([
-                ('code', '=', tipo_ncredito_id.code)
-            ], limit=1).id or 1
-        else:
-            return False
-
-    def origin_move_id(self, invoice_number):
-        if invoice_number:
-            return self.env['account.move'].search([
-                ('name', '=', invoice_number)
-            ], limit=1).id or False
-        else:
-            return False
-
-    def action_sync(self):
-        self.ensure_one()
+                })
+            pending[product['name']].append(product['id'])
+
+        if list_products:
+            product_ids = self.env['product.product'].create(list_products)
+            for (name, remote_ids), product_id in zip(pending.items(), product_ids):
+                product_cache[name] = product_id
+                if product_id.default_code:
+                    code_cache.setdefault(product_id.default_code, product_id)
+                for remote_id in remote_ids:
+                    found[remote_id] = product_id.id
+            _logger.info('===== Productos creados %s' % len(list_products))
+        self._map_remote_ids('product.product', 'product.product', found)
+
+    def _get_sync_handler(self):
         sync_handlers = {
             "account.move": self._sync_account_move,
             "account.invoice": self._sync_account_invoice,
@@ -456,881 +1069,556 @@ class SyncDataWizard(models.TransientModel):
             "product.product.ecommerce": self._sync_product_ecommerce,
             "stock.lot": self._sync_stock_lot,
         }
-        handler = sync_handlers.get(self.rpc_model)
+        return sync_handlers.get(self.rpc_model)
+
+    def action_sync(self):
+        """Sincroniza desde el asistente. Fuera de la ventana horaria no espera:
+        lo avanzado queda confirmado y se indica cuándo abre la próxima."""
+        try:
+            return self._sync()
+        except OutsideWindowError as error:
+            raise UserError(str(error))
+
+    def _sync(self):
+        """Ejecuta la sincronización. Fuera de la ventana horaria confirma los
+        bloques terminados y relanza OutsideWindowError."""
+        self.ensure_one()
+        if self.snapshot_mode == 'export':
+            return self._export_snapshot()
+        stats = TransferStats()
+        snapshot = self._load_snapshot() if self.snapshot_mode == 'replay' else None
+        conn = self.env["json.rpc"].browse(self.res_id)
+        metadata = conn._get_metadata_cache()
+        handler = self.with_context(
+            rpc_transfer_stats=stats, rpc_snapshot=snapshot, rpc_metadata=metadata,
+            rpc_limiter=conn._get_rate_limiter(), rpc_id_maps={})._get_sync_handler()
         if handler:
-            handler()
+            try:
+                handler()
+            except OutsideWindowError:
+                # Se detuvo entre bloques: lo anterior ya está completo
+                self._finish_sync(conn, metadata, stats)
+                raise
+            self._finish_sync(conn, metadata, stats)
         else:
             _logger.warning(f"No sync handler for model {self.rpc_model}")
 
+    def _finish_sync(self, conn, metadata, stats):
+        conn._save_metadata_cache(metadata)
+        self._commit()
+        self._log_transfer_stats(stats)
+
+    def _export_snapshot(self):
+        """Fase 1: ejecuta el handler grabando cada respuesta remota en un
+        snapshot JSONL comprimido. Las peticiones se graban con sus ids
+        exactos y dependen de lo creado en los bloques anteriores (socios,
+        productos, mapeo de IDs), por eso esos registros se crean en un
+        savepoint que se descarta al final. Los pasos sin lecturas remotas y
+        con efectos fuera de la transacción (publicar, solicitudes EDI,
+        entregas, secuencias) se omiten; ver _is_snapshot_export."""
+        stats = TransferStats()
+        header = {name: self[name] for name in SNAPSHOT_FIELDS}
+        conn = self.env["json.rpc"].browse(self.res_id)
+        metadata = conn._get_metadata_cache()
+        wizard = self.with_context(
+            rpc_transfer_stats=stats, rpc_snapshot_export=True, rpc_metadata=metadata,
+            rpc_limiter=conn._get_rate_limiter(), rpc_id_maps={})
+        if not wizard._get_sync_handler():
+            raise ValidationError('No hay sincronización para el modelo %s.' % self.rpc_model)
+
+        with tempfile.TemporaryFile() as buffer:
+            recorder = SnapshotRecorder(buffer, header)
+            savepoint = self.env.cr.savepoint()
+            try:
+                wizard.with_context(rpc_snapshot=recorder)._get_sync_handler()()
+            finally:
+                savepoint.close(rollback=True)
+                recorder.close()
+            buffer.seek(0)
+            attachment = self.env['ir.attachment'].create({
+                'name': 'snapshot_%s_%s.jsonl.gz' % (
+                    self.rpc_model, fields.Datetime.now().strftime('%Y%m%d_%H%M%S')),
+                'raw': buffer.read(),
+                'mimetype': 'application/gzip',
+                'res_model': 'json.rpc',
+                'res_id': self.res_id,
+            })
+        _logger.info('===== Snapshot %s con %s respuestas' % (attachment.name, recorder.entries))
+        conn._save_metadata_cache(metadata)
+        self.write({'snapshot_mode': 'replay', 'snapshot_id': attachment.id})
+        self._log_transfer_stats(stats)
+        self.env.cr.commit()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _load_snapshot(self):
+        """Fase 2: lee el snapshot y restaura los parámetros con que se grabó,
+        para que las peticiones coincidan con las respuestas guardadas."""
+        if not self.snapshot_id:
+            raise ValidationError('Seleccione el snapshot a reproducir.')
+        snapshot = SnapshotReplay(self.snapshot_id.raw)
+        if snapshot.header.get('rpc_model') != self.rpc_model:
+            raise ValidationError('El snapshot %s fue exportado para el modelo %s.' % (
+                self.snapshot_id.name, snapshot.header.get('rpc_model')))
+        self.write({name: snapshot.header[name] for name in SNAPSHOT_FIELDS if name in snapshot.header})
+        return snapshot
+
+    def _log_transfer_stats(self, stats):
+        """Bytes en la red frente a bytes decodificados, solo disponible con el
+        transporte persistente comprimido."""
+        if not stats.requests:
+            return
+        vals = {
+            'peticiones': stats.requests,
+            'bytes_red': stats.wire_bytes,
+            'bytes_decodificados': stats.decoded_bytes,
+        }
+        _logger.info('===== Transferencia %s' % vals)
+        self.env['json.rpc.log'].create({
+            'rpc_id': self.res_id,
+            'res_model': self.rpc_model,
+            'name': 'Transferencia %s' % self.rpc_model,
+            'date_issue': fields.Date.today(),
+            'json_data': vals
+        })
+        self._commit()
+
     def _sync_account_move(self):
-        if self.version_origin == 13:
-            self.sync_invoices_v2()
-        else:
-            self.sync_invoices()
+        self._sync_moves('account.move.13' if self.version_origin == 13 else 'account.move')
 
     def _sync_account_invoice(self):
-        json_rpc_id = self.res_id
-        odoo = self.connect_json_rpc(json_rpc_id)
-        record_ids = False
-        local_model = "account.move"
+        self._sync_moves('account.invoice')
 
-        with contextlib.closing(odoo):
-            record_ids = odoo.env[self.rpc_model].search([
-                ('type', '=', 'out_invoice'),
-                ('date_invoice', '>=', self.start_date.strftime('%Y-%m-%d')),
-                ('date_invoice', '<=', self.end_date.strftime('%Y-%m-%d')),
-                ('state', 'in', ['open', 'paid', 'cancel']),
-                ('move_name', 'ilike', self.filter_name)
-            ], order='move_name')
-            records = odoo.env[self.rpc_model].browse(record_ids)
-
-            _logger.info('===== Import %s - %s record_ids %s' % (
-                self.rpc_model,
-                len(record_ids),
-                record_ids
-            ))
-
-            # Buscar existentes
-            for record in records:
-                find_record = self.env[local_model].search([
-                    ('move_type', '=', 'out_invoice'),
-                    '|',
-                    ('import_id', '=', record.id),
-                    ('name', '=', record.move_name)
-                ], limit=1)
-                if find_record:
-                    record_ids.remove(record.id)
+    def _sync_account_notas(self):
+        self._sync_moves('account.notas')
 
-        _logger.info('===== Import sin existentes %s record_ids %s' %
-                     (len(record_ids), record_ids))
+    def _sync_account_notas_13(self):
+        self._sync_moves('account.notas.13')
 
-        limit = len(record_ids)
-        interval = int(limit / self.offset) + (limit % self.offset > 0)
-        row_number = 1
+    def _get_move_source_domain(self, spec):
+        domain = list(spec['domain'])
+        if self.start_date:
+            domain.append((spec['date'], '>=', self.start_date.strftime('%Y-%m-%d')))
+        if self.end_date:
+            domain.append((spec['date'], '<=', self.end_date.strftime('%Y-%m-%d')))
+        if self.filter_name:
+            domain.append((spec['name'], 'ilike', self.filter_name))
+        if spec['company'] and self.company_id:
+            domain.append(('company_id', '=', self.company_id))
+        return domain
+
+    def _get_move_source_fields(self, spec):
+        """Campos remotos de la cabecera que necesita el origen: número, estado,
+        referencias, campos copiados y de la solicitud EDI."""
+        fields_list = [
+            spec['name'], 'state', 'partner_id', 'currency_id', spec['payment_term'], 'invoice_line_ids',
+            'amount_total']
+        fields_list += [path[0] for path, value_field in spec['references'].values()]
+        fields_list += list(spec['values'].values()) + list(spec['request'].values())
+        return list(dict.fromkeys(fields_list))
+
+    def _read_remote_path(self, odoo, remote_model, records, path, value_field, remote_lookups):
+        """Sigue una cadena de many2one remotos (p. ej. diario -> tienda) con una
+        lectura por eslabón para todo el bloque y devuelve {id remoto: valor de
+        value_field en el último registro}."""
+        steps = []
+        model, items = remote_model, records
+        for position, field_name in enumerate(path):
+            next_field = path[position + 1] if position + 1 < len(path) else value_field
+            lookup = self._read_remote_relations(
+                odoo, model, items, {field_name: [next_field]}, remote_lookups)[field_name]
+            steps.append((field_name, lookup))
+            model = remote_lookups[('relations', model)][field_name][0]
+            items = list(lookup.values())
+
+        result = {}
+        for record in records:
+            item = record
+            for field_name, lookup in steps:
+                item = item.get(field_name) and lookup.get(item[field_name][0])
+                if not item:
+                    break
+            result[record['id']] = item and item[value_field] or False
+        return result
+
+    def _prepare_move_vals(self, record, spec, references, lookups, move_maps):
+        """Valores del comprobante local según el mapa de campos del origen.
+        Devuelve False si no hay diario para la serie o, en orígenes estrictos,
+        si falta la moneda o la tienda."""
+        name = record[spec['name']]
+        journal_id = move_maps['journal'].get(name.split('-')[0])
+        if not journal_id:
+            _logger.info('===== Diario no encontrado %s' % name)
+            return False
+        currency_id = move_maps['currency'].get(record['currency_id'] and record['currency_id'][1])
+        shop_id = move_maps['shop'].get(references['shop'].get(record['id']))
+        if spec['strict'] and not (currency_id and shop_id):
+            _logger.info('===== Moneda o tienda no encontrada %s' % name)
+            return False
 
-        for row in range(interval):
-            _logger.info('===== Intervalo %s de %s' % (row + 1, interval))
+        payment_term = record[spec['payment_term']]
+        vals = {field: record[remote_field] or False for field, remote_field in spec['values'].items()}
+        vals.update({
+            'name': name,
+            'move_type': spec['move_type'],
+            'invoice_payment_term_id': self._get_map_payment_term_id(payment_term and payment_term[1], move_maps),
+            'journal_id': journal_id.id,
+            'partner_id': lookups['partner'].get(record['partner_id'] and record['partner_id'][0]),
+            'currency_id': currency_id or move_maps['currency'].get('PEN'),
+            'invoice_line_ids': [
+                (0, 0, self._prepare_move_line(line, spec['lines'], lookups['relations'], move_maps))
+                for line in lookups['lines'].get(record['id'], [])
+            ],
+            'l10n_pe_edi_shop_id': shop_id or 1,
+            'l10n_latam_document_type_id': journal_id.l10n_latam_document_type_id.id,
+            'import_id': record['id'],
+            'auto_post': 'no',
+            'state': 'cancel' if record['state'] in spec['cancel_states'] else 'draft',
+        })
+        if 'reversal' in references:
+            reversal_code = references['reversal'].get(record['id'])
+            vals['l10n_pe_edi_reversal_type_id'] = reversal_code and (
+                move_maps['reversal_type'].get(reversal_code) or 1)
+        if 'origin' in references:
+            vals['l10n_pe_edi_origin_move_id'] = lookups['origin'].get(references['origin'].get(record['id']), False)
+        if self.auto_picking:
+            vals['picking_type_id'] = move_maps['picking_type_id']
+        return vals
 
-            if len(record_ids) > 0:
-                offset_data = record_ids[:self.offset]
-            else:
-                offset_data = []
+    def _sync_moves(self, source):
+        """Pipeline común de comprobantes para un origen de MOVE_SOURCES. Por
+        bloque: descarta existentes, lee cabeceras, líneas (en paralelo) y
+        referencias en lecturas únicas, resuelve todo con mapas precargados y
+        crea los comprobantes con un solo create()."""
+        spec = MOVE_SOURCES[source]
+        line_spec = spec['lines']
+        remote_model = spec['model']
+        name_field = spec['name']
+        header_fields = self._get_move_source_fields(spec)
+        line_fields = self._get_line_read_fields(line_spec)
+
+        odoo = self.connect_json_rpc(self.res_id)
+        pool = self._get_remote_pool()
+        partner_maps = self._get_partner_maps()
+        move_maps = self._get_move_maps()
+        remote_lookups = {}
+        row_number = 1
+        created_count = 0
 
-            odoo = self.connect_json_rpc(json_rpc_id)
-            with contextlib.closing(odoo):
-                records = odoo.env[self.rpc_model].browse(offset_data)
+        with contextlib.closing(odoo), pool:
+            for offset_data in self._iter_remote_ids(
+                    odoo, remote_model, self._get_move_source_domain(spec),
+                    self[spec['page_size']] or 100, spec['limit'] and self.limit or 0):
+                # Buscar existentes; con update_record se releen para actualizarlos
+                remote_ids = offset_data
+                offset_data = self._filter_existing_moves(
+                    odoo, remote_model, remote_ids, name_field, spec['move_type'])
+                _logger.info('===== Import sin existentes %s record_ids %s' %
+                             (len(offset_data), offset_data))
+                id_map = self._get_id_map(remote_model)
+                update_ids = set()
+                if self.update_record:
+                    update_ids = {remote_id for remote_id in remote_ids if remote_id in id_map}
+                if not offset_data and not update_ids:
+                    continue
+
+                records = [
+                    record for record in split_on_timeout(
+                        lambda ids: odoo.env[remote_model].read(ids, header_fields), offset_data + list(update_ids))
+                    if record[name_field]
+                ]
+                # Las líneas se leen en paralelo mientras se resuelven las cabeceras
+                line_futures = pool.read(
+                    line_spec['model'],
+                    [line_id for record in records if record['id'] not in update_ids
+                     for line_id in record['invoice_line_ids']],
+                    line_fields, LINE_READ_BATCH_SIZE)
+
+                references = {
+                    key: self._read_remote_path(odoo, remote_model, records, path, value_field, remote_lookups)
+                    for key, (path, value_field) in spec['references'].items()
+                }
+                lookups = {
+                    'partner': self._upsert_partners(
+                        self._read_remote_partners(
+                            odoo, self._get_many2one_ids(records, 'partner_id'), remote_lookups),
+                        partner_maps),
+                    'origin': self._get_origin_move_ids(references.get('origin', {}).values()),
+                    'lines': {},
+                }
+                lines = pool.results(line_futures)
+                for line in lines:
+                    lookups['lines'].setdefault(line[line_spec['parent']][0], []).append(line)
+                lookups['relations'] = self._read_remote_relations(
+                    odoo, line_spec['model'], lines, self._get_line_relations(line_spec), remote_lookups)
+                self._create_missing_products(
+                    [lookups['relations']['product_id'].get(line['product_id'][0])
+                     for line in lines if line['product_id']],
+                    move_maps['product'], move_maps['product_code'])
 
                 list_records = []
                 list_request = []
+                list_logs = []
+                update_vals = {}
+                update_amounts = {}
                 for record in records:
-                    invoice_number = record.move_name.split('-')
-                    serie = invoice_number[0]
-                    journal_id = self.get_journal_id(serie)
-
-                    if journal_id:
-                        list_invoice_lines = []
-                        for line in record.invoice_line_ids:
-                            vals_line = {
-                                'quantity': line.quantity,
-                                'price_unit': line.price_unit,
-                                'discount': line.discount,
-                                'price_subtotal': line.price_subtotal,
-                                'price_total': line.price_total,
-                                'product_id': self.get_product_id(line.product_id),
-                                'product_uom_id': self.get_uom_id(line.uom_id),
-                                'tax_ids': self.get_tax_ids(line.invoice_line_tax_ids),
-                            }
-                            list_invoice_lines.append((0, 0, vals_line))
-
-                        invoice_state = 'posted'
-                        if record.state in ('open', 'paid'):
-                            invoice_state = 'draft'
-                        elif record.state in ('cancel', 'anulada'):
-                            invoice_state = 'cancel'
-                        else:
-                            invoice_state = 'posted'
-
-                        vals_invoice = {
-                            'name': record.move_name,
-                            'move_type': 'out_invoice',
-                            'invoice_date': fields.Date.to_string(record.date_invoice),
-                            'invoice_date_due': fields.Date.to_string(record.date_due),
-                            'invoice_payment_term_id': self.get_account_payment_term_id(
-                                record.payment_term_id.name
-                            ),
-                            'journal_id': journal_id,
-                            'partner_id': self.get_partner_id(record.partner_id),
-                            'currency_id': self.get_currency_id(record.currency_id),
-                            'invoice_line_ids': list_invoice_lines,
-                            'l10n_pe_edi_shop_id': self.get_shop_id(record.journal_id.shop_id),
-                            'l10n_pe_edi_datetime_invoice': fields.Datetime.to_string(record.datetime_invoice),
-                            'l10n_latam_document_type_id': record.journal_id.edocument_type.code,
-                            'import_id': record.id,
-                            'auto_post': 'no',
-                            'date': fields.Date.to_string(record.date_invoice),
-                            'state': invoice_state,
+                    vals_invoice = self._prepare_move_vals(record, spec, references, lookups, move_maps)
+                    if vals_invoice and record['id'] in update_ids:
+                        update_vals[id_map[record['id']]] = {
+                            field: vals_invoice[field] for field in spec['update'] if field in vals_invoice
                         }
-
-                        if self.auto_picking:
-                            picking_type = self.env['stock.picking.type'].search([
-                                ('code', '=', 'outgoing')
-                            ], limit=1)
-                            vals_invoice.update({
-                                'picking_type_id': picking_type and picking_type.id or 2
-                            })
-
+                        update_amounts[id_map[record['id']]] = record['amount_total']
+                        continue
+                    if vals_invoice:
                         list_records.append(vals_invoice)
 
                         vals_request = {
-                            'res_id': record.id,
+                            'res_id': record['id'],
                             'res_model': 'l10n_pe_edi.request',
-                            'name': record.move_name,
-                            'l10n_pe_xml': record.comprobante_xml,
-                            'l10n_pe_xml_filename': record.xml_filename,
-                            'l10n_pe_cdr': record.comprobante_cdr,
-                            'l10n_pe_cdr_filename': record.cdr_filename,
-                            'l10n_pe_anulada': record.anulada,
-                            'l10n_pe_digest_value': record.digest_value,
+                            'name': record[name_field],
                         }
+                        vals_request.update({
+                            field: record[remote_field] for field, remote_field in spec['request'].items()
+                        })
                         list_request.append(vals_request)
 
+                        list_logs.append({
+                            'rpc_id': self.res_id,
+                            'res_id': record['id'],
+                            'res_model': remote_model,
+                            'name': record[name_field],
+                            'date_issue': fields.Date.context_today(self),
+                            'json_data': vals_invoice
+                        })
+
                     _logger.info('===== %s Import %s %s-%s' % (
                         row_number,
-                        self.rpc_model,
-                        record.id,
-                        record.move_name
+                        remote_model,
+                        record['id'],
+                        record[name_field]
                     ))
 
                     row_number += 1
 
-                    vals_logs = {
-                        'rpc_id': self.res_id,
-                        'res_id': record.id,
-                        'res_model': self.rpc_model,
-                        'name': record.move_name,
-                        'date_issue': fields.Date.today(),
-                        'json_data': vals_invoice
-                    }
-                    self.env['json.rpc.log'].create(vals_logs)
+                self.env['json.rpc.log'].create(list_logs)
+                invoice_ids = self.env['account.move'].create(list_records)
+                self._map_records(remote_model, invoice_ids)
+                self._write_changed('account.move', update_vals)
+                self._check_amount_changes(update_amounts)
+                self._commit()
 
-                invoice_ids = self.env[local_model].create(list_records)
-                self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.action_post()
-
-                        for request in list_request:
-                            if request['res_id'] == invoice.import_id:
-                                if invoice.l10n_pe_edi_request_id:
-                                    invoice.l10n_pe_edi_request_id.ose_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_canceled = invoice.state == 'cancel',
-
-                                    attachment_xml = self.env['ir.attachment'].create({
-                                        'name': request['l10n_pe_xml_filename'],
-                                        'res_id': invoice.l10n_pe_edi_request_id.id,
-                                        'res_model': request['res_model'],
-                                        'datas': request['l10n_pe_xml'],
-                                        'type': 'binary',
-                                    })
-                                    invoice.l10n_pe_edi_request_id.xml_location = attachment_xml.store_fname
-                                    invoice.l10n_pe_edi_request_id.l10n_pe_edi_xml_generated = True
-
-                                    attachment_cdr = self.env['ir.attachment'].create({
-                                        'name': request['l10n_pe_cdr_filename'],
-                                        'res_id': invoice.l10n_pe_edi_request_id.id,
-                                        'res_model': request['res_model'],
-                                        'datas': request['l10n_pe_cdr'],
-                                        'type': 'binary',
-                                    })
-                                    invoice.l10n_pe_edi_request_id.zip_location = attachment_cdr.store_fname
-
-                    self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.payment_state = 'paid'
-                    invoice.amount_residual = 0.0
-                    self.env.cr.commit()
-
-            record_ids = record_ids[self.offset:]
+                self.process_invoices(invoice_ids, list_request, remote_model, pool, spec['edi_request'])
+                created_count += len(invoice_ids)
 
-    def _sync_account_notas(self):
+        _logger.info('===== creados %s registros' % created_count)
+
+    def _sync_res_partner(self):
         json_rpc_id = self.res_id
         odoo = self.connect_json_rpc(json_rpc_id)
-        record_ids = False
-        remote_model = 'account.invoice'
-        local_model = "account.move"
+        page = 0
+        partner_maps = self._get_partner_maps()
+        remote_lookups = {}
+        # Origen v11: tipo de documento en catalog_06_id, provincia y distrito propios
+        remote_relations = {
+            'catalog_06_id': ['code'],
+            'country_id': ['name'],
+            'state_id': ['name'],
+            'province_id': ['name'],
+            'district_id': ['name'],
+        }
 
         with contextlib.closing(odoo):
-            record_ids = odoo.env[remote_model].search([
-                ('type', '=', 'out_refund'),
-                ('date_invoice', '>=', self.start_date.strftime('%Y-%m-%d')),
-                ('date_invoice', '<=', self.end_date.strftime('%Y-%m-%d')),
-                ('state', 'in', ['open', 'paid', 'cancel']),
-                ('move_name', 'ilike', self.filter_name)
-            ], order='move_name')
-            records = odoo.env[remote_model].browse(record_ids)
-
-            _logger.info('===== Import %s - %s record_ids %s' %
-                         (remote_model, len(record_ids), record_ids))
-
-            # Buscar existentes
-            for record in records:
-                find_record = self.env[local_model].search([
-                    ('move_type', '=', 'out_refund'),
-                    '|',
-                    ('import_id', '=', record.id),
-                    ('name', '=', record.move_name)
-                ], limit=1)
-                if find_record:
-                    record_ids.remove(record.id)
-
-        _logger.info('===== Import sin existentes %s record_ids %s' %
-                     (len(record_ids), record_ids))
-
-        limit = len(record_ids)
-        interval = int(limit / self.offset) + (limit % self.offset > 0)
-        row_number = 1
+            relations = odoo.env['res.partner'].fields_get(list(remote_relations), ['relation'])
+
+            for partner_ids in self._iter_remote_ids(odoo, 'res.partner', [], self.offset):
+                page += 1
+                _logger.info('===== Página %s: %s partner_ids' % (page, len(partner_ids)))
+
+                partner_data = odoo.env['res.partner'].read(
+                    partner_ids, ['name', 'vat', 'street', 'zip', 'state'] + list(remote_relations))
+                for field_name, fields_list in remote_relations.items():
+                    self._read_remote_lookup(
+                        odoo, relations[field_name]['relation'],
+                        self._get_many2one_ids(partner_data, field_name),
+                        fields_list, remote_lookups.setdefault(field_name, {}))
+
+                partners = [{
+                    'id': item['id'],
+                    'name': str(item['name']).upper().strip(),
+                    'vat': (item['vat'] or '').strip() or False,
+                    'street': str(item['street']).upper().strip() if item['street'] else False,
+                    'zip': item['zip'] or False,
+                    'identification_code': self._get_lookup_value(
+                        item, 'catalog_06_id', remote_lookups['catalog_06_id'], 'code'),
+                    'country_name': self._get_lookup_value(item, 'country_id', remote_lookups['country_id']),
+                    'state_name': self._get_lookup_value(item, 'state_id', remote_lookups['state_id']),
+                    'city_name': self._get_lookup_value(item, 'province_id', remote_lookups['province_id']),
+                    'district_name': self._get_lookup_value(item, 'district_id', remote_lookups['district_id']),
+                    'extra_vals': {'state': item['state']},
+                } for item in partner_data]
+
+                self._upsert_partners(partners, partner_maps, log=True)
+                self._commit()
 
-        for row in range(interval):
-            _logger.info('===== Intervalo %s de %s' % (row + 1, interval))
+    def _sync_product_product(self):
+        json_rpc_id = self.res_id
+        odoo = self.connect_json_rpc(json_rpc_id)
 
-            if len(record_ids) > 0:
-                offset_data = record_ids[:self.offset]
-            else:
-                offset_data = []
+        domain = []
+        if self.start_record and self.end_record:
+            domain = [
+                ('id', '>=', self.start_record),
+                ('id', '<=', self.end_record)
+            ]
 
-            odoo = self.connect_json_rpc(json_rpc_id)
+        if self.update_record:
+            row_number = 1
             with contextlib.closing(odoo):
-                records = odoo.env[remote_model].browse(offset_data)
-
-                list_records = []
-                list_request = []
-                for record in records:
-                    invoice_number = record.move_name.split('-')
-                    serie = invoice_number[0]
-                    journal_id = self.get_journal_id(serie)
+                # Mismo cursor por id que la creación; de cada página se
+                # actualizan solo los productos ya importados
+                for offset_data in self._iter_remote_ids(odoo, self.rpc_model, domain, self.offset, self.limit):
+                    product_ids = self.env[self.rpc_model].search([('import_id', 'in', offset_data)])
+                    product_lookup = {product.import_id: product.id for product in product_ids}
+                    offset_data = [remote_id for remote_id in offset_data if remote_id in product_lookup]
+                    _logger.info('===== Update %s - %s record_ids' % (self.rpc_model, len(offset_data)))
+                    if not offset_data:
+                        continue
 
-                    if journal_id:
-                        list_invoice_lines = []
-                        for line in record.invoice_line_ids:
-                            vals_line = {
-                                'quantity': line.quantity,
-                                'price_unit': line.price_unit,
-                                'discount': line.discount,
-                                'price_subtotal': line.price_subtotal,
-                                'price_total': line.price_total,
-                                'product_id': self.get_product_id(line.product_id),
-                                'product_uom_id': self.get_uom_id(line.uom_id),
-                                'tax_ids': self.get_tax_ids(line.invoice_line_tax_ids),
-                            }
-                            list_invoice_lines.append((0, 0, vals_line))
+                    records = odoo.env[self.rpc_model].read(offset_data, [
+                        'name',
+                        'tracking',
+                        'company_id',
+                        'public_categ_ids',
+                        'product_template_image_ids'
+                    ])
 
-                        invoice_state = 'posted'
-                        if record.state in ('open', 'paid'):
-                            invoice_state = 'draft'
-                        elif record.state in ('cancel', 'anulada'):
-                            invoice_state = 'cancel'
-                        else:
-                            invoice_state = 'posted'
+                    categ_ids = [categ_id for record in records for categ_id in record['public_categ_ids']]
+                    public_categ_ids = self._get_public_categ_ids_bulk(
+                        self._read_remote_lookup(
+                            odoo, 'product.public.category', categ_ids, ['name', 'parent_id'], {}),
+                        categ_ids)
 
-                        vals_invoice = {
-                            'name': record.move_name,
-                            'move_type': 'out_refund',
-                            'invoice_date': fields.Date.to_string(record.date_invoice),
-                            'invoice_date_due': fields.Date.to_string(record.date_due),
-                            'invoice_payment_term_id': self.get_account_payment_term_id(
-                                record.payment_term_id.name
-                            ),
-                            'journal_id': journal_id,
-                            'partner_id': self.get_partner_id(record.partner_id),
-                            'currency_id': self.get_currency_id(record.currency_id),
-                            'invoice_line_ids': list_invoice_lines,
-                            'l10n_pe_edi_shop_id': self.get_shop_id(record.journal_id.shop_id),
-                            'l10n_pe_edi_datetime_invoice': fields.Datetime.to_string(record.datetime_invoice),
-                            'l10n_latam_document_type_id': record.journal_id.edocument_type.code,
-                            'import_id': record.id,
-                            'auto_post': 'no',
-                            'date': fields.Date.to_string(record.date_invoice),
-                            'state': invoice_state,
-                            'l10n_pe_edi_reversal_type_id': self.get_reversal_type_id(record.tipo_ncredito_id),
-                            'l10n_pe_edi_origin_move_id': self.origin_move_id(
-                                record.invoice_ncredito_id.move_name
-                            )
+                    update_vals = {}
+                    list_images = []
+                    list_logs = []
+                    for record in records:
+                        vals = {
+                            'tracking': record['tracking'],
+                            'company_id': self.company_id,
+                            'public_categ_ids': [(6, 0, [
+                                public_categ_ids[categ_id] for categ_id in record['public_categ_ids']
+                                if categ_id in public_categ_ids
+                            ])],
                         }
+                        update_vals[product_lookup[record['id']]] = vals
 
-                        if self.auto_picking:
-                            picking_type = self.env['stock.picking.type'].search([
-                                ('code', '=', 'outgoing')
-                            ], limit=1)
-                            vals_invoice.update({
-                                'picking_type_id': picking_type and picking_type.id or 2
-                            })
+                        row_number += 1
+                        _logger.info('===== %s Update %s %s-%s' %
+                                     (row_number, self.rpc_model, record['id'], record['name']))
 
-                        list_records.append(vals_invoice)
+                        for image_id in record['product_template_image_ids']:
+                            list_images.append({
+                                'import_id': record['id'],
+                                'image_id': image_id
+                            })
 
-                        vals_request = {
-                            'res_id': record.id,
-                            'res_model': 'l10n_pe_edi.request',
-                            'name': record.move_name,
-                            'l10n_pe_xml': record.comprobante_xml,
-                            'l10n_pe_xml_filename': record.xml_filename,
-                            'l10n_pe_cdr': record.comprobante_cdr,
-                            'l10n_pe_cdr_filename': record.cdr_filename,
-                            'l10n_pe_anulada': record.anulada,
-                            'l10n_pe_digest_value': record.digest_value,
-                        }
-                        list_request.append(vals_request)
+                        list_logs.append({
+                            'rpc_id': self.res_id,
+                            'name': record['name'],
+                            'date_issue': fields.Date.today(),
+                            'json_data': vals
+                        })
 
-                    _logger.info('===== %s Import %s %s-%s' % (
-                        row_number,
-                        remote_model,
-                        record.id,
-                        record.move_name
-                    ))
+                    self._write_changed(self.rpc_model, update_vals)
 
-                    row_number += 1
+                    # Actualiza solo las imagenes que cambiaron en el origen
+                    self._sync_product_images(odoo, product_ids, self.rpc_model, list_images)
 
-                    vals_logs = {
-                        'rpc_id': self.res_id,
-                        'res_id': record.id,
-                        'res_model': remote_model,
-                        'name': record.move_name,
-                        'date_issue': fields.Date.today(),
-                        'json_data': vals_invoice
-                    }
-                    self.env['json.rpc.log'].create(vals_logs)
+                    self.env['json.rpc.log'].create(list_logs)
+                    self._commit()
+        else:
+            row_number = 1
 
-                invoice_ids = self.env[local_model].create(list_records)
-                self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.action_post()
-
-                        for request in list_request:
-                            if request['res_id'] == invoice.import_id:
-                                if invoice.l10n_pe_edi_request_id:
-                                    invoice.l10n_pe_edi_request_id.ose_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_canceled = invoice.state == 'cancel',
-
-                                    if request['l10n_pe_xml']:
-                                        attachment_xml = self.env['ir.attachment'].create({
-                                            'name': request['l10n_pe_xml_filename'],
-                                            'res_id': invoice.l10n_pe_edi_request_id.id,
-                                            'res_model': request['res_model'],
-                                            'datas': request['l10n_pe_xml'],
-                                            'type': 'binary',
-                                        })
-                                        invoice.l10n_pe_edi_request_id.xml_location = attachment_xml.store_fname
-                                        invoice.l10n_pe_edi_request_id.l10n_pe_edi_xml_generated = True
-
-                                    if request['l10n_pe_cdr']:
-                                        attachment_cdr = self.env['ir.attachment'].create({
-                                            'name': request['l10n_pe_cdr_filename'],
-                                            'res_id': invoice.l10n_pe_edi_request_id.id,
-                                            'res_model': request['res_model'],
-                                            'datas': request['l10n_pe_cdr'],
-                                            'type': 'binary',
-                                        })
-                                        invoice.l10n_pe_edi_request_id.zip_location = attachment_cdr.store_fname
-
-                    self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.payment_state = 'paid'
-                    invoice.amount_residual = 0.0
-                    self.env.cr.commit()
-
-            record_ids = record_ids[self.offset:]
+            with contextlib.closing(odoo):
+                for offset_data in self._iter_remote_ids(odoo, self.rpc_model, domain, self.offset, self.limit):
+                    # Buscar existentes: los mapeados sin consultar, el resto por
+                    # import_id o código
+                    id_map = self._get_id_map(self.rpc_model)
+                    offset_data = [remote_id for remote_id in offset_data if remote_id not in id_map]
+                    if not offset_data:
+                        continue
+                    remote_data = odoo.env[self.rpc_model].read(offset_data, ['default_code'])
+                    codes = [item['default_code'] for item in remote_data if item['default_code']]
+                    existing = self.env[self.rpc_model].search_read([
+                        '|',
+                        ('import_id', 'in', offset_data),
+                        ('default_code', 'in', codes)
+                    ], ['import_id', 'default_code'])
+                    existing_import_ids = {item['import_id']: item['id'] for item in existing if item['import_id']}
+                    existing_codes = {item['default_code']: item['id'] for item in existing if item['default_code']}
+                    self._map_remote_ids(self.rpc_model, self.rpc_model, {
+                        item['id']: existing_import_ids.get(item['id']) or existing_codes.get(item['default_code'])
+                        for item in remote_data
+                    })
+                    offset_data = [
+                        item['id'] for item in remote_data
+                        if item['id'] not in existing_import_ids and item['default_code'] not in existing_codes
+                    ]
 
-    def _sync_account_notas_13(self):
-        json_rpc_id = self.res_id
-        odoo = self.connect_json_rpc(json_rpc_id)
-        record_ids = False
-        remote_model = 'account.move'
-        local_model = "account.move"
+                    _logger.info('===== Import sin existentes %s record_ids %s' %
+                                 (len(offset_data), offset_data))
+                    if not offset_data:
+                        continue
 
-        with contextlib.closing(odoo):
-            record_ids = odoo.env[remote_model].search([
-                ('type', '=', 'out_refund'),
-                ('invoice_date', '>=', self.start_date.strftime('%Y-%m-%d')),
-                ('invoice_date', '<=', self.end_date.strftime('%Y-%m-%d')),
-                ('state', 'in', ['posted', 'cancel']),
-                ('name', 'ilike', self.filter_name),
-                ('company_id', '=', self.company_id)
-            ], order='name')
-            records = odoo.env[remote_model].browse(record_ids)
-
-            _logger.info('===== Import %s - %s record_ids %s' %
-                         (remote_model, len(record_ids), record_ids))
-
-            # Buscar existentes
-            for record in records:
-                find_record = self.env[local_model].search([
-                    ('move_type', '=', 'out_refund'),
-                    '|',
-                    ('import_id', '=', record.id),
-                    ('name', '=', record.name)
-                ], limit=1)
-                if find_record:
-                    record_ids.remove(record.id)
+                    records = self._get_remote_env(odoo, bin_size=True)[self.rpc_model].browse(offset_data)
 
-        _logger.info('===== Import sin existentes %s record_ids %s' %
-                     (len(record_ids), record_ids))
+                    list_records = []
+                    list_images = []
+                    for record in records:
+                        vals = {
+                            'name': record.name,
+                            'list_price': record.list_price,
+                            'detailed_type': record.type,
+                            'standard_price': record.standard_price,
+                            'default_code': record.default_code,
+                            'categ_id': self.get_categ_id(record.categ_id),
+                            'import_id': record.id,
+                            'taxes_id': self.tax_id._ids
+                        }
 
-        limit = len(record_ids)
-        interval = int(limit / self.offset) + (limit % self.offset > 0)
-        row_number = 1
+                        row_number += 1
+                        list_records.append(vals)
 
-        for row in range(interval):
-            _logger.info('===== Intervalo %s de %s' % (row + 1, interval))
+                        _logger.info('===== %s Import %s %s-%s' %
+                                     (row_number, self.rpc_model, record.id, record.name))
 
-            if len(record_ids) > 0:
-                offset_data = record_ids[:self.offset]
-            else:
-                offset_data = []
+                        for image_id in record.product_template_image_ids.ids:
+                            list_images.append({
+                                'import_id': record.id,
+                                'image_id': image_id
+                            })
 
-            odoo = self.connect_json_rpc(json_rpc_id)
-            with contextlib.closing(odoo):
-                records = odoo.env[remote_model].browse(offset_data)
-
-                list_records = []
-                list_request = []
-                for record in records:
-                    invoice_number = record.name.split('-')
-                    serie = invoice_number[0]
-                    journal_id = self.get_journal_id(serie)
-
-                    if journal_id:
-                        list_invoice_lines = []
-                        for line in record.invoice_line_ids:
-                            vals_line = {
-                                'quantity': line.quantity,
-                                'price_unit': line.price_unit,
-                                'discount': line.discount,
-                                'price_subtotal': line.price_subtotal,
-                                'price_total': line.price_total,
-                                'product_id': self.get_product_id(line.product_id),
-                                'product_uom_id': self.get_uom_id(line.product_uom_id),
-                                'tax_ids': self.get_tax_ids(line.tax_ids),
-                            }
-                            list_invoice_lines.append((0, 0, vals_line))
-
-                        invoice_state = 'draft'
-                        if record.state == 'cancel':
-                            invoice_state = 'cancel'
-
-                        vals_invoice = {
-                            'name': record.name,
-                            'move_type': 'out_refund',
-                            'invoice_date': fields.Date.to_string(record.invoice_date),
-                            'invoice_date_due': fields.Date.to_string(record.invoice_date_due),
-                            'invoice_payment_term_id': self.get_account_payment_term_id(
-                                record.invoice_payment_term_id.name
-                            ),
-                            'journal_id': journal_id.id,
-                            'partner_id': self.get_partner_id(record.partner_id),
-                            'currency_id': self.get_currency_id(record.currency_id),
-                            'invoice_line_ids': list_invoice_lines,
-                            'l10n_pe_edi_shop_id': self.get_shop_id(record.journal_id.l10n_pe_edi_shop_id),
-                            'l10n_pe_edi_datetime_invoice': fields.Datetime.to_string(record.datetime_invoice),
-                            'l10n_latam_document_type_id': journal_id.l10n_latam_document_type_id.id,
-                            'import_id': record.id,
-                            'auto_post': 'no',
-                            'date': fields.Date.to_string(record.invoice_date),
-                            'state': invoice_state,
-                            'l10n_pe_edi_reversal_type_id': self.get_reversal_type_id(
-                                record.l10n_pe_edi_reversal_type_id
-                            ),
-                            'l10n_pe_edi_origin_move_id': self.origin_move_id(record.reversed_entry_id.name),
-                            'ref': record.l10n_pe_edi_cancel_reason or ''
-                        }
-
-                        if self.auto_picking:
-                            picking_type = self.env['stock.picking.type'].search([
-                                ('code', '=', 'outgoing')
-                            ], limit=1)
-                            vals_invoice.update({
-                                'picking_type_id': picking_type and picking_type.id or 2
-                            })
-
-                        list_records.append(vals_invoice)
-
-                        vals_request = {
-                            'res_id': record.id,
-                            'res_model': 'l10n_pe_edi.request',
-                            'name': record.name,
-                            'l10n_pe_xml': record.comprobante_xml,
-                            'l10n_pe_xml_filename': record.xml_filename,
-                            'l10n_pe_cdr': record.comprobante_cdr,
-                            'l10n_pe_cdr_filename': record.cdr_filename,
-                            'l10n_pe_anulada': record.anulada,
-                            'l10n_pe_digest_value': record.digest_value,
-                        }
-                        list_request.append(vals_request)
-
-                    _logger.info('===== %s Import %s %s-%s' % (
-                        row_number,
-                        remote_model,
-                        record.id,
-                        record.name
-                    ))
-
-                    row_number += 1
-
-                    vals_logs = {
-                        'rpc_id': self.res_id,
-                        'res_id': record.id,
-                        'res_model': remote_model,
-                        'name': record.name,
-                        'date_issue': fields.Date.context_today(self),
-                        'json_data': vals_invoice
-                    }
-                    self.env['json.rpc.log'].create(vals_logs)
-
-                invoice_ids = self.env[local_model].create(list_records)
-                self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.action_post()
-
-                        for request in list_request:
-                            if request['res_id'] == invoice.import_id:
-                                if invoice.l10n_pe_edi_request_id:
-                                    invoice.l10n_pe_edi_request_id.ose_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_canceled = invoice.state == 'cancel',
-
-                                    if request['l10n_pe_xml']:
-                                        attachment_xml = self.env['ir.attachment'].create({
-                                            'name': request['l10n_pe_xml_filename'],
-                                            'res_id': invoice.l10n_pe_edi_request_id.id,
-                                            'res_model': request['res_model'],
-                                            'datas': request['l10n_pe_xml'],
-                                            'type': 'binary',
-                                        })
-                                        invoice.l10n_pe_edi_request_id.xml_location = attachment_xml.store_fname
-                                        invoice.l10n_pe_edi_request_id.l10n_pe_edi_xml_generated = True
-
-                                    if request['l10n_pe_cdr']:
-                                        attachment_cdr = self.env['ir.attachment'].create({
-                                            'name': request['l10n_pe_cdr_filename'],
-                                            'res_id': invoice.l10n_pe_edi_request_id.id,
-                                            'res_model': request['res_model'],
-                                            'datas': request['l10n_pe_cdr'],
-                                            'type': 'binary',
-                                        })
-                                        invoice.l10n_pe_edi_request_id.zip_location = attachment_cdr.store_fname
-
-                    self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.payment_state = 'paid'
-                    invoice.amount_residual = 0.0
-                    self.env.cr.commit()
-
-            record_ids = record_ids[self.offset:]
-
-    def _sync_res_partner(self):
-        json_rpc_id = self.res_id
-        odoo = self.connect_json_rpc(json_rpc_id)
-        partner_ids = False
-
-        with contextlib.closing(odoo):
-            partner_ids = odoo.env['res.partner'].search([], order='name')
-            records = odoo.env['res.partner'].browse(partner_ids)
-
-            _logger.info('===== Import %s partner_ids %s' %
-                         (len(partner_ids), partner_ids))
-
-            # Buscar existentes
-            for record in records:
-                partner_id = self.env['res.partner'].search([
-                    '|',
-                    ('import_id', '=', record.id),
-                    ('vat', '=', record.vat)
-                ], limit=1)
-                if partner_id:
-                    partner_ids.remove(record.id)
-
-        limit = len(partner_ids)
-        interval = int(limit / self.offset) + (limit % self.offset > 0)
-        row_number = 1
-
-        _logger.info('===== Import sin existentes %s partner_ids %s' %
-                     (len(partner_ids), partner_ids))
-
-        for row in range(interval):
-            _logger.info('===== Intervalo %s de %s' % (row + 1, interval))
-
-            if len(partner_ids) > 0:
-                offset_data = partner_ids[:self.offset]
-            else:
-                offset_data = []
-
-            odoo = self.connect_json_rpc(json_rpc_id)
-            with contextlib.closing(odoo):
-                partners = odoo.env['res.partner'].browse(offset_data)
-
-                list_partners = []
-                for partner in partners:
-                    vals = {
-                        'name': str(partner.name).upper().strip(),
-                        'vat': str(partner.vat).strip(),
-                        'street': str(partner.street).upper().strip(),
-                        'zip': partner.zip or False,
-                        'company_type': 'person' if len(partner.vat) <= 8 else 'company',
-                        'import_id': partner.id,
-                        'state': partner.state
-                    }
-
-                    if partner.catalog_06_id:
-                        catalog_06_id = self.env['l10n_latam.identification.type'].search(
-                            [('l10n_pe_vat_code', '=', partner.catalog_06_id.code)], limit=1)
-                        if catalog_06_id:
-                            vals.update(
-                                {'l10n_latam_identification_type_id': catalog_06_id.id})
-
-                    if partner.country_id:
-                        country_id = self.env['res.country'].search(
-                            [('name', '=', partner.country_id.name)], limit=1)
-                        if country_id:
-                            vals.update({'country_id': country_id.id})
-
-                            if partner.state_id:
-                                state_id = self.env['res.country.state'].search([
-                                    ('name', 'ilike', partner.state_id.name),
-                                    ('country_id', '=', country_id.id),
-                                ], limit=1)
-                                if state_id:
-                                    vals.update({'state_id': state_id.id})
-
-                                    if partner.province_id:
-                                        city_id = self.env['res.city'].search([
-                                            ('name', 'ilike',
-                                             partner.province_id.name),
-                                            ('state_id', '=', state_id.id),
-                                        ], limit=1)
-                                        if city_id:
-                                            vals.update(
-                                                {'city_id': city_id.id})
-
-                                            if partner.district_id:
-                                                district_id = self.env['l10n_pe.res.city.district'].search([
-                                                    ('name', 'ilike',
-                                                     partner.district_id.name),
-                                                    ('city_id', '=',
-                                                     city_id.id),
-                                                ], limit=1)
-                                                if district_id:
-                                                    vals.update(
-                                                        {'l10n_pe_district': district_id.id})
-
-                    row_number += 1
-                    list_partners.append(vals)
-
-                    _logger.info('===== Import %s Partner %s-%s' %
-                                 (row_number, partner.id, partner.vat))
-
-                    vals_logs = {
-                        'rpc_id': self.res_id,
-                        'name': partner.name,
-                        'date_issue': fields.Date.today(),
-                        'json_data': vals
-                    }
-                    self.env['json.rpc.log'].create(vals_logs)
-
-                self.env['res.partner'].create(list_partners)
-                self.env.cr.commit()
-
-            partner_ids = partner_ids[self.offset:]
-
-    def _sync_product_product(self):
-        json_rpc_id = self.res_id
-        odoo = self.connect_json_rpc(json_rpc_id)
-        record_ids = False
-
-        if self.update_record:
-            record_ids = self.env[self.rpc_model].search([
-                ('import_id', '!=', False)
-            ], order='import_id', limit=self.limit).mapped('import_id')
-
-            limit = len(record_ids)
-            interval = int(limit / self.offset) + (limit % self.offset > 0)
-            row_number = 1
-
-            _logger.info('===== Update %s - %s record_ids' %
-                         (self.rpc_model, len(record_ids)))
-
-            for row in range(interval):
-                _logger.info('===== Intervalo %s de %s' %
-                             (row + 1, interval))
-
-                if len(record_ids) > 0:
-                    offset_data = record_ids[:self.offset]
-                else:
-                    offset_data = []
-
-                odoo = self.connect_json_rpc(json_rpc_id)
-                list_records = []
-                with contextlib.closing(odoo):
-                    records = odoo.execute(self.rpc_model, 'read', offset_data, [
-                        'name',
-                        'tracking',
-                        'company_id',
-                        'public_categ_ids'
-                    ], {'limit': self.offset})
-
-                    for record in records:
-                        categ_record = odoo.env['product.public.category'].browse(
-                            record['public_categ_ids'])
-                        vals = {
-                            'import_id': record['id'],
-                            'tracking': record['tracking'],
-                            'company_id': self.company_id,
-                            'public_categ_ids': self.get_public_categ_id(categ_record),
-                        }
-
-                        row_number += 1
-                        list_records.append(vals)
-
-                        _logger.info('===== %s Update %s %s-%s' %
-                                     (row_number, self.rpc_model, record['id'], record['name']))
-
-                        vals_logs = {
-                            'rpc_id': self.res_id,
-                            'name': record['name'],
-                            'date_issue': fields.Date.today(),
-                            'json_data': vals
-                        }
-
-                for record in list_records:
-                    product_id = self.env[self.rpc_model].search([
-                        ('import_id', '=', record['import_id'])
-                    ], limit=1)
-
-                    if product_id:
-                        product_id.write({
-                            'tracking': record['tracking'],
-                            'company_id': self.company_id,
-                            'public_categ_ids': record['public_categ_ids'],
-                        })
-
-                self.env['json.rpc.log'].create(vals_logs)
-                self.env.cr.commit()
-
-                record_ids = record_ids[self.offset:]
-        else:
-            with contextlib.closing(odoo):
-                if self.start_record and self.end_record:
-                    record_ids = odoo.env[self.rpc_model].search([
-                        ('id', '>=', self.start_record),
-                        ('id', '<=', self.end_record)
-                    ], limit=self.limit, order='name')
-                else:
-                    record_ids = odoo.env[self.rpc_model].search(
-                        [], limit=self.limit, order='name')
-
-                records = odoo.env[self.rpc_model].browse(record_ids)
-
-                _logger.info('===== Import %s - %s record_ids %s' %
-                             (self.rpc_model, len(record_ids), record_ids))
-
-                # Buscar existentes
-                for record in records:
-                    find_record = self.env[self.rpc_model].search([
-                        '|',
-                        ('import_id', '=', record.id),
-                        '&',
-                        ('default_code', '=', record.default_code),
-                        ('default_code', '!=', "")
-                    ], limit=1)
-                    if find_record:
-                        record_ids.remove(record.id)
-
-            limit = len(record_ids)
-            interval = int(limit / self.offset) + (limit % self.offset > 0)
-            row_number = 1
-
-            _logger.info('===== Import sin existentes %s record_ids %s' %
-                         (len(record_ids), record_ids))
-
-            for row in range(interval):
-                _logger.info('===== Intervalo %s de %s' %
-                             (row + 1, interval))
-
-                if len(record_ids) > 0:
-                    offset_data = record_ids[:self.offset]
-                else:
-                    offset_data = []
-
-                odoo = self.connect_json_rpc(json_rpc_id)
-                with contextlib.closing(odoo):
-                    records = odoo.env[self.rpc_model].browse(offset_data)
-
-                    list_records = []
-                    list_images = []
-                    for record in records:
-                        vals = {
-                            'name': record.name,
-                            'list_price': record.list_price,
-                            'detailed_type': record.type,
-                            'standard_price': record.standard_price,
-                            'default_code': record.default_code,
-                            'image_1920': record.image_1920,
-                            'categ_id': self.get_categ_id(record.categ_id),
-                            'import_id': record.id,
-                            'taxes_id': self.tax_id._ids
-                        }
-
-                        row_number += 1
-                        list_records.append(vals)
-
-                        _logger.info('===== %s Import %s %s-%s' %
-                                     (row_number, self.rpc_model, record.id, record.name))
-
-                        for image in record.product_template_image_ids:
-                            vals_image = {
-                                'import_id': record.id,
-                                'image_1920': image.image_1920
-                            }
-                            list_images.append(vals_image)
-
-                        vals_logs = {
-                            'rpc_id': self.res_id,
-                            'name': record.name,
-                            'date_issue': fields.Date.today(),
-                            'json_data': vals
-                        }
-                        self.env['json.rpc.log'].create(vals_logs)
+                        vals_logs = {
+                            'rpc_id': self.res_id,
+                            'name': record.name,
+                            'date_issue': fields.Date.today(),
+                            'json_data': vals
+                        }
+                        self.env['json.rpc.log'].create(vals_logs)
 
                     records_ids = self.env[self.rpc_model].create(
                         list_records)
-                    self.env.cr.commit()
+                    self._map_records(self.rpc_model, records_ids)
+                    self._commit()
 
                     # Agrega imagenes al producto
-                    if list_images:
-                        for record in records_ids:
-                            list_template_images = []
-                            for image in list_images:
-                                if record.import_id == image['import_id']:
-                                    vals_image = {
-                                        'name': record.name,
-                                        'product_tmpl_id': record.id,
-                                        'image_1920': image['image_1920']
-                                    }
-                                    list_template_images.append(
-                                        (0, 0, vals_image))
-                            record.product_template_image_ids = list_template_images
-
-                record_ids = record_ids[self.offset:]
+                    self._sync_product_images(odoo, records_ids, self.rpc_model, list_images)
+                    self._commit()
 
     def _sync_sale_order(self):
         json_rpc_id = self.res_id
@@ -1343,370 +1631,353 @@ class SyncDataWizard(models.TransientModel):
                 "Debe ingresar la fecha de inicio y la fecha fin")
 
         odoo = self.connect_json_rpc(json_rpc_id)
-        record_ids = False
         local_model = "account.move"
+
+        domain = [
+            ('name', 'ilike', 'B'),
+            ('date_invoice', '>=', self.start_date.strftime('%Y-%m-%d')),
+            ('date_invoice', '<=', self.end_date.strftime('%Y-%m-%d')),
+            ('state', 'in', ['sale', 'done'])
+        ]
+        row_number = 1
+        partner_maps = self._get_partner_maps()
+        move_maps = self._get_move_maps()
         picking_type = self.env['stock.picking.type'].search(
             [('code', '=', 'outgoing')], limit=1)
+        remote_lookups = {}
 
         with contextlib.closing(odoo):
-            record_ids = odoo.env[self.rpc_model].search([
-                ('name', 'ilike', 'B'),
-                ('date_invoice', '>=', self.start_date.strftime('%Y-%m-%d')),
-                ('date_invoice', '<=', self.end_date.strftime('%Y-%m-%d')),
-                ('state', 'in', ['sale', 'done'])
-            ], order='name')
-            records = odoo.env[self.rpc_model].browse(record_ids)
-
-            _logger.info('===== Import %s - %s record_ids %s' %
-                         (self.rpc_model, len(record_ids), record_ids))
-
-            # Buscar existentes
-            for record in records:
-                find_record = self.env[local_model].search([
-                    ('move_type', '=', 'out_invoice'),
-                    ('import_id', '=', record.id),
-                    ('name', '=', record.name)
-                ], limit=1)
-                if find_record:
-                    record_ids.remove(record.id)
-
-        _logger.info('===== Import sin existentes %s record_ids %s' %
-                     (len(record_ids), record_ids))
-
-        limit = len(record_ids)
-        interval = int(limit / self.offset) + (limit % self.offset > 0)
-        row_number = 1
-
-        for row in range(interval):
-            _logger.info('===== Intervalo %s de %s' % (row + 1, interval))
-
-            if len(record_ids) > 0:
-                offset_data = record_ids[:self.offset]
-            else:
-                offset_data = []
+            for offset_data in self._iter_remote_ids(odoo, self.rpc_model, domain, self.offset):
+                # Buscar existentes; con update_record se releen para actualizarlos
+                remote_ids = offset_data
+                offset_data = self._filter_existing_moves(
+                    odoo, self.rpc_model, remote_ids, 'name', 'out_invoice')
+                _logger.info('===== Import sin existentes %s record_ids %s' %
+                             (len(offset_data), offset_data))
+                id_map = self._get_id_map(self.rpc_model)
+                update_ids = set()
+                if self.update_record:
+                    update_ids = {remote_id for remote_id in remote_ids if remote_id in id_map}
+                if not offset_data and not update_ids:
+                    continue
 
-            odoo = self.connect_json_rpc(json_rpc_id)
-            with contextlib.closing(odoo):
-                records = odoo.env[self.rpc_model].browse(offset_data)
+                # Pedidos, líneas y relaciones del bloque en lecturas únicas
+                records = split_on_timeout(lambda ids: odoo.env[self.rpc_model].read(ids, [
+                    'name',
+                    'date_invoice',
+                    'date_order',
+                    'payment_term_id',
+                    'partner_id',
+                    'currency_id',
+                    'type_id',
+                    'enviado',
+                    'xml_filename',
+                    'cdr_filename',
+                    'digest_value',
+                    'order_line',
+                    'amount_total',
+                ]), offset_data + list(update_ids))
+                lines = split_on_timeout(lambda ids: odoo.env['sale.order.line'].read(
+                    ids, self._get_line_read_fields(SALE_ORDER_LINE)
+                ), [line_id for record in records if record['id'] not in update_ids
+                    for line_id in record['order_line']])
+                line_lookup = {}
+                for line in lines:
+                    line_lookup.setdefault(line['order_id'][0], []).append(line)
+
+                relations = self._read_remote_relations(
+                    odoo, self.rpc_model, records, {'type_id': ['journal_id']}, remote_lookups)
+                # El modelo del tipo de pedido depende del origen, se toma de fields_get
+                order_type_model = remote_lookups[('relations', self.rpc_model)]['type_id'][0]
+                relations.update(self._read_remote_relations(
+                    odoo, order_type_model, list(relations['type_id'].values()),
+                    {'journal_id': ['shop_id']}, remote_lookups))
+                relations.update(self._read_remote_relations(
+                    odoo, 'account.journal', list(relations['journal_id'].values()),
+                    {'shop_id': ['code']}, remote_lookups))
+                relations.update(self._read_remote_relations(
+                    odoo, 'sale.order.line', lines, self._get_line_relations(SALE_ORDER_LINE), remote_lookups))
+
+                partner_lookup = self._upsert_partners(
+                    self._read_remote_partners(
+                        odoo, self._get_many2one_ids(records, 'partner_id'), remote_lookups),
+                    partner_maps
+                )
+                self._create_missing_products(
+                    [relations['product_id'].get(line['product_id'][0]) for line in lines if line['product_id']],
+                    move_maps['product'], move_maps['product_code'])
 
                 list_records = []
                 list_request = []
+                list_logs = []
+                update_vals = {}
+                update_amounts = {}
                 for record in records:
-                    invoice_number = record.name.split('-')
+                    invoice_number = record['name'].split('-')
                     serie = invoice_number[0]
-                    journal_id = self.get_journal_id(serie)
+                    journal_id = move_maps['journal'].get(serie)
 
                     if journal_id:
-                        list_invoice_lines = []
-                        for line in record.order_line:
-                            vals_line = {
-                                'quantity': line.product_uom_qty,
-                                'price_unit': line.price_unit,
-                                'discount': 0,
-                                # 'price_subtotal': line.price_subtotal,
-                                'price_total': line.price_total,
-                                'product_id': self.get_product_id(line.product_id),
-                                'product_uom_id': self.get_uom_id(line.product_uom),
-                                'tax_ids': self.get_tax_ids(line.tax_id),
-                            }
-                            list_invoice_lines.append((0, 0, vals_line))
+                        list_invoice_lines = [
+                            (0, 0, self._prepare_move_line(line, SALE_ORDER_LINE, relations, move_maps))
+                            for line in line_lookup.get(record['id'], [])
+                        ]
+
+                        order_type = relations['type_id'].get(record['type_id'] and record['type_id'][0], {})
+                        journal = relations['journal_id'].get(order_type.get('journal_id') and order_type['journal_id'][0], {})
+                        shop_code = self._get_lookup_value(journal, 'shop_id', relations['shop_id'], 'code')
 
-                        invoice_state = 'posted'
-                        if record.state in ('sale', 'done'):
-                            invoice_state = 'posted'
-                        if not record.enviado:
-                            invoice_state = 'cancel'
+                        if record['id'] in update_ids:
+                            update_vals[id_map[record['id']]] = {
+                                'l10n_pe_edi_shop_id': move_maps['shop'].get(shop_code) or 1,
+                            }
+                            update_amounts[id_map[record['id']]] = record['amount_total']
+                            continue
 
                         vals_invoice = {
-                            'name': record.name,
+                            'name': record['name'],
                             'move_type': 'out_invoice',
-                            'invoice_date': fields.Date.to_string(record.date_invoice),
-                            'invoice_date_due': fields.Date.to_string(record.date_invoice),
-                            'invoice_payment_term_id': self.get_account_payment_term_id(record.payment_term_id.name),
-                            'journal_id': journal_id,
-                            'partner_id': self.get_partner_id(record.partner_id),
-                            'currency_id': self.get_currency_id(record.currency_id),
+                            'invoice_date': record['date_invoice'],
+                            'invoice_date_due': record['date_invoice'],
+                            'invoice_payment_term_id': self._get_map_payment_term_id(
+                                record['payment_term_id'] and record['payment_term_id'][1], move_maps),
+                            'journal_id': journal_id.id,
+                            'partner_id': partner_lookup.get(record['partner_id'] and record['partner_id'][0]),
+                            'currency_id': move_maps['currency'].get(
+                                record['currency_id'] and record['currency_id'][1]) or move_maps['currency'].get('PEN'),
                             'invoice_line_ids': list_invoice_lines,
-                            'l10n_pe_edi_shop_id': self.get_shop_id(record.type_id.journal_id.shop_id),
-                            'l10n_pe_edi_datetime_invoice': fields.Datetime.to_string(record.date_order),
-                            'l10n_latam_document_type_id': record.type_id.journal_id.edocument_type.code,
-                            'import_id': record.id,
+                            'l10n_pe_edi_shop_id': move_maps['shop'].get(shop_code) or 1,
+                            'l10n_pe_edi_datetime_invoice': record['date_order'],
+                            'l10n_latam_document_type_id': journal_id.l10n_latam_document_type_id.id,
+                            'import_id': record['id'],
                             'auto_post': 'no',
-                            'date': fields.Date.to_string(record.date_invoice),
-                            # 'state': invoice_state,
+                            'date': record['date_invoice'],
                             'picking_type_id': picking_type and picking_type.id or 2
                         }
                         list_records.append(vals_invoice)
 
                         vals_request = {
-                            'res_id': record.id,
+                            'res_id': record['id'],
                             'res_model': 'l10n_pe_edi.request',
-                            'name': record.name,
-                            'l10n_pe_xml': record.comprobante_xml,
-                            'l10n_pe_xml_filename': record.xml_filename,
-                            'l10n_pe_cdr': record.comprobante_cdr,
-                            'l10n_pe_cdr_filename': record.cdr_filename,
-                            'l10n_pe_anulada': not record.enviado,
-                            'l10n_pe_digest_value': record.digest_value,
+                            'name': record['name'],
+                            'l10n_pe_xml_filename': record['xml_filename'],
+                            'l10n_pe_cdr_filename': record['cdr_filename'],
+                            'l10n_pe_anulada': not record['enviado'],
+                            'l10n_pe_digest_value': record['digest_value'],
                         }
                         list_request.append(vals_request)
 
+                        list_logs.append({
+                            'rpc_id': self.res_id,
+                            'res_id': record['id'],
+                            'res_model': self.rpc_model,
+                            'name': record['name'],
+                            'date_issue': fields.Date.today(),
+                            'json_data': vals_invoice
+                        })
+
                     _logger.info('===== %s Import %s %s-%s' %
-                                 (row_number, self.rpc_model, record.id, record.name))
+                                 (row_number, self.rpc_model, record['id'], record['name']))
 
                     row_number += 1
 
-                    vals_logs = {
-                        'rpc_id': self.res_id,
-                        'res_id': record.id,
-                        'res_model': self.rpc_model,
-                        'name': record.name,
-                        'date_issue': fields.Date.today(),
-                        'json_data': vals_invoice
-                    }
-                    self.env['json.rpc.log'].create(vals_logs)
-
+                # Todo el bloque se crea, publica y concilia como un solo recordset
+                self.env['json.rpc.log'].create(list_logs)
                 invoice_ids = self.env[local_model].create(list_records)
-                self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    invoice.action_post()
-                    for request in list_request:
-                        if request['res_id'] == invoice.import_id:
-                            if invoice.l10n_pe_edi_request_id:
-                                invoice.l10n_pe_edi_request_id.ose_accepted = True
-                                invoice.l10n_pe_edi_request_id.sunat_accepted = True
-                                invoice.l10n_pe_edi_request_id.sunat_canceled = invoice.state == 'cancel',
-
-                                if request['l10n_pe_xml']:
-                                    attachment_xml = self.env['ir.attachment'].create({
-                                        'name': request['l10n_pe_xml_filename'],
-                                        'res_id': invoice.l10n_pe_edi_request_id.id,
-                                        'res_model': request['res_model'],
-                                        'datas': request['l10n_pe_xml'],
-                                        'type': 'binary',
-                                    })
-                                    invoice.l10n_pe_edi_request_id.xml_location = attachment_xml.store_fname
-                                    invoice.l10n_pe_edi_request_id.l10n_pe_edi_xml_generated = True
-
-                                if request['l10n_pe_cdr']:
-                                    attachment_cdr = self.env['ir.attachment'].create({
-                                        'name': request['l10n_pe_cdr_filename'],
-                                        'res_id': invoice.l10n_pe_edi_request_id.id,
-                                        'res_model': request['res_model'],
-                                        'datas': request['l10n_pe_cdr'],
-                                        'type': 'binary',
-                                    })
-                                    invoice.l10n_pe_edi_request_id.zip_location = attachment_cdr.store_fname
-                    self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.payment_state = 'paid'
-                    invoice.amount_residual = 0.0
-                    self.env.cr.commit()
-
-            record_ids = record_ids[self.offset:]
+                self._map_records(self.rpc_model, invoice_ids)
+                self._write_changed(local_model, update_vals)
+                self._check_amount_changes(update_amounts)
+                if not self._is_snapshot_export():
+                    invoice_ids.action_post()
+                self._attach_edi_files(invoice_ids, list_request, self.rpc_model)
+                invoice_ids.filtered(lambda invoice: invoice.state != 'cancel').write({
+                    'payment_state': 'paid',
+                })
+                invoice_ids.write({
+                    'amount_residual': 0.0,
+                })
+                self._commit()
 
     def _sync_product_ecommerce(self):
         json_rpc_id = self.res_id
         product_template = 'product.template'
         product_template_attribute_line = 'product.template.attribute.line'
         odoo = self.connect_json_rpc(json_rpc_id)
-        record_ids = False
         domain = []
 
         if self.company_id:
             domain.append(('company_id', '=', self.company_id))
 
-        with contextlib.closing(odoo):
-            record_ids = odoo.env[product_template].search(
-                domain, order='name', limit=self.limit)
-            BATCH_SIZE = 200
-            for i in range(0, len(record_ids), BATCH_SIZE):
-                batch_ids = record_ids[i:i + BATCH_SIZE]
-                records = odoo.env[product_template].browse(batch_ids)
-
-                _logger.info('===== Import %s - %s record_ids %s' %
-                             (product_template, len(record_ids), record_ids))
-                # Buscar existentes
-                for record in records:
-                    find_record = self.env[product_template].search([
-                        ('name', '=', record.name)
-                    ], limit=1)
-                    if find_record:
-                        record_ids.remove(record.id)
-
-        _logger.info('===== Import sin existentes %s - %s record_ids %s' %
-                     (product_template, len(record_ids), record_ids))
-
-        limit = len(record_ids)
-        interval = int(limit / self.offset) + (limit % self.offset > 0)
-
         row_number = 1
         website_id = 1
+        remote_lookups = {}
+        product_attribute_id = self.env['product.attribute'].search([
+            ('name', 'ilike', 'Marca')
+        ], limit=1)
+        product_attribute_talla_id = self.env['product.attribute'].search([
+            ('name', 'ilike', 'Talla')
+        ], limit=1)
 
-        for row in range(interval):
-            _logger.info('===== Intervalo %s de %s' % (row + 1, interval))
+        with contextlib.closing(odoo):
+            for offset_data in self._iter_remote_ids(odoo, product_template, domain, self.offset, self.limit):
+                # Buscar existentes
+                remote_data = odoo.env[product_template].read(offset_data, ['name'])
+                existing_ids = self.env[product_template].search([
+                    ('name', 'in', [item['name'] for item in remote_data])
+                ])
+                existing_names = set(existing_ids.mapped('name'))
+
+                if self.update_record:
+                    # Actualiza solo los campos e imagenes modificados de los ya importados
+                    updated_ids = existing_ids.filtered(lambda item: item.import_id in offset_data)
+                    if updated_ids:
+                        update_data = odoo.env[product_template].read(updated_ids.mapped('import_id'), [
+                            'lst_price',
+                            'standard_price',
+                            'description_sale',
+                            'barcode',
+                            'is_published',
+                            'product_template_image_ids',
+                        ])
+                        template_lookup = {item.import_id: item.id for item in updated_ids}
+                        self._write_changed(product_template, {
+                            template_lookup[item['id']]: {
+                                'list_price': item['lst_price'],
+                                'standard_price': item['standard_price'],
+                                'website_description': item['description_sale'],
+                                'barcode': item['barcode'],
+                                'is_published': item['is_published'],
+                            } for item in update_data
+                        })
+                        self._sync_product_images(odoo, updated_ids, product_template, [
+                            {'import_id': item['id'], 'image_id': image_id}
+                            for item in update_data
+                            for image_id in item['product_template_image_ids']
+                        ])
+                        self._commit()
+                offset_data = [
+                    item['id'] for item in remote_data if item['name'] not in existing_names
+                ]
 
-            if record_ids:
-                offset_data = record_ids[:self.offset]
-            else:
-                offset_data = []
+                _logger.info('===== Import sin existentes %s - %s record_ids %s' %
+                             (product_template, len(offset_data), offset_data))
+                if not offset_data:
+                    continue
 
-            odoo = self.connect_json_rpc(json_rpc_id)
-            with contextlib.closing(odoo):
-                records = odoo.env[product_template].browse(offset_data)
+                records = split_on_timeout(lambda ids: odoo.env[product_template].read(ids, [
+                    'name',
+                    'lst_price',
+                    'type',
+                    'standard_price',
+                    'default_code',
+                    'description_sale',
+                    'public_categ_ids',
+                    'barcode',
+                    'is_published',
+                    'dr_brand_id',
+                    'product_template_image_ids',
+                    'attribute_line_ids',
+                ]), offset_data)
+                relations = self._read_remote_relations(odoo, product_template, records, {
+                    'public_categ_ids': ['name', 'parent_id'],
+                    'attribute_line_ids': ['value_ids'],
+                }, remote_lookups)
+                relations.update(self._read_remote_relations(
+                    odoo, product_template_attribute_line, list(relations['attribute_line_ids'].values()),
+                    {'value_ids': ['name']}, remote_lookups))
+
+                # Marcas y tallas del bloque: una búsqueda y un create por atributo
+                brand_names = {}
+                size_names = {}
+                for record in records:
+                    brand_names[record['id']] = record['dr_brand_id'] and record['dr_brand_id'][1]
+                    size_names[record['id']] = list(dict.fromkeys(
+                        relations['value_ids'][value_id]['name']
+                        for line_id in record['attribute_line_ids']
+                        for value_id in relations['attribute_line_ids'][line_id]['value_ids']
+                    ))
+                with_attributes = bool(product_attribute_id and product_attribute_talla_id)
+                brand_value_ids = size_value_ids = {}
+                if with_attributes:
+                    brand_value_ids = self._get_attribute_value_ids(
+                        product_attribute_id, brand_names.values())
+                    size_value_ids = self._get_attribute_value_ids(
+                        product_attribute_talla_id, [name for names in size_names.values() for name in names])
+                public_categ_ids = self._get_public_categ_ids_bulk(
+                    relations['public_categ_ids'],
+                    [categ_id for record in records for categ_id in record['public_categ_ids']])
 
                 list_records = []
                 list_images = []
-                list_brands = []
-                list_attributes_values = []
+                list_logs = []
                 for record in records:
                     vals = {
-                        'name': record.name,
-                        'list_price': record.lst_price,
-                        'detailed_type': record.type,
-                        'standard_price': record.standard_price,
-                        'default_code': record.default_code,
-                        'image_1920': record.image_1920,
-                        'website_description': record.description_sale,
-                        'public_categ_ids': self.get_public_categ_id(record.public_categ_ids),
+                        'name': record['name'],
+                        'list_price': record['lst_price'],
+                        'detailed_type': record['type'],
+                        'standard_price': record['standard_price'],
+                        'default_code': record['default_code'],
+                        'website_description': record['description_sale'],
+                        'public_categ_ids': [
+                            public_categ_ids[categ_id] for categ_id in record['public_categ_ids']
+                            if categ_id in public_categ_ids
+                        ],
                         'website_id': website_id,
-                        'barcode': record.barcode,
+                        'barcode': record['barcode'],
                         'taxes_id': self.tax_id._ids,
-                        'is_published': record.is_published,
-                        'import_id': record.id
+                        'is_published': record['is_published'],
+                        'import_id': record['id']
                     }
-                    list_brands.append({
-                        'import_id': record.id,
-                        'brand_name': record.dr_brand_id.name
-                    })
-                    row_number += 1
-                    list_records.append(vals)
-
-                    _logger.info('===== %s Import %s %s-%s' %
-                                 (row_number, product_template, record.id, record.name))
-
-                    for image in record.product_template_image_ids:
-                        vals_image = {
-                            'import_id': record.id,
-                            'image_1920': image.image_1920
-                        }
-                        list_images.append(vals_image)
-
-                    for attr in record.attribute_line_ids:
-                        vals_attr = {
-                            'import_id': record.id,
-                            'value_ids': attr.value_ids
-                        }
-                        list_attributes_values.append(vals_attr)
-
-                    vals_logs = {
+                    list_logs.append({
                         'rpc_id': self.res_id,
-                        'name': record.name,
+                        'name': record['name'],
                         'date_issue': fields.Date.today(),
                         'json_data': vals
-                    }
-                    self.env['json.rpc.log'].create(vals_logs)
-
-                records_ids = self.env[product_template].create(list_records)
-                self.env.cr.commit()
+                    })
 
-                # Agrega imagenes al producto
-                if list_images:
-                    for record in records_ids:
-                        list_template_images = []
-                        for image in list_images:
-                            if record.import_id == image['import_id']:
-                                vals_image = {
-                                    'name': record.name,
-                                    'product_tmpl_id': record.id,
-                                    'image_1920': image['image_1920']
-                                }
-                                list_template_images.append((0, 0, vals_image))
-                        record.product_template_image_ids = list_template_images
-
-                # Agrega el atributo marca al producto
-                product_attribute_id = self.env['product.attribute'].search([
-                    ('name', 'ilike', 'Marca')
-                ], limit=1)
+                    # Las líneas de atributo van en el mismo create: las variantes se generan ahí
+                    attribute_lines = []
+                    if with_attributes and brand_names[record['id']]:
+                        attribute_lines.append((0, 0, {
+                            'attribute_id': product_attribute_id.id,
+                            'value_ids': [(6, 0, [brand_value_ids[brand_names[record['id']]]])],
+                        }))
+                    if with_attributes and size_names[record['id']]:
+                        attribute_lines.append((0, 0, {
+                            'attribute_id': product_attribute_talla_id.id,
+                            'value_ids': [(6, 0, [size_value_ids[name] for name in size_names[record['id']]])],
+                        }))
+                    if attribute_lines:
+                        vals['attribute_line_ids'] = attribute_lines
 
-                product_attribute_talla_id = self.env['product.attribute'].search([
-                    ('name', 'ilike', 'Talla')
-                ], limit=1)
+                    row_number += 1
+                    list_records.append(vals)
 
-                if product_attribute_id and product_attribute_talla_id and list_brands:
-                    list_product_brands = []
+                    _logger.info('===== %s Import %s %s-%s' %
+                                 (row_number, product_template, record['id'], record['name']))
 
-                    for item in list_brands:
-                        value_brand_id = self.env['product.attribute.value'].search([
-                            ('name', '=', item['brand_name']),
-                            ('attribute_id', '=', product_attribute_id.id)
-                        ])
+                    for image_id in record['product_template_image_ids']:
+                        list_images.append({
+                            'import_id': record['id'],
+                            'image_id': image_id
+                        })
 
-                        if not value_brand_id:
-                            value_brand_id = self.env['product.attribute.value'].create({
-                                'name': item['brand_name'],
-                                'attribute_id': product_attribute_id.id
-                            })
+                self.env['json.rpc.log'].create(list_logs)
+                records_ids = self.env[product_template].create(list_records)
+                self._map_records(product_template, records_ids)
 
-                        list_product_brands.append({
-                            'import_id': item['import_id'],
-                            'brand_name': item['brand_name'],
-                            'value_brand_id': value_brand_id.id
-                        })
+                # Con varias variantes, copia costo, código y código de barras de la plantilla
+                for record in records_ids.filtered(lambda item: item.product_variant_count > 1):
+                    record.product_variant_ids.write({
+                        'standard_price': record.standard_price,
+                        'default_code': record.default_code,
+                        'barcode': record.barcode,
+                    })
+                self._commit()
 
-                    if list_product_brands:
-                        for record in records_ids:
-                            for item in list_product_brands:
-                                list_value_ids = []
-                                if record.import_id == item['import_id']:
-                                    list_value_ids.append(
-                                        item['value_brand_id'])
-
-                                    self.env[product_template_attribute_line].create({
-                                        'attribute_id': product_attribute_id.id,
-                                        'value_ids': list_value_ids,
-                                        'product_tmpl_id': record.id
-                                    })
-
-                            for item in list_attributes_values:
-                                list_value_ids = []
-                                if record.import_id == item['import_id']:
-                                    _logger.info(
-                                        "============== item['value_ids'] %s" % item['value_ids'])
-                                    for attr in item['value_ids']:
-                                        _logger.info(
-                                            "============== attr %s" % attr)
-                                        value_id = self.env['product.attribute.value'].search([
-                                            ('name', '=', attr.name),
-                                            ('attribute_id', '=',
-                                             product_attribute_talla_id.id)
-                                        ])
-                                        if not value_id:
-                                            value_id = self.env['product.attribute.value'].create({
-                                                'name': attr['name'],
-                                                'attribute_id': product_attribute_talla_id.id
-                                            })
-                                        list_value_ids.append(value_id.id)
-
-                                    self.env[product_template_attribute_line].create({
-                                        'attribute_id': product_attribute_talla_id.id,
-                                        'value_ids': list_value_ids,
-                                        'product_tmpl_id': record.id
-                                    })
-
-                            record._create_variant_ids()
-                            if record.product_variant_ids:
-                                for product_variant in record.product_variant_ids:
-                                    product_variant.standard_price = record.standard_price
-                                    product_variant.default_code = record.default_code
-                                    product_variant.barcode = record.barcode
-
-                self.env.cr.commit()
-
-            record_ids = record_ids[self.offset:]
+                # Agrega imagenes al producto
+                self._sync_product_images(odoo, records_ids, product_template, list_images)
+                self._commit()
 
     def _sync_stock_lot(self):
         json_rpc_id = self.res_id
@@ -1722,12 +1993,7 @@ class SyncDataWizard(models.TransientModel):
         try:
             odoo = self.connect_json_rpc(json_rpc_id)
 
-            record_ids = odoo.env[rpc_model_origin].search(
-                [], limit=limit_record)
-            _logger.info('===== %s %s' % (self.rpc_model, len(record_ids)))
-
-            for i in range(0, len(record_ids), chunk_size):
-                batch_ids = record_ids[i:i + chunk_size]
+            for batch_ids in self._iter_remote_ids(odoo, rpc_model_origin, [], chunk_size, limit_record):
                 _logger.info('===== procesar %s registros' % len(batch_ids))
 
                 records = odoo.env[rpc_model_origin].read(
@@ -1781,580 +2047,222 @@ class SyncDataWizard(models.TransientModel):
         except Exception as e:
             _logger.info('===== Error %s' % e)
 
-    def sync_invoices(self):
-        json_rpc_id = self.res_id
-        odoo = self.connect_json_rpc(json_rpc_id)
-        record_ids = False
-
-        with contextlib.closing(odoo):
-            record_ids = odoo.env[self.rpc_model].search([
-                ('type', '=', 'out_invoice'),
-                ('invoice_date', '>=', self.start_date.strftime('%Y-%m-%d')),
-                ('invoice_date', '<=', self.end_date.strftime('%Y-%m-%d')),
-                ('state', 'in', ['posted', 'cancel']),
-                ('name', 'ilike', self.filter_name),
-                ('company_id', '=', self.company_id)
-            ], order='name')
-            records = odoo.env[self.rpc_model].browse(record_ids)
-
-            _logger.info('===== Import %s - %s record_ids %s' % (
-                self.rpc_model,
-                len(record_ids),
-                record_ids
-            ))
-
-            # Buscar existentes
-            for record in records:
-                find_record = self.env[self.rpc_model].search([
-                    ('move_type', '=', 'out_invoice'),
-                    '|',
-                    ('import_id', '=', record.id),
-                    ('name', '=', record.name)
-                ], limit=1)
-                if find_record:
-                    record_ids.remove(record.id)
-
-        _logger.info('===== Import sin existentes %s record_ids %s' %
-                     (len(record_ids), record_ids))
-
-        limit = len(record_ids)
-        interval = int(limit / self.offset) + (limit % self.offset > 0)
-        row_number = 1
-
-        for row in range(interval):
-            _logger.info('===== Intervalo %s de %s' % (row + 1, interval))
-
-            if len(record_ids) > 0:
-                offset_data = record_ids[:self.offset]
-            else:
-                offset_data = []
-
-            odoo = self.connect_json_rpc(json_rpc_id)
-            with contextlib.closing(odoo):
-                records = odoo.env[self.rpc_model].browse(offset_data)
-
-                list_records = []
-                list_request = []
-                for record in records:
-                    invoice_number = record.name.split('-')
-                    serie = invoice_number[0]
-                    journal_id = self.get_journal_id(serie)
-
-                    if journal_id:
-                        list_invoice_lines = []
-                        for line in record.invoice_line_ids:
-                            product_id = False
-                            if self.current_version in (11, 12, 13):
-                                product_id = self.get_product_id(
-                                    line.product_id)
-                            elif self.current_version == 17:
-                                product_id = self.get_product_id_v17(
-                                    line.product_id)
-                            vals_line = {
-                                'quantity': line.quantity,
-                                'price_unit': line.price_unit,
-                                'discount': line.discount,
-                                'price_subtotal': line.price_subtotal,
-                                'price_total': line.price_total,
-                                'product_id': product_id,
-                                'product_uom_id': self.get_uom_id(line.product_uom_id),
-                                'tax_ids': self.get_tax_ids_v13(line.tax_ids),
-                            }
-                            list_invoice_lines.append((0, 0, vals_line))
-
-                        invoice_state = 'draft'
-                        if record.state == 'cancel':
-                            invoice_state = 'cancel'
-
-                        l10n_pe_edi_shop_id = False
-                        if self.version_origin == 13:
-                            l10n_pe_edi_shop_id = self.get_shop_id(
-                                record.journal_id.l10n_pe_edi_shop_id)
-                        elif self.version_origin == 17:
-                            l10n_pe_edi_shop_id = self.get_shop_id(
-                                record.journal_id.l10n_pe_edi_shop_id)
-
-                        vals_invoice = {
-                            'name': record.name,
-                            'move_type': 'out_invoice',
-                            'invoice_date': fields.Date.to_string(record.invoice_date),
-                            'invoice_date_due': fields.Date.to_string(record.invoice_date_due),
-                            'invoice_payment_term_id': self.get_account_payment_term_id(
-                                record.invoice_payment_term_id.name
-                            ),
-                            'journal_id': journal_id,
-                            'partner_id': self.get_partner_id_v13(record.partner_id),
-                            'currency_id': self.get_currency_id(record.currency_id),
-                            'invoice_line_ids': list_invoice_lines,
-                            'l10n_pe_edi_shop_id': l10n_pe_edi_shop_id,
-                            'l10n_pe_edi_datetime_invoice': fields.Datetime.to_string(record.datetime_invoice),
-                            'l10n_latam_document_type_id': record.journal_id.l10n_latam_document_type_id.code,
-                            'import_id': record.id,
-                            'auto_post': 'no',
-                            'date': fields.Date.to_string(record.invoice_date),
-                            'state': invoice_state,
-                        }
-
-                        if self.auto_picking:
-                            picking_type = self.env['stock.picking.type'].search([
-                                ('code', '=', 'outgoing')
-                            ], limit=1)
-                            vals_invoice.update({
-                                'picking_type_id': picking_type and picking_type.id or 2
-                            })
-
-                        list_records.append(vals_invoice)
-
-                        vals_request = {
-                            'res_id': record.id,
-                            'res_model': 'l10n_pe_edi.request',
-                            'name': record.name,
-                            'l10n_pe_xml': record.comprobante_xml,
-                            'l10n_pe_xml_filename': record.xml_filename,
-                            'l10n_pe_cdr': record.comprobante_cdr,
-                            'l10n_pe_cdr_filename': record.cdr_filename,
-                            'l10n_pe_anulada': record.anulada,
-                            'l10n_pe_digest_value': record.digest_value,
-                        }
-                        list_request.append(vals_request)
-
-                    _logger.info('===== %s Import %s %s-%s' % (
-                        row_number,
-                        self.rpc_model,
-                        record.id,
-                        record.name
-                    ))
-
-                    row_number += 1
-
-                    vals_logs = {
-                        'rpc_id': self.res_id,
-                        'res_id': record.id,
-                        'res_model': self.rpc_model,
-                        'name': record.name,
-                        'date_issue': fields.Date.context_today(self),
-                        'json_data': vals_invoice
-                    }
-                    self.env['json.rpc.log'].create(vals_logs)
-
-                invoice_ids = self.env[self.rpc_model].create(list_records)
-                self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.action_post()
-
-                        for request in list_request:
-                            if request['res_id'] == invoice.import_id:
-                                if invoice.l10n_pe_edi_request_id:
-                                    invoice.l10n_pe_edi_request_id.ose_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_accepted = True
-                                    invoice.l10n_pe_edi_request_id.sunat_canceled = invoice.state == 'cancel',
-
-                                    attachment_xml = self.env['ir.attachment'].create({
-                                        'name': request['l10n_pe_xml_filename'],
-                                        'res_id': invoice.l10n_pe_edi_request_id.id,
-                                        'res_model': request['res_model'],
-                                        'datas': request['l10n_pe_xml'],
-                                        'type': 'binary',
-                                    })
-                                    invoice.l10n_pe_edi_request_id.xml_location = attachment_xml.store_fname
-                                    invoice.l10n_pe_edi_request_id.l10n_pe_edi_xml_generated = True
-
-                                    attachment_cdr = self.env['ir.attachment'].create({
-                                        'name': request['l10n_pe_cdr_filename'],
-                                        'res_id': invoice.l10n_pe_edi_request_id.id,
-                                        'res_model': request['res_model'],
-                                        'datas': request['l10n_pe_cdr'],
-                                        'type': 'binary',
-                                    })
-                                    invoice.l10n_pe_edi_request_id.zip_location = attachment_cdr.store_fname
-
-                    self.env.cr.commit()
-
-                for invoice in invoice_ids:
-                    if invoice.state != 'cancel':
-                        invoice.payment_state = 'paid'
-                    invoice.amount_residual = 0.0
-                    self.env.cr.commit()
-
-            record_ids = record_ids[self.offset:]
-
-    def sync_invoices_v2(self):
-        json_rpc_id = self.res_id
-        rpc_model = self.rpc_model
-        rpc_model_account_move_line = 'account.move.line'
-        rpc_model_invoice_payment_term = 'account.payment.term'
-        rpc_model_product = 'product.product'
-        rpc_model_journal = 'account.journal'
-        rpc_model_currency = 'res.currency'
-        rpc_model_l10n_pe_edi_shop = 'l10n_pe_edi.shop'
-        rpc_model_partner = 'res.partner'
-        rpc_model_l10n_latam_identification_type = 'l10n_latam.identification.type'
-        rpc_model_res_country = 'res.country'
-        rpc_model_res_state = 'res.country.state'
-        rpc_model_res_city = 'res.city'
-        rpc_model_res_district = 'l10n_pe.res.city.district'
-        limit_record = self.limit or 0
-        chunk_size = self.chunk_size or 100
-
-        created_count = 0
-        skipped_count = 0
-
-        try:
-            odoo = self.connect_json_rpc(json_rpc_id)
-            record_ids = False
-            domain = [
-                ('type', '=', 'out_invoice'),
-                ('state', 'in', ['posted', 'cancel']),
-            ]
-
-            if self.start_date:
-                domain.append(
-                    ('invoice_date', '>=', self.start_date.strftime('%Y-%m-%d')))
-            if self.end_date:
-                domain.append(
-                    ('invoice_date', '<=', self.end_date.strftime('%Y-%m-%d')))
-            if self.filter_name:
-                domain.append(('name', 'ilike', self.filter_name))
-            if self.company_id:
-                domain.append(('company_id', '=', self.company_id))
-
-            record_ids = odoo.env[rpc_model].search(
-                domain, order='name', limit=limit_record)
-            _logger.info('===== %s %s' % (self.rpc_model, len(record_ids)))
-
-            account_payment_term_data = self.get_account_payment_term_id(
-                '', True)
-            account_payment_term_cache = {
-                item.name: item for item in account_payment_term_data}
-            journal_data = self.get_journal_id('', True)
-            journal_cache = {item.code: item for item in journal_data}
-            currency_data = self.get_currency_id('', True)
-            currency_cache = {item.name: item for item in currency_data}
-            l10n_pe_edi_shop_data = self.get_shop_id('', True)
-            l10n_pe_edi_shop_cache = {
-                item.code: item for item in l10n_pe_edi_shop_data}
-            product_product_data = self.get_product_id_v17({}, True)
-            product_product_cache = {
-                item.name: item for item in product_product_data}
-            uom_data = self.get_uom_id({}, True)
-            uom_cache = {item.name.upper(): item for item in uom_data}
-
-            product_ids = odoo.env[rpc_model_product].search([])
-            product_data = odoo.env[rpc_model_product].read(
-                product_ids,
-                [
-                    'id',
-                    'name',
-                    'list_price',
-                    'type',
-                    'standard_price',
-                    'default_code',
-                ]
-            )
-            product_lookup = {i['id']: i for i in product_data}
-
-            identification_type_ids = odoo.env[rpc_model_l10n_latam_identification_type].search([
-            ])
-            identification_type_data = odoo.env[rpc_model_l10n_latam_identification_type].read(
-                identification_type_ids, ['name', 'l10n_pe_vat_code'])
-            identification_type_lookup = {
-                i['id']: i for i in identification_type_data}
-
-            res_country_ids = odoo.env[rpc_model_res_country].search([])
-            res_country_data = odoo.env[rpc_model_res_country].read(
-                res_country_ids, ['name'])
-            res_country_lookup = {i['id']: i for i in res_country_data}
-
-            res_state_ids = odoo.env[rpc_model_res_state].search([])
-            res_state_data = odoo.env[rpc_model_res_state].read(
-                res_state_ids, ['name'])
-            res_state_lookup = {i['id']: i for i in res_state_data}
-
-            res_city_ids = odoo.env[rpc_model_res_city].search([])
-            res_city_data = odoo.env[rpc_model_res_city].read(
-                res_city_ids, ['name'])
-            res_city_lookup = {i['id']: i for i in res_city_data}
-
-            res_district_ids = odoo.env[rpc_model_res_district].search([])
-            res_district_data = odoo.env[rpc_model_res_district].read(
-                res_district_ids, ['name'])
-            res_district_lookup = {i['id']: i for i in res_district_data}
-
-            _logger.info(f"""Cache: {len(account_payment_term_cache)} invoice.payment.term, """
-                         f"""{len(journal_cache)} account.journal, """
-                         f"""{len(currency_cache)} res.currency, """
-                         f"""{len(l10n_pe_edi_shop_cache)} l10n_pe.edi.shop, """
-                         f"""{len(product_product_cache)} product.product, """
-                         f"""{len(product_lookup)} origin product.product, """
-                         f"""{len(identification_type_lookup)} origin l10n_latam.identification.type, """
-                         f"""{len(res_country_lookup)} origin res.country, """
-                         f"""{len(res_state_lookup)} origin res.country.state, """
-                         f"""{len(res_city_lookup)} origin res.city, """
-                         f"""{len(res_district_lookup)} origin l10n_pe.res.city.district """)
-
-            for i in range(0, len(record_ids), chunk_size):
-                invoices = []
-                requests = []
-                batch_ids = record_ids[i:i + chunk_size]
-                _logger.info('===== procesar %s registros' % len(batch_ids))
-
-                records = odoo.env[rpc_model].read(
-                    batch_ids,
-                    [
-                        'id',
-                        'name',
-                        'type',
-                        'invoice_date',
-                        'invoice_date_due',
-                        'invoice_payment_term_id',
-                        'journal_id',
-                        'partner_id',
-                        'currency_id',
-                        'l10n_pe_edi_shop_id',
-                        'l10n_latam_document_type_id',
-                        'datetime_invoice',
-                        'invoice_line_ids',
-                        'state',
-                        'comprobante_xml',
-                        'xml_filename',
-                        'comprobante_cdr',
-                        'cdr_filename',
-                        'digest_value',
-                        'anulada',
-                        'enviado'
-                    ]
-                )
-
-                partner_ids = list(
-                    {item['partner_id'][0] for item in records if item['partner_id']})
-                partner_data = odoo.env[rpc_model_partner].read(partner_ids, [
-                    'id',
-                    'name',
-                    'vat',
-                    'street',
-                    'zip',
-                    'country_id',
-                    'state_id',
-                    'city_id',
-                    'l10n_pe_district',
-                    'l10n_latam_identification_type_id',
-                ])
-                partner_lookup = {i['id']: i for i in partner_data}
-
-                l10n_pe_edi_shop_ids = list(
-                    {item['l10n_pe_edi_shop_id'][0] for item in records if item['l10n_pe_edi_shop_id']})
-                l10n_pe_edi_shop_data = odoo.env[rpc_model_l10n_pe_edi_shop].read(
-                    l10n_pe_edi_shop_ids, ['name', 'code'])
-                l10n_pe_edi_shop_lookup = {
-                    i['id']: i for i in l10n_pe_edi_shop_data}
-
-                for record in records:
-                    if not record.get('name'):
-                        _logger.info(
-                            f"not found name {rpc_model} {record['id']}")
-                        continue
-
-                    exists = self.env[rpc_model].search([
-                        ('move_type', '=', 'out_invoice'),
-                        '|',
-                        ('import_id', '=', record['id']),
-                        ('name', '=', record['name'])
-                    ], limit=1)
-
-                    if exists:
-                        skipped_count += 1
-                        continue
-
-                    invoice_line_ids = record['invoice_line_ids']
-                    line_ids = odoo.env[rpc_model_account_move_line].read(invoice_line_ids, [
-                        'product_id',
-                        'product_uom_id',
-                        'name',
-                        'quantity',
-                        'price_unit',
-                        'tax_ids'
-                    ])
-
-                    invoice_lines = []
-                    for line in line_ids:
-                        uom_name = line['product_uom_id'][1] if line['product_uom_id'] else False
-                        uom_id = uom_cache.get(uom_name.upper())
-
-                        product_id = False
-                        product_id = line['product_id'][0] if line['product_id'] else False
-                        if product_id and product_id in product_lookup:
-                            product_id = product_lookup[product_id]
-
-                        if product_id and product_id['name'] in product_product_cache:
-                            product_name = product_id['name']
-                            product_id = product_product_cache[product_name]
-                        else:
-                            product_id = self.create_product_product(
-                                product_id)
-
-                        vals_line = {
-                            'quantity': line['quantity'],
-                            'price_unit': line['price_unit'],
-                            'product_id': product_id and product_id['id'],
-                            'product_uom_id': uom_id and uom_id.id or 1,
-                            'tax_ids': [self.tax_id.id],
-                        }
-                        invoice_lines.append((0, 0, vals_line))
-
-                    invoice_payment_term_id = False
-                    invoice_payment_term_name = record['invoice_payment_term_id'][1] if record['invoice_payment_term_id'] else False
-                    invoice_payment_term_id = account_payment_term_cache.get(
-                        invoice_payment_term_name)
-                    if not invoice_payment_term_id:
-                        _logger.info(
-                            f"'{rpc_model_invoice_payment_term}' not found {invoice_payment_term_name}")
-
-                    journal_id = False
-                    invoice_number = record['name']
-                    journal_code = invoice_number.split('-')[0]
-                    journal_id = journal_cache.get(journal_code)
-                    if not journal_id:
-                        _logger.info(
-                            f"'{rpc_model_journal}' not found {journal_code}")
-                        continue
-
-                    currency_id = False
-                    currency_name = record['currency_id'][1] if record['currency_id'] else False
-                    currency_id = currency_cache.get(currency_name)
-                    if not currency_id:
-                        _logger.info(
-                            f"'{rpc_model_currency}' not found {currency_name}")
-                        continue
-
-                    shop = False
-                    shop_name = record['l10n_pe_edi_shop_id'][1] if record['l10n_pe_edi_shop_id'] else False
-                    shop_id = record['l10n_pe_edi_shop_id'][0] if record['l10n_pe_edi_shop_id'] else False
-                    if shop_id and shop_id in l10n_pe_edi_shop_lookup:
-                        shop = l10n_pe_edi_shop_lookup[shop_id]
-
-                    if not shop:
-                        _logger.info(
-                            f"'{rpc_model_l10n_pe_edi_shop}' not found {shop_name}")
-                        continue
-                    else:
-                        shop_id = l10n_pe_edi_shop_cache.get(shop['code'])
-                        if not shop_id:
-                            _logger.info(
-                                f"'{rpc_model_l10n_pe_edi_shop}' not found {shop_name}")
-                            continue
-
-                    partner = False
-                    partner_id = record['partner_id'][0] if record['partner_id'] else False
-                    if partner_id and partner_id in partner_lookup:
-                        partner = partner_lookup[partner_id]
-
-                    partner_id = self.get_partner_id_v13(
-                        partner,
-                        identification_type_lookup,
-                        res_country_lookup,
-                        res_state_lookup,
-                        res_city_lookup,
-                        res_district_lookup
-                    )
-
-                    invoice_state = 'draft'
-                    if record['state'] == 'cancel':
-                        invoice_state = 'cancel'
-                    vals = {
-                        'name': record['name'],
-                        'move_type': 'out_invoice',
-                        'invoice_date': record['invoice_date'],
-                        'invoice_date_due': record['invoice_date_due'] or False,
-                        'journal_id': journal_id.id,
-                        'partner_id': partner_id,
-                        'currency_id': currency_id.id,
-                        'l10n_pe_edi_shop_id': shop_id.id,
-                        'l10n_pe_edi_datetime_invoice': record['datetime_invoice'] or False,
-                        'import_id': record['id'],
-                        'auto_post': 'no',
-                        'date': record['invoice_date'] or False,
-                        'state': invoice_state,
-                        'invoice_line_ids': invoice_lines,
-                    }
-
-                    if invoice_payment_term_id:
-                        vals['invoice_payment_term_id'] = invoice_payment_term_id.id
-
-                    invoices.append(vals)
-
-                    vals_request = self.get_vals_request(record)
-                    requests.append(vals_request)
-
-                invoice_ids = self.env[rpc_model].create(invoices)
-                self.env.cr.commit()
-
-                self.process_invoices(invoice_ids, requests)
-
-                created_count += len(invoices)
-
-            _logger.info('===== creados %s registros' % created_count)
-            _logger.info('===== omitidos %s registros' % skipped_count)
+    def process_invoices(self, invoice_ids, requests, remote_model, pool=None, create_request=True):
+        """Publica los comprobantes no anulados, crea sus solicitudes EDI si se
+        indica, adjunta los XML/CDR y los marca como pagados. Los anulados solo
+        quedan sin saldo. Al exportar un snapshot solo se leen los binarios."""
+        posted_ids = invoice_ids.filtered(lambda invoice: invoice.state != 'cancel')
+        if self._is_snapshot_export():
+            self._attach_edi_files(posted_ids, requests, remote_model, pool)
+            return
+        posted_ids.action_post()
+        if create_request:
+            for invoice in posted_ids:
+                invoice.create_edi_request()
+        self._commit()
+
+        self._attach_edi_files(posted_ids, requests, remote_model, pool)
+        posted_ids.write({
+            'payment_state': 'paid',
+        })
+        invoice_ids.write({
+            'amount_residual': 0.0,
+        })
+        self._commit()
+
+    def _get_remote_env(self, odoo, **context):
+        return odoo.env(context=dict(odoo.env.context, **context))
+
+    def _get_remote_pool(self):
+        conn = self.env["json.rpc"].browse(self.res_id)
+        # Llamadas simultáneas tiene prioridad: más hilos solo esperarían su turno
+        max_workers = conn.rpc_max_workers
+        if conn.rpc_max_concurrent:
+            max_workers = min(max_workers or conn.rpc_max_concurrent, conn.rpc_max_concurrent)
+        return RemoteReadPool(
+            self.connection_params(self.res_id), max_workers, self._get_transfer_stats(),
+            self._get_snapshot(), self._get_metadata_cache(), self._get_rate_limiter())
+
+    def _fetch_remote_binaries(self, remote_model, remote_ids, fields_list, pool=None):
+        """Etapa de binarios: descarga el contenido aparte de la cabecera, en
+        sub-bloques leídos en paralelo por el pool de la conexión."""
+        result = {}
+        remote_ids = list({i for i in remote_ids if i})
+        if not self.sync_binaries or not remote_ids:
+            return result
+
+        with contextlib.ExitStack() as stack:
+            if pool is None:
+                pool = stack.enter_context(self._get_remote_pool())
+            for item in pool.results(pool.read(remote_model, remote_ids, fields_list, BINARY_BATCH_SIZE)):
+                result[item['id']] = item
+        return result
+
+    def _attach_edi_files(self, invoice_ids, requests, remote_model, pool=None):
+        """Marca las solicitudes EDI como aceptadas y crea en bloque sus adjuntos
+        XML/CDR, omitiendo los que ya existen con el mismo checksum. Cada
+        solicitud se escribe una vez y las que reciben los mismos valores
+        comparten un solo write(). Los
+        binarios se leen para todos los comprobantes recibidos, tengan o no
+        solicitud, así la lectura es la misma al exportar un snapshot (sin
+        publicar ni crear solicitudes) y al reproducirlo."""
+        binaries = self._fetch_remote_binaries(
+            remote_model,
+            [invoice.import_id for invoice in invoice_ids],
+            [field for field, filename, location in EDI_BINARY_FIELDS],
+            pool
+        )
+        edi_request_ids = invoice_ids.mapped('l10n_pe_edi_request_id')
+        if not edi_request_ids or self._is_snapshot_export():
+            return
+        request_vals = {
+            edi_request.id: {
+                'ose_accepted': True,
+                'sunat_accepted': True,
+                'sunat_canceled': False,
+            } for edi_request in edi_request_ids
+        }
 
-        except Exception as e:
-            _logger.info('===== Error %s' % e)
+        attachment_obj = self.env['ir.attachment']
+        request_lookup = {item['res_id']: item for item in requests}
 
-    def get_vals_request(self, record):
-        vals = {
-            'res_id': record['id'],
-            'res_model': 'l10n_pe_edi.request',
-            'name': record['name'],
-            'l10n_pe_xml': record['comprobante_xml'],
-            'l10n_pe_xml_filename': record['xml_filename'],
-            'l10n_pe_cdr': record['comprobante_cdr'],
-            'l10n_pe_cdr_filename': record['cdr_filename'],
-            'l10n_pe_anulada': record['anulada'],
-            'l10n_pe_enviado': record['enviado'],
-            'l10n_pe_digest_value': record['digest_value'],
+        pending = []
+        for invoice in invoice_ids:
+            edi_request = invoice.l10n_pe_edi_request_id
+            request = request_lookup.get(invoice.import_id)
+            binary = binaries.get(invoice.import_id)
+            if not edi_request or not request or not binary:
+                continue
+            for field, filename, location in EDI_BINARY_FIELDS:
+                if not binary.get(field):
+                    continue
+                checksum = attachment_obj._compute_checksum(base64.b64decode(binary[field]))
+                pending.append((edi_request, location, checksum, {
+                    'name': request[filename],
+                    'res_id': edi_request.id,
+                    'res_model': request['res_model'],
+                    'datas': binary[field],
+                    'type': 'binary',
+                }))
+
+        existing = attachment_obj.search([
+            ('res_model', '=', 'l10n_pe_edi.request'),
+            ('res_id', 'in', [item[0].id for item in pending]),
+            ('checksum', 'in', [item[2] for item in pending]),
+        ])
+        attachment_lookup = {(item.res_id, item.checksum): item for item in existing}
+        to_create = []
+        for item in pending:
+            key = (item[0].id, item[2])
+            if key not in attachment_lookup:
+                attachment_lookup[key] = False
+                to_create.append(item)
+        for item, attachment in zip(to_create, attachment_obj.create([item[3] for item in to_create])):
+            attachment_lookup[(item[0].id, item[2])] = attachment
+
+        for edi_request, location, checksum, vals in pending:
+            values = request_vals[edi_request.id]
+            values[location] = attachment_lookup[(edi_request.id, checksum)].store_fname
+            if location == 'xml_location':
+                values['l10n_pe_edi_xml_generated'] = True
+
+        groups = {}
+        for request_id, values in request_vals.items():
+            groups.setdefault(tuple(sorted(values.items())), (values, []))[1].append(request_id)
+        for values, request_ids in groups.values():
+            edi_request_ids.browse(request_ids).write(values)
+
+    def _get_image_checksums(self, env, res_model, res_ids):
+        """Checksum del adjunto image_1920 por res_id. Sirve tanto para el
+        entorno local como para el remoto (odoorpc)."""
+        res_ids = list({res_id for res_id in res_ids if res_id})
+        if not res_ids:
+            return {}
+        attachments = env['ir.attachment'].search_read([
+            ('res_model', '=', res_model),
+            ('res_field', '=', 'image_1920'),
+            ('res_id', 'in', res_ids),
+        ], ['res_id', 'checksum'])
+        return {item['res_id']: item['checksum'] for item in attachments}
+
+    def _sync_product_images(self, odoo, product_ids, remote_model, list_images):
+        """Etapa de imágenes: compara el checksum del adjunto remoto con el local
+        y descarga en paralelo solo las imágenes nuevas o modificadas; las
+        imágenes adicionales se crean en bloque."""
+        if not self.sync_binaries or not product_ids:
+            return
+
+        local_env = self.sudo().env
+        template_lookup = {
+            record.import_id: record if record._name == 'product.template' else record.product_tmpl_id
+            for record in product_ids
         }
-        return vals
 
-    def process_invoices(self, invoice_ids, requests):
-        for invoice in invoice_ids:
-            if invoice.state == 'cancel':
+        # Imagen principal: el adjunto vive en la plantilla en ambos lados
+        remote_tmpl_ids = {remote_id: remote_id for remote_id in template_lookup}
+        if remote_model == 'product.product':
+            remote_tmpl_ids = {
+                item['id']: item['product_tmpl_id'][0]
+                for item in odoo.env[remote_model].read(list(template_lookup), ['product_tmpl_id'])
+                if item['product_tmpl_id']
+            }
+        remote_checksums = self._get_image_checksums(
+            odoo.env, 'product.template', remote_tmpl_ids.values())
+        local_checksums = self._get_image_checksums(
+            local_env, 'product.template', [template.id for template in template_lookup.values()])
+        changed_ids = []
+        for remote_id, template in template_lookup.items():
+            checksum = remote_checksums.get(remote_tmpl_ids.get(remote_id))
+            if checksum and checksum != local_checksums.get(template.id):
+                changed_ids.append(remote_id)
+
+        # Imágenes adicionales: se omiten las que la plantilla ya tiene
+        remote_image_checksums = self._get_image_checksums(
+            odoo.env, 'product.image', [item['image_id'] for item in list_images])
+        local_image_ids = self.env['product.template'].browse(
+            [template.id for template in template_lookup.values()]).mapped('product_template_image_ids')
+        local_image_checksums = self._get_image_checksums(
+            local_env, 'product.image', local_image_ids.ids)
+        template_image_checksums = {}
+        for image in local_image_ids:
+            template_image_checksums.setdefault(image.product_tmpl_id.id, set()).add(
+                local_image_checksums.get(image.id))
+        changed_images = []
+        for item in list_images:
+            checksum = remote_image_checksums.get(item['image_id'])
+            template = template_lookup.get(item['import_id'])
+            if not checksum or not template:
                 continue
+            if checksum in template_image_checksums.get(template.id, set()):
+                continue
+            template_image_checksums.setdefault(template.id, set()).add(checksum)
+            changed_images.append(item)
 
-            invoice.action_post()
-            invoice.create_edi_request()
-            self.env.cr.commit()
+        _logger.info('===== Imagenes modificadas %s de %s, adicionales %s de %s' % (
+            len(changed_ids), len(template_lookup), len(changed_images), len(list_images)))
 
-            for request in requests:
-                if request['res_id'] != invoice.import_id:
-                    continue
-                if invoice.l10n_pe_edi_request_id:
-                    invoice.l10n_pe_edi_request_id.ose_accepted = True
-                    invoice.l10n_pe_edi_request_id.sunat_accepted = True
-
-                    if request['l10n_pe_xml']:
-                        attachment_xml = self.env['ir.attachment'].create({
-                            'name': request['l10n_pe_xml_filename'],
-                            'res_id': invoice.l10n_pe_edi_request_id.id,
-                            'res_model': request['res_model'],
-                            'datas': request['l10n_pe_xml'],
-                            'type': 'binary',
-                        })
-                        invoice.l10n_pe_edi_request_id.xml_location = attachment_xml.store_fname
-                        invoice.l10n_pe_edi_request_id.l10n_pe_edi_xml_generated = True
-
-                    if request['l10n_pe_cdr']:
-                        attachment_cdr = self.env['ir.attachment'].create({
-                            'name': request['l10n_pe_cdr_filename'],
-                            'res_id': invoice.l10n_pe_edi_request_id.id,
-                            'res_model': request['res_model'],
-                            'datas': request['l10n_pe_cdr'],
-                            'type': 'binary',
-                        })
-                        invoice.l10n_pe_edi_request_id.zip_location = attachment_cdr.store_fname
+        with self._get_remote_pool() as pool:
+            main_images = self._fetch_remote_binaries(remote_model, changed_ids, ['image_1920'], pool)
+            extra_images = self._fetch_remote_binaries(
+                'product.image', [item['image_id'] for item in changed_images], ['image_1920'], pool)
 
-            invoice.payment_state = 'paid'
-            invoice.amount_residual = 0.0
-            self.env.cr.commit()
+        for remote_id, image in main_images.items():
+            if image['image_1920']:
+                template_lookup[remote_id].image_1920 = image['image_1920']
+
+        list_template_images = []
+        for item in changed_images:
+            image = extra_images.get(item['image_id'])
+            if not image or not image['image_1920']:
+                continue
+            template = template_lookup[item['import_id']]
+            list_template_images.append({
+                'name': template.name,
+                'product_tmpl_id': template.id,
+                'image_1920': image['image_1920']
+            })
+        if list_template_images:
+            self.env['product.image'].create(list_template_images)
 
     def normalize(self, text):
         text = text or ''
@@ -14,9 +14,11 @@
         'stock',
         'sh_message',
         'invoice_report',
+        'arc_jsonrpc',
     ],
     'data': [
         'security/ir.model.access.csv',
+        'data/ir_cron.xml',
         'wizard/product_import_views.xml',
         'wizard/product_variant_import_views.xml',
         'views/product_views.xml',
@@ -2,3 +2,4 @@
 
 from . import product_product
 from . import product_template
+from . import product_report
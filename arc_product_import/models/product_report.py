@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import xlsxwriter
+
+from io import BytesIO
+
+from odoo import api, models
+
+import logging
+_logger = logging.getLogger(__name__)
+
+REPORT_CACHE_NAME = 'lista_productos.xlsx'
+# Hasta esta cantidad de productos el reporte vencido se regenera en la
+# descarga; con más, en segundo plano
+REPORT_SYNC_LIMIT = 2000
+
+
+class ProductReport(models.AbstractModel):
+    _name = "arc.product.report"
+    _description = "Lista de productos en Excel con cache por empresa"
+
+    def _get_domain(self, company):
+        return [
+            ('sale_ok', '=', True),
+            ('company_id', '=', company.id),
+            ('minicode', '!=', False),
+        ]
+
+    def _get_cache_key(self, company):
+        """Clave del contenido del reporte: cambia si se crea, borra o modifica
+        un producto, su plantilla o una categoría."""
+        domain = self._get_domain(company)
+        [(product_date, count)] = self.env['product.product'].sudo()._read_group(
+            domain, aggregates=['write_date:max', '__count'])
+        [(template_date,)] = self.env['product.template'].sudo()._read_group(
+            domain, aggregates=['write_date:max'])
+        [(category_date,)] = self.env['product.category'].sudo()._read_group(
+            [], aggregates=['write_date:max'])
+        key = '%s-%s-%s-%s-%s' % (company.id, count, product_date, template_date, category_date)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _get_cache_attachment(self, company):
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', 'res.company'),
+            ('res_id', '=', company.id),
+            ('name', '=', REPORT_CACHE_NAME),
+        ], order='id desc', limit=1)
+
+    def _get_report(self, company):
+        """(adjunto, vencido) con el último reporte de la empresa. Si los
+        productos cambiaron y son pocos (REPORT_SYNC_LIMIT) se regenera aquí;
+        si son más se programa la regeneración en segundo plano y mientras
+        tanto se sirve el anterior marcado como vencido."""
+        attachment = self._get_cache_attachment(company)
+        key = self._get_cache_key(company)
+        if attachment.description == key:
+            return attachment, False
+        count = self.env['product.product'].sudo().search_count(self._get_domain(company))
+        if not attachment or count <= REPORT_SYNC_LIMIT:
+            return self._save_report(company, key, attachment), False
+        self._trigger_refresh()
+        return attachment, True
+
+    def _refresh_report(self, company):
+        key = self._get_cache_key(company)
+        attachment = self._get_cache_attachment(company)
+        if attachment.description != key:
+            self._save_report(company, key, attachment)
+
+    @api.model
+    def _trigger_refresh(self):
+        cron = self.env.ref('arc_product_import.ir_cron_product_report', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    def _save_report(self, company, key, attachment):
+        products = self.env['product.product'].sudo().search(self._get_domain(company), order='minicode')
+        vals = {'raw': self.render_excel(products), 'description': key}
+        if attachment:
+            attachment.write(vals)
+        else:
+            attachment = attachment.create(dict(
+                vals, name=REPORT_CACHE_NAME, res_model='res.company', res_id=company.id,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'))
+        _logger.info('===== Lista de productos de %s regenerada (%s productos)' % (company.name, len(products)))
+        return attachment
+
+    @api.model
+    def _cron_refresh_reports(self):
+        """Regenera en segundo plano los reportes en cache cuyos productos
+        cambiaron, así la descarga siguiente sale del cache."""
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', 'res.company'),
+            ('name', '=', REPORT_CACHE_NAME),
+        ])
+        for company in self.env['res.company'].browse(set(attachments.mapped('res_id'))).exists():
+            self._refresh_report(company)
+            self.env.cr.commit()
+
+    def render_excel(self, products):
+        excel = BytesIO()
+        workbook = xlsxwriter.Workbook(excel)
+
+        format_header = workbook.add_format({
+            'bold': True,
+            'border': True,
+            'font_name': 'Calibri',
+            'font_size': 11,
+            'align': 'center',
+            'valign': 'vcenter',
+            #'bg_color': '#efa9db'
+        })
+        format_body = workbook.add_format({
+            'font_size': 11
+        })
+        format_number = workbook.add_format({
+            'num_format': '#,##0.00'
+        })
+
+        sheet = workbook.add_worksheet(u'Productos')
+
+        sheet.set_column('A:A', 75)
+        sheet.set_column('B:B', 20)
+        sheet.set_column('C:C', 30)
+        sheet.set_column('D:D', 30)
+        sheet.set_column('E:E', 12)
+        sheet.set_column('F:F', 15)
+        sheet.set_column('G:G', 15)
+        sheet.set_column('H:H', 15)
+        sheet.set_column('I:I', 70)
+        sheet.set_column('J:J', 20)
+        sheet.set_column('K:K', 20)
+        sheet.set_column('L:L', 15)
+        sheet.set_column('M:M', 20)
+        sheet.set_column('N:N', 12)
+        sheet.set_column('O:O', 15)
+        sheet.set_column('P:P', 15)
+        sheet.set_column('Q:Q', 15)
+        sheet.set_column('R:R', 15)
+
+        sheet.write_row(0, 0,
+                       (u'0 - Producto',
+                        u'1 - Cantidad',
+                        u'2 - Seguimiento con Serie',
+                        u'3 - Referencia Interna',
+                        u'4 - Costo',
+                        u'5 - Precio base',
+                        u'6 - Precio oferta',
+                        u'7 - Precio venta',
+                        u'8 - Descripción',
+                        u'9 - Categoria',
+                        u'10 - Subcategoria',
+                        u'11 - Tecnologia',
+                        u'12 - Marca',
+                        u'13 - Publico',
+                        u'14 - Modelo',
+                        u'15 - Minicodigo',
+                        u'16 - Garantia',
+                        u'17 - Disponibilidad',
+        ), format_header)
+
+        row = 0
+        
+        for rec in products:
+            column_number = 0
+            row += 1
+            sheet.write(row, column_number, rec.name, format_body)
+            column_number += 1
+            sheet.write(row, column_number, "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, "1" if rec.tracking == "serial" else "0", format_body)
+            column_number += 1
+            sheet.write(row, column_number, rec.default_code, format_number)
+            column_number += 1
+            sheet.write(row, column_number, rec.standard_price, format_number)
+            column_number += 1
+            sheet.write(row, column_number, rec.list_price, format_number)
+            column_number += 1
+            sheet.write(row, column_number, 0.00, format_number)
+            column_number += 1
+            sheet.write(row, column_number, 0.00, format_number)
+            column_number += 1
+            sheet.write(row, column_number, rec.description_sale or "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, rec.product_tmpl_id.categ_id.parent_id.name if rec.product_tmpl_id.categ_id.parent_id else "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, rec.product_tmpl_id.categ_id.name if rec.product_tmpl_id.categ_id else "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, rec.tecnology or "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, rec.model or "", format_body)
+            column_number += 1
+            sheet.write(row, column_number, rec.minicode, format_body)
+
+        workbook.close()
+        data = excel.getvalue()
+        excel.close()
+        return data
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import test_file_reader
+from . import test_product_import
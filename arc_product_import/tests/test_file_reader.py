@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+from openpyxl import Workbook
+
+from odoo.tests.common import BaseCase, tagged
+
+from ..wizard.file_reader import Column, compile_schema, iter_typed_rows, read_rows, to_flag
+
+COLUMNS = [
+    Column('name', 'Producto', required=True),
+    Column('minicode', 'Minicodigo', int),
+    Column('price', 'Precio', float, default=0.0),
+    Column('lot', 'Serie', normalizer=to_flag, default=False),
+]
+
+
+def make_xlsx(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    data = io.BytesIO()
+    workbook.save(data)
+    return data.getvalue()
+
+
+@tagged('post_install', '-at_install')
+class TestFileReader(BaseCase):
+
+    def test_csv_comma(self):
+        rows = list(read_rows('Producto,Precio\nMouse,10.5\n'.encode('utf-8')))
+        self.assertEqual(rows, [(1, ['Producto', 'Precio']), (2, ['Mouse', '10.5'])])
+
+    def test_csv_semicolon(self):
+        rows = list(read_rows('Producto;Precio\nMouse;10,5\n'.encode('utf-8')))
+        self.assertEqual(rows[1], (2, ['Mouse', '10,5']))
+
+    def test_tsv(self):
+        rows = list(read_rows('Producto\tPrecio\nMouse, inalámbrico\t10.5\n'.encode('utf-8')))
+        self.assertEqual(rows[1], (2, ['Mouse, inalámbrico', '10.5']))
+
+    def test_utf8(self):
+        rows = list(read_rows('Producto,Marca\nCañón,Épson\n'.encode('utf-8')))
+        self.assertEqual(rows[1][1], ['Cañón', 'Épson'])
+
+    def test_latin1(self):
+        rows = list(read_rows('Producto,Marca\nCañón,Épson\n'.encode('latin-1')))
+        self.assertEqual(rows[1][1], ['Cañón', 'Épson'])
+
+    def test_utf8_bom(self):
+        rows = list(read_rows('Producto,Marca\nCañón,Épson\n'.encode('utf-8-sig')))
+        self.assertEqual(rows[0][1], ['Producto', 'Marca'])
+
+    def test_csv_blank_rows_keep_line_numbers(self):
+        rows = list(read_rows(b'Producto,Precio\n\nMouse,10\n , \nTeclado,20\n'))
+        self.assertEqual([row_no for row_no, row in rows], [1, 3, 5])
+
+    def test_csv_short_rows_padded(self):
+        rows = list(read_rows(b'Producto,Precio,Marca\nMouse\n'))
+        self.assertEqual(rows[1], (2, ['Mouse', '', '']))
+
+    def test_xlsx(self):
+        data = make_xlsx([['Producto', 'Precio', 'Minicodigo'], ['Mouse', 10.5, 12]])
+        rows = list(read_rows(data))
+        self.assertEqual(rows, [(1, ('Producto', 'Precio', 'Minicodigo')), (2, ('Mouse', 10.5, 12))])
+
+
+@tagged('post_install', '-at_install')
+class TestSchema(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.convert = compile_schema(COLUMNS)
+
+    def test_typed_row(self):
+        row = self.convert(['Mouse', '12', '10,5', 'si'])
+        self.assertEqual(row, ('Mouse', 12, 10.5, True))
+
+    def test_int_from_float_text(self):
+        self.assertEqual(self.convert(['Mouse', '12.0', '', ''])[1], 12)
+        self.assertEqual(self.convert(['Mouse', 12.0, '', ''])[1], 12)
+
+    def test_int_rejected(self):
+        rows = list(iter_typed_rows([(1, ['h'] * 4), (2, ['Mouse', 'abc', '', ''])], COLUMNS))
+        self.assertEqual(rows, [(2, None, "Minicodigo 'abc' no es un entero válido.")])
+        rows = list(iter_typed_rows([(1, ['h'] * 4), (2, ['Mouse', '12.5', '', ''])], COLUMNS))
+        self.assertEqual(rows[0][2], "Minicodigo '12.5' no es un entero válido.")
+
+    def test_required_missing(self):
+        rows = list(iter_typed_rows([(1, ['h'] * 4), (2, ['  ', '12'])], COLUMNS))
+        self.assertEqual(rows, [(2, None, 'Producto esta vacio.')])
+
+    def test_defaults(self):
+        # Celdas vacías y columnas que faltan al final de la fila
+        self.assertEqual(self.convert(['Mouse', None]), ('Mouse', None, 0.0, False))
+
+    def test_lenient_flag(self):
+        for value, expected in [('1', True), ('1.0', True), ('X', True), ('Sí', True),
+                                ('0', False), ('no', False), ('abc', False)]:
+            self.assertEqual(self.convert(['Mouse', '', '', value]).lot, expected, value)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+import base64
+
+from odoo.tests.common import TransactionCase, tagged
+
+HEADER = [
+    'Producto', 'Código', 'Minicodigo', 'Serie', 'Costo', 'Precio', 'Descripción de venta', 'Categoria',
+    'Subcategoria', 'Tecnología', 'Marca', 'Publicar', 'Modelo', 'Garantía', 'Disponibilidad', 'Código de barra',
+]
+
+
+@tagged('post_install', '-at_install')
+class TestProductImport(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product = cls.env['product.product'].create({
+            'name': 'LAPTOP LENOVO',
+            'detailed_type': 'product',
+            'minicode': 1234,
+            'list_price': 100.0,
+        })
+
+    def _make_wizard(self, rows, **vals):
+        lines = [HEADER] + [row + [''] * (len(HEADER) - len(row)) for row in rows]
+        data = '\n'.join(','.join(line) for line in lines).encode('utf-8')
+        return self.env['wizard.product.import'].create(dict({
+            'file': base64.b64encode(data),
+            'import_option': 'csv',
+            'product_type': 'minicode',
+            'update': True,
+            'field_price': True,
+        }, **vals))
+
+    def test_update_by_minicode(self):
+        wizard = self._make_wizard([['LAPTOP LENOVO', '', '1234', '0', '80', '250']])
+        row_count, skipped, summary = wizard.sync_products()
+        self.assertEqual(row_count, 1)
+        self.assertFalse(skipped)
+        self.assertEqual(summary, {'created': 0, 'written': 1, 'unchanged': 0})
+        self.assertEqual(self.product.list_price, 250.0)
+
+    def test_update_by_minicode_unchanged(self):
+        wizard = self._make_wizard([['LAPTOP LENOVO', '', '1234', '0', '80', '100']])
+        row_count, skipped, summary = wizard.sync_products()
+        self.assertEqual(summary, {'created': 0, 'written': 0, 'unchanged': 1})
+        self.assertEqual(self.product.list_price, 100.0)
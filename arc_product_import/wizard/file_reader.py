@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+import codecs
+import collections
+import csv
+import datetime
+import io
+
+from openpyxl import load_workbook
+
+CSV_DELIMITERS = ',;\t|'
+SAMPLE_SIZE = 64 * 1024
+
+
+def is_xlsx(data):
+    """Los XLSX son archivos zip: empiezan con la firma PK."""
+    return data[:4] == b'PK\x03\x04'
+
+
+def detect_encoding(sample):
+    """BOM si existe; si no, UTF-8 cuando la muestra es válida y cp1252 (CSV
+    exportado desde Excel en Windows) en otro caso."""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # final=False: la muestra puede cortar un carácter multibyte al final
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def detect_delimiter(text):
+    try:
+        return csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return '\t' if '\t' in text.split('\n', 1)[0] else ','
+
+
+def read_csv(data):
+    """Lee un CSV/TSV fila por fila: (número de línea, lista de textos), ""
+    en celdas vacías y todas las filas con el ancho de la cabecera. Las filas
+    en blanco se omiten sin alterar la numeración."""
+    encoding = detect_encoding(data[:SAMPLE_SIZE])
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline='')
+    sample = stream.read(SAMPLE_SIZE)
+    stream.seek(0)
+    width = 0
+    reader = csv.reader(stream, delimiter=detect_delimiter(sample))
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        width = width or len(row)
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        yield reader.line_num, row
+
+
+def read_xlsx(data):
+    """(número de fila, valores) de la hoja activa, tal como los guarda
+    openpyxl (int, float, datetime, bool o texto); la conversión la hace el
+    esquema."""
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for row_no, row in enumerate(workbook.active.iter_rows(values_only=True), 1):
+            yield row_no, row
+    finally:
+        workbook.close()
+
+
+def read_rows(data):
+    """XLSX o CSV/TSV según la firma del archivo."""
+    if is_xlsx(data):
+        return read_xlsx(data)
+    return read_csv(data)
+
+
+class RowError(ValueError):
+    """Fila rechazada por el esquema antes de tocar el ORM."""
+
+
+class Column(object):
+    """Columna del archivo: campo, tipo (str, int, float o bool), si es
+    obligatoria, normalizador opcional sobre el valor ya convertido y
+    posición cuando las columnas no son consecutivas."""
+    __slots__ = ('name', 'label', 'type', 'required', 'normalizer', 'default', 'index')
+
+    def __init__(self, name, label=None, type=str, required=False, normalizer=None, default=None, index=None):
+        self.name = name
+        self.label = label or name
+        self.type = type
+        self.required = required
+        self.normalizer = normalizer
+        self.default = default
+        self.index = index
+
+
+def _number_text(value):
+    value = value.strip()
+    # Coma decimal de los CSV exportados con configuración regional es-PE
+    if ',' in value and '.' not in value:
+        value = value.replace(',', '.')
+    return value
+
+
+def to_str(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time(0, 0):
+            return value.strftime('%Y-%m-%d')
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d')
+    return str(value).strip()
+
+
+def to_int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, float):
+        value = float(_number_text(value))
+    if not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def to_float(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(_number_text(value))
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    value = value.strip().lower()
+    if value in ('1', 'true', 'si', 'sí', 'x', 'verdadero'):
+        return True
+    if value in ('0', 'false', 'no', 'falso'):
+        return False
+    raise ValueError(value)
+
+
+def to_flag(value):
+    """Sí/no permisivo para normalizadores: lo que no se reconoce como sí
+    (1, x, si, true...) cuenta como no, sin rechazar la fila."""
+    value = value.strip()
+    try:
+        return to_bool(float(_number_text(value)))
+    except ValueError:
+        pass
+    try:
+        return to_bool(value)
+    except ValueError:
+        return False
+
+
+CASTS = {str: to_str, int: to_int, float: to_float, bool: to_bool}
+TYPE_LABELS = {str: 'texto', int: 'entero', float: 'número', bool: 'sí/no'}
+
+
+def compile_schema(columns, name='Row'):
+    """Compila el esquema una vez por archivo. Devuelve una función que
+    convierte una fila cruda (valores de openpyxl o textos del CSV) en una
+    tupla con nombre ya tipada, o lanza RowError con el motivo."""
+    row_type = collections.namedtuple(name, [column.name for column in columns])
+    steps = [
+        (position if column.index is None else column.index, column, CASTS[column.type])
+        for position, column in enumerate(columns)
+    ]
+
+    def convert(row):
+        values = []
+        width = len(row)
+        for index, column, cast in steps:
+            value = row[index] if index < width else None
+            if value is None or (isinstance(value, str) and not value.strip()):
+                if column.required:
+                    raise RowError("%s esta vacio." % column.label)
+                values.append(column.default)
+                continue
+            try:
+                value = cast(value)
+            except (TypeError, ValueError):
+                raise RowError("%s '%s' no es un %s válido." % (
+                    column.label, value, TYPE_LABELS[column.type]))
+            if column.normalizer:
+                value = column.normalizer(value)
+            values.append(value)
+        return row_type._make(values)
+
+    return convert
+
+
+def iter_typed_rows(rows, columns, name='Row'):
+    """Recorre las filas de datos (la primera es la cabecera) con su número de
+    fila en el archivo; devuelve (número, fila tipada, None) o (número, None,
+    motivo)."""
+    convert = compile_schema(columns, name)
+    header = True
+    for row_no, row in rows:
+        if header:
+            header = False
+            continue
+        try:
+            yield row_no, convert(row), None
+        except RowError as e:
+            yield row_no, None, str(e)
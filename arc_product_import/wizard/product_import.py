@@ -1,17 +1,52 @@
 # -*- coding: utf-8 -*-
 
 import base64
-from io import BytesIO
-from datetime import datetime
-from openpyxl import load_workbook
 
-from odoo import models, fields, _
+from odoo import models, fields
 from odoo.exceptions import ValidationError
-from odoo.tools import ustr, DEFAULT_SERVER_DATE_FORMAT, DEFAULT_SERVER_DATETIME_FORMAT
+from odoo.tools import ustr
+
+from odoo.addons.arc_jsonrpc.models.json_rpc import is_changed
+
+from .file_reader import Column, iter_typed_rows, read_rows, to_flag
 
 import logging
 _logger = logging.getLogger(__name__)
 
+PRODUCT_COLUMNS = [
+    Column('product', 'Producto', normalizer=str.upper),
+    Column('default_code', 'Código'),
+    Column('minicode', 'Minicodigo', int, required=True),
+    # Serie es permisiva: 1, x, si... es con serie; cualquier otro valor, sin serie
+    Column('lot', 'Serie', normalizer=to_flag, default=False),
+    Column('standard_price', 'Costo', float),
+    Column('list_price', 'Precio', float),
+    Column('description_sale', 'Descripción de venta'),
+    Column('category', 'Categoria'),
+    Column('subcategory', 'Subcategoria'),
+    Column('tecnology', 'Tecnología'),
+    Column('brand', 'Marca'),
+    Column('public', 'Publicar'),
+    Column('model', 'Modelo'),
+    Column('warranty', 'Garantía'),
+    Column('availability', 'Disponibilidad'),
+    Column('barcode', 'Código de barra'),
+]
+
+# Opción del asistente -> campo del producto que actualiza
+UPDATE_FIELDS = [
+    ('field_category', 'categ_id'),
+    ('field_price', 'list_price'),
+    ('field_cost', 'standard_price'),
+    ('field_model', 'model'),
+    ('field_tecnology', 'tecnology'),
+    ('field_name', 'name'),
+    ('field_default_code', 'default_code'),
+    ('field_description_sale', 'description_sale'),
+    ('field_tracking', 'tracking'),
+    ('field_minicode', 'minicode'),
+]
+
 
 class ProductImport(models.TransientModel):
     _name = "wizard.product.import"
@@ -25,7 +60,7 @@ class ProductImport(models.TransientModel):
         ('barcode', 'Código de barra'),
         ('code', 'Código de producto'),
         ('minicode', 'Minicodigo')], string='Importar productos por', default='code')
-    import_option = fields.Selection([('xls', 'XLS')], string='Tipo de archivo', default='xls')
+    import_option = fields.Selection([('xls', 'XLS'), ('csv', 'CSV/TSV')], string='Tipo de archivo', default='xls')
     import_action = fields.Selection([
         ('sync', 'Sincronizar'),
         ('reportproduct', 'Lista de Productos')
@@ -43,8 +78,10 @@ class ProductImport(models.TransientModel):
     field_description_sale = fields.Boolean(string="Descripción de venta")
     field_tracking = fields.Boolean(string="Trazabilidad de series")
 
-    def show_success_msg(self, counter, skipped_line_no):
+    def show_success_msg(self, counter, skipped_line_no, summary=None):
         dic_msg = "%s Registros sincronizados con éxito" % counter
+        if summary:
+            dic_msg = dic_msg + "\nCreados: %(created)s, actualizados: %(written)s, sin cambios: %(unchanged)s" % summary
         if skipped_line_no:
             dic_msg = dic_msg + "\nDetalle:"
             for k, v in skipped_line_no.items():
@@ -74,10 +111,13 @@ class ProductImport(models.TransientModel):
                 raise ValidationError("Debe seleccionar al menos un campo para actualizar.")
 
         if self.import_action == 'sync':
-            counter, skipped_line_no = self.sync_products()
-            if counter > 1:
-                completed_records = (counter - len(skipped_line_no)) - 2
-                res = self.show_success_msg(completed_records, skipped_line_no)
+            row_count, skipped_line_no, summary = self.sync_products()
+            if summary['created'] or summary['written']:
+                # La lista de productos en cache se regenera en segundo plano
+                self.env['arc.product.report']._trigger_refresh()
+            if row_count:
+                completed_records = row_count - len(skipped_line_no)
+                res = self.show_success_msg(completed_records, skipped_line_no, summary)
                 return res
 
     def action_export(self):
@@ -89,51 +129,10 @@ class ProductImport(models.TransientModel):
                 'target': 'new'
             }
 
-    def read_xls(self):
-        decoded_file = base64.decodebytes(self.file)
-        excel_file = BytesIO(decoded_file)
-        workbook = load_workbook(excel_file)
-
-        sheet = workbook.active
-        values_sheet = []
-
-        for rowx, row in enumerate(sheet.iter_rows(values_only=False), 1):
-            values = []
-            for colx, cell in enumerate(row, 1):
-                if cell.value is None:
-                    values.append("")
-                elif cell.data_type == 'n':  # Número
-                    is_float = cell.value % 1 != 0.0 if cell.value is not None else False
-                    values.append(
-                        str(cell.value)
-                        if is_float
-                        else str(int(cell.value))
-                    )
-                elif cell.is_date:  # Fechas
-                    dt = cell.value
-                    if isinstance(dt, datetime.datetime):
-                        is_datetime = dt.time() != datetime.time(0, 0, 0)
-                        values.append(
-                            dt.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
-                            if is_datetime
-                            else dt.strftime(DEFAULT_SERVER_DATE_FORMAT)
-                        )
-                    else:
-                        values.append(str(cell.value))
-                elif cell.data_type == 'b':  # Booleano
-                    values.append(u'True' if cell.value else u'False')
-                elif cell.data_type == 'e':  # Error en la celda
-                    raise ValueError(
-                        _("Valor de celda no válido en la fila %(row)s, columna %(col)s: %(cell_value)s") % {
-                            'row': rowx,
-                            'col': colx,
-                            'cell_value': cell.value
-                        }
-                    )
-                else:  # Texto u otro tipo de datos
-                    values.append(cell.value if cell.value is not None else "")
-            values_sheet.append(values)
-        return values_sheet
+    def read_file(self):
+        """Filas crudas del archivo: XLSX con openpyxl, o CSV/TSV leído en
+        streaming con detección de separador y codificación."""
+        return read_rows(base64.decodebytes(self.file))
 
     def create_categ_id(self, name, public=False):
         if public:
@@ -168,59 +167,48 @@ class ProductImport(models.TransientModel):
                 return categ_id
 
     def create_product(self, values):
-        product_name = ""
-        if values.get('product') in (None, ""):
+        if not values.product:
             raise ValidationError("Se debe ingresar el nombre del producto en el archivo Excel.")
-        else:
-            product_name = values.get('product').strip().upper()
 
-        minicode = values.get('minicode')
+        minicode = values.minicode
         product_id = self.env['product.template'].search([('minicode', '=', minicode)])
         if not product_id:
             vals = {}
-            if values.get('category') not in (None, ""):
-                categ_id = self.create_categ_id(values.get('category').strip())
-                if values.get('subcategory').strip() not in (None, ""):
-                    subcateg_id = self.create_subcateg_id(values.get('subcategory').strip(), categ_id)
+            if values.category:
+                categ_id = self.create_categ_id(values.category)
+                if values.subcategory:
+                    subcateg_id = self.create_subcateg_id(values.subcategory, categ_id)
                     vals.update({
                         'categ_id': subcateg_id.id
                     })
             list_price = 0.0
-            if values.get('list_price') not in (None, ""):
-                list_price = values.get('list_price')
-                vals.update({
-                    'list_price': list_price
-                })
-            if values.get('standard_price') not in (None, ""):
+            if values.list_price is not None:
+                list_price = values.list_price
+            if values.standard_price is not None:
                 vals.update({
-                    'standard_price': values.get('standard_price'),
+                    'standard_price': values.standard_price,
                 })
-            if values.get('model') not in (None, ""):
+            if values.model:
                 vals.update({
-                    'model': values.get('model').strip(),
+                    'model': values.model,
                 })
-            if values.get('tecnology') not in (None, ""):
+            if values.tecnology:
                 vals.update({
-                    'tecnology': values.get('tecnology').strip(),
+                    'tecnology': values.tecnology,
                 })
-            if values.get('default_code') not in (None, ""):
+            if values.default_code:
                 vals.update({
-                    'default_code': values.get('default_code').strip().upper(),
+                    'default_code': values.default_code.upper(),
                 })
-            if values.get('description_sale') not in (None, ""):
+            if values.description_sale:
                 vals.update({
-                    'description_sale': values.get('description_sale').strip(),
+                    'description_sale': values.description_sale,
                 })
 
-            trazabilidad = 'none'
-            if values.get('lot') not in (None, ""):
-                if int(values.get('lot')) == 1:
-                    trazabilidad = 'serial'
-
             vals.update({
                 'detailed_type': 'product',
-                'name': product_name,
-                'tracking': trazabilidad,
+                'name': values.product,
+                'tracking': 'serial' if values.lot else 'none',
                 'minicode': minicode,
                 'list_price': list_price,
                 'company_id': self.company_id.id
@@ -229,139 +217,124 @@ class ProductImport(models.TransientModel):
             product_id = self.env['product.template'].create(vals)
             return product_id
 
+    def _get_update_fields(self):
+        """Campos del producto que el asistente puede escribir al actualizar."""
+        return [field for option, field in UPDATE_FIELDS if self[option]] + ['type']
+
     def update_product(self, values, product_id):
+        """Actualiza los campos seleccionados del producto. Solo se escriben los
+        que cambian y, si ninguno cambia, no se llama a write(); los valores
+        actuales vienen precargados por sync_products. Devuelve True si se
+        escribió."""
         vals = {}
 
         # Handle category updates
-        if self.field_category and self._is_valid_string(values.get('category')):
-            categ_id = self.create_categ_id(values.get('category'))
-
-            if self._is_valid_string(values.get('subcategory')):
-                subcateg_id = self.create_subcateg_id(
-                    values.get('subcategory').strip(),
-                    categ_id
-                )
+        if self.field_category and values.category:
+            categ_id = self.create_categ_id(values.category)
+
+            if values.subcategory:
+                subcateg_id = self.create_subcateg_id(values.subcategory, categ_id)
                 vals['categ_id'] = subcateg_id.id
 
         # Handle price updates
-        if (self.field_price and values.get('list_price') not in (None, "")):
-            vals['list_price'] = values.get('list_price')
+        if self.field_price and values.list_price is not None:
+            vals['list_price'] = values.list_price
 
         # Handle cost updates
-        if (self.field_cost and values.get('standard_price') not in (None, "")):
-            vals['standard_price'] = values.get('standard_price')
+        if self.field_cost and values.standard_price is not None:
+            vals['standard_price'] = values.standard_price
 
         # Handle model updates
-        if (self.field_model and self._is_valid_string(values.get('model'))):
-            vals['model'] = values.get('model').strip()
+        if self.field_model and values.model:
+            vals['model'] = values.model
 
         # Handle technology updates
         if self.field_tecnology:
-            vals['tecnology'] = values.get('tecnology')
+            vals['tecnology'] = values.tecnology or False
 
         # Handle name updates
-        if (self.field_name and self._is_valid_string(values.get('product'))):
-            vals['name'] = values.get('product').strip().upper()
+        if self.field_name and values.product:
+            vals['name'] = values.product
 
         # Handle default code updates
-        if (self.field_default_code and self._is_valid_string(values.get('default_code'))):
-            vals['default_code'] = values.get('default_code').strip().upper()
+        if self.field_default_code and values.default_code:
+            vals['default_code'] = values.default_code.upper()
 
         # Handle description sale updates
-        if (self.field_description_sale and self._is_valid_string(values.get('description_sale'))):
-            vals['description_sale'] = values.get('description_sale').strip()
+        if self.field_description_sale and values.description_sale:
+            vals['description_sale'] = values.description_sale
 
         # Handle tracking updates
         if self.field_tracking:
-            tracking_value = ('serial' if values.get('lot') not in (None, "") else 'none')
-            vals['tracking'] = tracking_value
+            vals['tracking'] = 'serial' if values.lot else 'none'
 
         # Handle minicode updates
-        if (self.field_minicode and values.get('minicode') not in (None, "", 0)):
-            vals['minicode'] = values.get('minicode')
+        if self.field_minicode and values.minicode:
+            vals['minicode'] = values.minicode
 
         # Set product type
         vals['type'] = 'product'
 
-        # Update product
-        product_id.write(vals)
-        return product_id
-
-    def _is_valid_string(self, value):
-        return value is not None and str(value).strip() != ""
+        # Update product, only the fields that change
+        vals = {field: value for field, value in vals.items() if is_changed(product_id, field, value)}
+        if vals:
+            product_id.write(vals)
+        return bool(vals)
 
     def sync_products(self):
         _logger.info("========== sync_products ==========")
         counter = 1
+        rows = []
         skipped_line_no = {}
-        if self.import_option == 'xls':
-            rows = self.read_xls()
-            values = {}
-            skip_header = True
+        summary = {'created': 0, 'written': 0, 'unchanged': 0}
+        if self.import_option in ('xls', 'csv'):
+            product_obj = self.env['product.product']
+            search_fields = {
+                'minicode': ('minicode', 'Minicodigo'),
+                'code': ('default_code', 'Código'),
+                'name': ('product', 'Nombre'),
+                'barcode': ('barcode', 'Código de barra'),
+            }
+            field_name, field_search = search_fields[self.product_type]
+            domain_field = 'name' if field_name == 'product' else field_name
 
             try:
-                for row in rows:
-                    if skip_header:
-                        skip_header = False
-                        counter += 1
+                # Las filas llegan tipadas; las que no cumplen el esquema se
+                # rechazan aquí, antes de cualquier búsqueda o escritura.
+                rows = list(iter_typed_rows(self.read_file(), PRODUCT_COLUMNS, 'ProductRow'))
+
+                # Productos del archivo en una sola búsqueda, con los valores
+                # actuales de los campos a actualizar precargados
+                search_values = {getattr(values, field_name) for row_no, values, error in rows if not error}
+                products = product_obj.search([(domain_field, 'in', [value for value in search_values if value])])
+                products.fetch(self._get_update_fields())
+                product_lookup = {}
+                for product in products:
+                    product_lookup.setdefault(product[domain_field], product)
+
+                for counter, values, error in rows:
+                    if error:
+                        skipped_line_no[str(counter)] = " - %s" % error
                         continue
 
-                    field_search = "minicode"
-                    field_search_value = ""
-
-                    if row[2] not in (None, ""):
-                        values = {
-                            'product': row[0],
-                            'default_code': row[1],
-                            'minicode': row[2],
-                            'lot': row[3],
-                            'standard_price': row[4],
-                            'list_price': row[5],
-                            'description_sale': row[6],
-                            'category': row[7],
-                            'subcategory': row[8],
-                            'tecnology': row[9],
-                            'brand': row[10],
-                            'public': row[11],
-                            'model': row[12],
-                            'warranty': row[13],
-                            'availability': row[14],
-                        }
-
-                        product_obj = self.env['product.product']
-                        field_search = ""
-                        if self.product_type == 'minicode':
-                            field_search = "Minicodigo"
-                            field_search_value = values.get('minicode')
-                            product_id = product_obj.search([('minicode', '=', values.get('minicode'))], limit=1)
-                            if not product_id:
-                                if values.get('name') not in (None, ""):
-                                    product_id = product_obj.search([('name', '=', values.get('name'))], limit=1)
-                                    if product_id:
-                                        product_id.write({'minicode': values.get('minicode')})
-                        elif self.product_type == 'code':
-                            field_search = "Código"
-                            field_search_value = values.get('default_code')
-                            product_id = product_obj.search([('default_code', '=', values.get('default_code'))], limit=1)
-                        elif self.product_type == 'name':
-                            field_search = "Nombre"
-                            field_search_value = values.get('name')
-                            product_id = product_obj.search([('name', '=', values.get('name'))], limit=1)
-                        elif self.product_type == 'barcode':
-                            field_search = "Código de barra"
-                            field_search_value = values.get('barcode')
-                            product_id = product_obj.search([('barcode', '=', values.get('barcode'))], limit=1)
-
+                    field_search_value = getattr(values, field_name)
+                    product_id = product_lookup.get(field_search_value, product_obj)
+                    if not product_id and self.product_type == 'minicode' and values.product:
+                        product_id = product_obj.search([('name', '=', values.product)], limit=1)
                         if product_id:
-                            self.update_product(values, product_id)
-                        else:
-                            self.create_product(values)
-                    else:
-                        skipped_line_no[str(counter)] = " - %s: %s del producto no encontrado" % (field_search, field_search_value)
+                            product_id.write({'minicode': values.minicode})
 
-                    counter += 1
+                    if product_id:
+                        summary['written' if self.update_product(values, product_id) else 'unchanged'] += 1
+                    else:
+                        template_id = self.create_product(values)
+                        if template_id:
+                            summary['created'] += 1
+                            if field_search_value:
+                                product_lookup[field_search_value] = template_id.product_variant_id
             except Exception as e:
                 skipped_line_no[str(counter)] = " - Error: %s" % ustr(e)
                 raise ValidationError("Lo sentimos, su archivo excel no coincide con el formato \n" + ustr(e))
 
-        return counter, skipped_line_no
+        _logger.info("===== Productos creados %(created)s, actualizados %(written)s, sin cambios %(unchanged)s" % summary)
+        return len(rows), skipped_line_no, summary
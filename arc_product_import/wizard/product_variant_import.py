@@ -1,17 +1,28 @@
 # -*- coding: utf-8 -*-
 
 import base64
-from io import BytesIO
-from datetime import datetime
-from openpyxl import load_workbook
 
 from odoo import models, fields, _
 from odoo.exceptions import ValidationError
-from odoo.tools import ustr, DEFAULT_SERVER_DATE_FORMAT, DEFAULT_SERVER_DATETIME_FORMAT
+from odoo.tools import ustr
+
+from .file_reader import Column, iter_typed_rows, read_rows
 
 import logging
 _logger = logging.getLogger(__name__)
 
+VARIANT_COLUMNS = [
+    Column('name', 'Descripción', required=True),
+    Column('id_articulo', 'Id artículo'),
+    Column('minicode', 'Minicodigo', int),
+    Column('default_code', 'Código'),
+    Column('list_price', 'Precio', float),
+    Column('standard_price', 'Costo', float),
+    Column('attributes', 'Atributos'),
+    Column('values', 'Valor de atributos'),
+    Column('barcode', 'Código de barra'),
+]
+
 
 class ProductVariantImport(models.TransientModel):
     _name = "wizard.product.variant.import"
@@ -39,272 +50,195 @@ class ProductVariantImport(models.TransientModel):
             "context": context,
         }
          
-    def read_xls(self):
-        decoded_file = base64.decodebytes(self.file)
-        excel_file = BytesIO(decoded_file)
-        workbook = load_workbook(excel_file)
-
-        sheet = workbook.active
-        values_sheet = []
+    def read_file(self):
+        """Filas crudas del archivo: XLSX con openpyxl, o CSV/TSV leído en
+        streaming con detección de separador y codificación."""
+        return read_rows(base64.decodebytes(self.file))
+
+    def _parse_variant_row(self, row):
+        """Atributos y valores de la fila (columnas 7 y 8). El precio opcional
+        'valor@precio' se descarta."""
+        attr_names = [attr.strip() for attr in row.attributes.split(',') if attr.strip() != '']
+        attr_values = []
+        for attr_value in row.values.split(','):
+            attr_value = attr_value.strip().split('@')[0]
+            if attr_value != '':
+                attr_values.append(attr_value)
+        return attr_names, attr_values
+
+    def _prepare_template_vals(self, row):
+        tmpl_vals = {
+            'name': row.name,
+            'sale_ok': True,
+            'purchase_ok': True,
+            'detailed_type': 'product',
+            'type': 'product',
+            'invoice_policy': 'order',
+            'company_id': self.env.company.id
+        }
 
-        for rowx, row in enumerate(sheet.iter_rows(values_only=False), 1):
-            values = []
-            for colx, cell in enumerate(row, 1):
-                if cell.value is None:
-                    values.append("")
-                elif cell.data_type == 'n':  # Número
-                    is_float = cell.value % 1 != 0.0 if cell.value is not None else False
-                    values.append(
-                        str(cell.value)
-                        if is_float
-                        else str(int(cell.value))
-                    )
-                elif cell.is_date:  # Fechas
-                    dt = cell.value
-                    if isinstance(dt, datetime.datetime):
-                        is_datetime = dt.time() != datetime.time(0, 0, 0)
-                        values.append(
-                            dt.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
-                            if is_datetime
-                            else dt.strftime(DEFAULT_SERVER_DATE_FORMAT)
-                        )
-                    else:
-                        values.append(str(cell.value))
-                elif cell.data_type == 'b':  # Booleano
-                    values.append(u'True' if cell.value else u'False')
-                elif cell.data_type == 'e':  # Error en la celda
-                    raise ValueError(
-                        _("Valor de celda no válido en la fila %(row)s, columna %(col)s: %(cell_value)s") % {
-                            'row': rowx,
-                            'col': colx,
-                            'cell_value': cell.value
-                        }
-                    )
-                else:  # Texto u otro tipo de datos
-                    values.append(cell.value if cell.value is not None else "")
-            values_sheet.append(values)
-        return values_sheet
+        for field in ('id_articulo', 'minicode', 'default_code', 'list_price', 'standard_price', 'barcode'):
+            if getattr(row, field) is not None:
+                tmpl_vals.update({field: getattr(row, field)})
+        return tmpl_vals
+
+    def _get_attribute_ids(self, names):
+        """Atributos por nombre con una búsqueda; crea los faltantes en un create."""
+        pro_attr_obj = self.env['product.attribute']
+        attribute_ids = {}
+        for item in pro_attr_obj.search_read([('name', 'in', list(names))], ['name']):
+            attribute_ids.setdefault(item['name'], item['id'])
+        missing = [name for name in names if name not in attribute_ids]
+        for attribute in pro_attr_obj.create([{'name': name} for name in missing]):
+            attribute_ids[attribute.name] = attribute.id
+        return attribute_ids
+
+    def _get_attribute_value_ids(self, pairs):
+        """Valores por (atributo, nombre) con una búsqueda; crea los faltantes en
+        un create."""
+        pro_attr_value_obj = self.env['product.attribute.value']
+        value_ids = {}
+        for item in pro_attr_value_obj.search_read([
+            ('name', 'in', list({name for attribute_id, name in pairs})),
+            ('attribute_id', 'in', list({attribute_id for attribute_id, name in pairs}))
+        ], ['name', 'attribute_id']):
+            value_ids.setdefault((item['attribute_id'][0], item['name']), item['id'])
+        missing = [pair for pair in pairs if pair not in value_ids]
+        for value in pro_attr_value_obj.create([
+            {'name': name, 'attribute_id': attribute_id} for attribute_id, name in missing
+        ]):
+            value_ids[(value.attribute_id.id, value.name)] = value.id
+        return value_ids
 
     def action_import(self):
         product_tmpl_obj = self.env['product.template']
+        pro_attr_line_obj = self.env['product.template.attribute.line'].with_context(
+            create_product_product=False)
 
         if self and self.file:
-            counter = 1
             skipped_line_no = {}
 
             try:
-                values = self.read_xls()
-                skip_header = True
-                running_tmpl = None
-                created_product_tmpl = False
-                has_variant = False
-
-                for row in values:
+                row_count = 0
+
+                # Etapa 1: agrupar las filas por plantilla, sin importar el orden;
+                # las filas que no cumplen el esquema se rechazan aquí
+                templates = {}
+                for row_no, row, error in iter_typed_rows(self.read_file(), VARIANT_COLUMNS, 'VariantRow'):
+                    row_count += 1
+                    if error:
+                        skipped_line_no[str(row_no)] = " - %s " % error
+                        continue
+                    has_variant = bool(row.attributes and row.values)
+                    group = templates.setdefault(row.name, {
+                        'row': row,
+                        # La primera fila de la plantilla define si tiene variantes
+                        'has_variant': has_variant,
+                        'rows': [],
+                    })
+                    if not group['has_variant'] or not has_variant:
+                        group['rows'].append((row_no, row, [], []))
+                        continue
+                    attr_names, attr_values = self._parse_variant_row(row)
+                    if len(attr_names) != len(attr_values):
+                        skipped_line_no[str(row_no)] = " - Número de atributos y su valor no es igual. "
+                        continue
+                    group['rows'].append((row_no, row, attr_names, attr_values))
+
+                # Etapa 2: atributos y valores de todo el archivo
+                attribute_ids = self._get_attribute_ids(list(dict.fromkeys(
+                    name for group in templates.values() for item in group['rows'] for name in item[2])))
+                value_ids = self._get_attribute_value_ids(list(dict.fromkeys(
+                    (attribute_ids[name], value)
+                    for group in templates.values() for item in group['rows']
+                    for name, value in zip(item[2], item[3]))))
+
+                # Etapa 3: plantillas existentes en una búsqueda, nuevas en un create
+                existing = {}
+                for template in product_tmpl_obj.search([('name', 'in', list(templates))]):
+                    existing.setdefault(template.name, template)
+                new_names = [name for name in templates if name not in existing]
+                for name, template in zip(new_names, product_tmpl_obj.create([
+                    self._prepare_template_vals(templates[name]['row']) for name in new_names
+                ])):
+                    templates[name]['template'] = template
+                for name, template in existing.items():
+                    template.write(self._prepare_template_vals(templates[name]['row']))
+                    templates[name]['template'] = template
+
+                # Etapa 4: matriz de atributos por plantilla, un _create_variant_ids por plantilla
+                variant_templates = product_tmpl_obj.browse([
+                    group['template'].id for group in templates.values() if group['has_variant']
+                ])
+                attr_lines = {
+                    (line.product_tmpl_id.id, line.attribute_id.id): line
+                    for line in pro_attr_line_obj.search([('product_tmpl_id', 'in', variant_templates.ids)])
+                }
+                list_attr_lines = []
+                for group in templates.values():
+                    template = group['template']
+                    matrix = {}
+                    for row_no, row, attr_names, attr_values in group['rows']:
+                        for name, value in zip(attr_names, attr_values):
+                            matrix.setdefault(attribute_ids[name], set()).add(
+                                value_ids[(attribute_ids[name], value)])
+                    for attribute_id, attr_value_ids in matrix.items():
+                        line = attr_lines.get((template.id, attribute_id))
+                        if not line:
+                            list_attr_lines.append({
+                                'attribute_id': attribute_id,
+                                'value_ids': [(6, 0, list(attr_value_ids))],
+                                'product_tmpl_id': template.id,
+                            })
+                        elif not attr_value_ids <= set(line.value_ids.ids):
+                            line.write({'value_ids': [(6, 0, list(attr_value_ids | set(line.value_ids.ids)))]})
+                pro_attr_line_obj.create(list_attr_lines)
+
+                for group in templates.values():
+                    if not group['has_variant']:
+                        continue
                     try:
-                        if skip_header:
-                            skip_header = False
-                            counter = counter + 1
+                        group['template']._create_variant_ids()
+                    except Exception as e:
+                        for row_no, row, attr_names, attr_values in group['rows']:
+                            skipped_line_no[str(row_no)] = " - Valor no es valido. " + ustr(e)
+                        group['rows'] = []
+
+                # Etapa 5: variantes asignadas a cada fila en memoria
+                for group in templates.values():
+                    variants = [
+                        (set(variant.product_template_attribute_value_ids.product_attribute_value_id.ids), variant)
+                        for variant in group['template'].product_variant_ids
+                    ]
+                    for row_no, row, attr_names, attr_values in group['rows']:
+                        if not attr_names:
                             continue
+                        try:
+                            row_value_ids = {
+                                value_ids[(attribute_ids[name], value)]
+                                for name, value in zip(attr_names, attr_values)
+                            }
+                            product_varient = next(
+                                (variant for variant_value_ids, variant in variants
+                                 if row_value_ids <= variant_value_ids), False)
+                            if not product_varient:
+                                skipped_line_no[str(row_no)] = " - Variantes de producto no encontradas."
+                                continue
+
+                            var_vals = {
+                                field: getattr(row, field)
+                                for field in ('id_articulo', 'minicode', 'default_code')
+                                if getattr(row, field) is not None
+                            }
+
+                            product_varient.write(var_vals)
+                        except Exception as e:
+                            skipped_line_no[str(row_no)] = " - Valor no es valido. " + ustr(e)
 
-                        if row[0] not in (None, ""):
-                            var_vals = {}
-                            
-                            # Product Template Start
-                            if row[0] != running_tmpl:
-                                running_tmpl = row[0]
-                                
-                                tmpl_vals = {
-                                    'name': row[0],
-                                    'sale_ok': True,
-                                    'purchase_ok': True,
-                                    'detailed_type': 'product',
-                                    'type': 'product',
-                                    'invoice_policy': 'order',
-                                    'company_id': self.env.company.id
-                                }
-                                
-                                if row[1] not in (None, ""):
-                                    tmpl_vals.update({'id_articulo': row[1]})
-                                
-                                if row[2] not in (None, ""):
-                                    tmpl_vals.update({'minicode': row[2]})
-                                
-                                if row[3] not in (None, ""):
-                                    tmpl_vals.update({'default_code': str(row[3])})
-
-                                if row[4] not in (None, ""):
-                                    tmpl_vals.update({'list_price': row[4]})
-                                
-                                if row[5] not in (None, ""):
-                                    tmpl_vals.update({'standard_price': row[5]})
-                                
-                                if row[6].strip() in (None, "") or row[7].strip() in (None, ""):
-                                    has_variant = False
-                                else:
-                                    has_variant = True
-                                
-                                if row[8] not in (None, ""):
-                                    tmpl_vals.update({'barcode': row[8]})
-                            
-                                # ===================================================================
-                                # Step 1: Create Product Template
-                                search_product = product_tmpl_obj.search([('name', '=', running_tmpl)], limit=1)
-                                if search_product:
-                                    # Write product Template Field.
-                                    search_product.write(tmpl_vals)
-                                    created_product_tmpl = search_product
-                                else:
-                                    created_product_tmpl = product_tmpl_obj.create(tmpl_vals)
-                            
-                            # Variant Values
-                            if created_product_tmpl and has_variant:
-                                # Product Variants
-                                pro_attr_line_obj = self.env['product.template.attribute.line']
-                                pro_attr_value_obj = self.env['product.attribute.value']
-                                pro_attr_obj = self.env['product.attribute']
-                                
-                                if row[6].strip() not in (None, "") and row[7].strip() not in (None, ""):
-                                    attr_ids_list = []
-                                    for attr in row[6].split(','):
-                                        attr = attr.strip()
-                                        if attr != '':
-                                            search_attr_name = False
-                                            search_attr_name = pro_attr_obj.search([('name', '=', attr)], limit=1)
-                                            if not search_attr_name:
-                                                search_attr_name = pro_attr_obj.create({'name': attr})
-                                            attr_ids_list.append(search_attr_name.id)
-                                    
-                                    attr_value_list = []
-                                    attr_value_price_dic = {}
-                                    for attr_value in row[7].split(','):
-                                        attr_value = attr_value.strip()
-                                        splited_attr_value_price_list = []
-                                    
-                                        # Product Attribute Price
-                                        if '@' in attr_value:
-                                            splited_attr_value_price_list = attr_value.split('@')
-                                            attr_value_price_dic.update({
-                                                splited_attr_value_price_list[0]: splited_attr_value_price_list[1]
-                                            })
-                                        else:
-                                            splited_attr_value_price_list = [attr_value]
-
-                                        if splited_attr_value_price_list[0] != '':
-                                            attr_value_list.append(splited_attr_value_price_list[0])
-                                                                            
-                                    attr_value_ids_list = []
-                                    if len(attr_ids_list) == len(attr_value_list):
-                                        i = 0
-                                        while i < len(attr_ids_list):
-                                            search_attr_value = False
-                                            search_attr_value = pro_attr_value_obj.search([
-                                                ('name', '=', attr_value_list[i]),
-                                                ('attribute_id', '=', attr_ids_list[i])
-                                            ], limit=1)
-                                                                                        
-                                            if not search_attr_value:
-                                                search_attr_value = pro_attr_value_obj.create({
-                                                    'name' : attr_value_list[i],
-                                                    'attribute_id' : attr_ids_list[i]
-                                                })
-                                            
-                                            attr_value_ids_list.append(search_attr_value.id)
-                                            i += 1
-                                    else:
-                                        skipped_line_no[str(counter)] = " - Número de atributos y su valor no es igual. "
-                                        counter = counter + 1
-                                        continue
-
-                                    if attr_value_ids_list and attr_ids_list:
-                                        i = 0
-                                        while i < len(attr_ids_list):
-                                            search_attr_line = pro_attr_line_obj.search([
-                                                ('attribute_id', '=', attr_ids_list[i]),
-                                                ('product_tmpl_id', '=', created_product_tmpl.id)
-                                            ], limit=1)
-
-                                            if search_attr_line:
-                                                past_values_list = []
-                                                past_values_list = search_attr_line.value_ids.ids
-                                                past_values_list.append(attr_value_ids_list[i])
-                                                search_attr_line.write({'value_ids': [(6, 0, past_values_list)]})
-                                            else:
-                                                pro_attr_line_obj.create({
-                                                    'attribute_id' : attr_ids_list[i],
-                                                    'value_ids': [(6, 0, [attr_value_ids_list[i]])],
-                                                    'product_tmpl_id' : created_product_tmpl.id,
-                                                })
-                                            i += 1
-                                    
-                                    created_product_tmpl._create_variant_ids()
-                                    
-                                    if created_product_tmpl.product_variant_ids:
-                                        product_var_obj = self.env['product.product']
-                                        domain = []
-                                        domain.append(('product_tmpl_id', '=', created_product_tmpl.id))
-                                        
-                                        for attr_value_id in attr_value_ids_list:
-                                            domain.append(
-                                                ('product_template_attribute_value_ids.product_attribute_value_id.id', '=', attr_value_id)
-                                            )
-                                        
-                                        product_varient = product_var_obj.search(domain, limit=1)
-                                        
-                                        if not product_varient:
-                                            if attr_value_ids_list and attr_ids_list:
-                                                i = 0
-                                                while i < len(attr_ids_list):
-                                                    search_attr_line = pro_attr_line_obj.search([
-                                                        ('attribute_id', '=', attr_ids_list[i]),
-                                                        ('product_tmpl_id', '=', created_product_tmpl.id),
-                                                    ], limit=1)
-                                                    if search_attr_line:
-                                                        past_values_list = []
-                                                        past_values_list = search_attr_line.value_ids.ids
-                                                        past_values_list.append(attr_value_ids_list[i])
-                                                        search_attr_line.write({
-                                                            'value_ids': [(6, 0, past_values_list)]
-                                                        })
-                                                    else:
-                                                        pro_attr_line_obj.create({
-                                                            'attribute_id' : attr_ids_list[i],
-                                                            'value_ids': [(6, 0, [attr_value_ids_list[i]])],
-                                                            'product_tmpl_id' : created_product_tmpl.id,
-                                                        })
-                                                    i += 1
-                                            created_product_tmpl._create_variant_ids()
-                                            product_varient = product_var_obj.search(domain, limit=1)
-
-                                        if not product_varient:
-                                            skipped_line_no[str(counter)] = " - Variantes de producto no encontradas."
-                                            counter = counter + 1
-                                            continue
-                                        
-                                        if row[1] not in (None, ""):
-                                            var_vals.update({'id_articulo': row[1]})
-                                        
-                                        if row[2] not in (None, ""):
-                                            var_vals.update({'minicode': row[2]})
-
-                                        if row[3] not in (None, ""):
-                                            var_vals.update({'default_code': str(row[3])})
-
-                                        product_varient.write(var_vals)
-
-                            counter = counter + 1
-                        else:
-                            skipped_line_no[str(counter)] = " - Descripción esta vacio. "
-                            counter = counter + 1
-
-                    except Exception as e:
-                        skipped_line_no[str(counter)] = " - Valor no es valido. " + ustr(e)
-                        counter = counter + 1
-                        continue
-                        
             except Exception as e:
                 raise ValidationError(_("Lo sentimos, el excel no coincide con el formato \n" + ustr(e)))
 
-            if counter > 1:
-                completed_records = (counter - len(skipped_line_no)) - 2
+            if row_count:
+                completed_records = row_count - len(skipped_line_no)
                 res = self.show_success_msg(completed_records, skipped_line_no)
                 return res